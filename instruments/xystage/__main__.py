@@ -0,0 +1,5 @@
+import sys
+
+from instruments.xystage.runner import main
+
+sys.exit(main())
@@ -0,0 +1,90 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from instruments.xystage.stepper_util import Stepper
+
+
+class AsyncStepper:
+    def __init__(self, stepper=None):
+        """
+        asyncio front end to a Stepper.
+        Every call returns an awaitable that completes when the Arduino acknowledges the command.
+        Serial traffic runs on one dedicated worker thread, so commands reach the Arduino
+        in the order they were awaited and the event loop is never blocked.
+        Examples:
+        stage = AsyncStepper()
+        await stage.gohome()
+        await stage.moveto(3, 4)
+        move = asyncio.create_task(stage.moveto(10, 20))
+        ... # compute while the stage moves
+        await move
+        await stage.moveto(5, 5, timeout=10) # raises asyncio.TimeoutError after 10 s
+        async for i, x, y in stage.move_through([(1, 2), (3, 4)]): # streams moves back to back
+            print(i, x, y)
+        async for i, x, y, fired in stage.move_through([(1, 2), (3, 4)], trigger=True): # pulses OPTO at each point
+            print(i, x, y, fired)
+
+        Cancelling a move that has not been sent yet drops it. Cancelling a move that is
+        already running returns control immediately; the stage still finishes that move
+        and the position is updated once its acknowledgement arrives.
+        """
+        self.stepper = stepper if stepper is not None else Stepper()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stepper')
+
+    @property
+    def current_x(self):
+        return self.stepper.current_x
+
+    @property
+    def current_y(self):
+        return self.stepper.current_y
+
+    async def _run(self, func, *args, timeout=None):
+        """ Run a blocking Stepper call on the serial thread and await it """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, func, *args)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.CancelledError:
+            logging.info(f'{func.__name__} cancelled')
+            raise
+
+    async def gohome(self, timeout=None):
+        """ Home the stage """
+        await self._run(self.stepper.gohome, timeout=timeout)
+
+    async def verify_position(self, timeout=None):
+        """ True if the firmware agrees with the tracked position """
+        return await self._run(self.stepper.verify_position, timeout=timeout)
+
+    async def moveto(self, x_pos, y_pos, interpolate=None, timeout=None):
+        """
+        Move to x_pos, y_pos and return the position reached.
+        """
+        await self._run(self.stepper.moveto, x_pos, y_pos, interpolate, timeout=timeout)
+        return self.stepper.current_x, self.stepper.current_y
+
+    async def move_through(self, points, interpolate=None, trigger=False):
+        """
+        Async iterator over Stepper.move_through, yielding (index, x, y) as each move is acknowledged,
+        or (index, x, y, time OPTO fired) with trigger=True.
+        Leaving the loop early stops sending new moves; moves already queued on the Arduino still run,
+        and closing the iterator waits for them to be acknowledged.
+        """
+        moves = self.stepper.move_through(points, interpolate, trigger)
+        try:
+            while True:
+                result = await self._run(next, moves, None)
+                if result is None:
+                    return
+                yield result
+        finally:
+            # Runs after any step still in progress on the serial thread, and is awaited so the
+            # serial thread is idle once the loop has been left, even when it was cancelled
+            await asyncio.shield(self._run(moves.close))
+
+    async def disconnect(self):
+        """ Wait for queued commands, then disconnect from the Arduino """
+        await self._run(self.stepper.disconnect)
+        self._executor.shutdown(wait=False)
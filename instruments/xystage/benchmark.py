@@ -0,0 +1,201 @@
+"""
+Motion benchmarks for Stepper, run against the SimulatedArduino so no hardware is needed.
+
+    python -m instruments.xystage.benchmark
+    python -m instruments.xystage.benchmark --points 10 100 1000 10000 --time-scale 0.01
+    python -m instruments.xystage.benchmark --startup
+    python -m instruments.xystage.benchmark --metrics moves.json
+
+Reports per-command latency and where it goes (Stepper.metrics phases), moves per second
+(one round trip per move and streamed),
+host CPU use while waiting on moves, homing time, and end-to-end scan duration for random point sets.
+Scans run time_scale times real time; their durations are reported scaled back to real time.
+--startup instead launches the XY window in fresh processes and reports how long it takes to open.
+--metrics writes the phase timings of the latency run as JSON (summary and histograms) or,
+for a .csv path, one row per move.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, process_time
+
+import numpy as np
+
+from instruments.xystage.move_metrics import PHASES
+from instruments.xystage.stepper_util import Stepper
+from instruments.xystage.scan_path import plan_scan_path
+
+
+def _homed_stepper(time_scale=1.0):
+    stepper = Stepper(simulate=True, time_scale=time_scale)
+    # Save the position to a file as with a real stage, so the cost is measured
+    stepper._position_path = os.path.join(tempfile.gettempdir(), 'xystage_benchmark_position.json')
+    stepper.gohome()
+    return stepper
+
+
+def bench_latency(repeats=200, metrics_path=None):
+    """
+    Round trip of a zero-length move: host formatting, serial transfer, parsing and acknowledgement.
+    Also returns the median of each phase Stepper.metrics records, and writes the metrics to
+    metrics_path if given.
+    """
+    stepper = _homed_stepper()
+    stepper.metrics.reset()
+    times = np.empty(repeats)
+    for i in range(repeats):
+        t0 = perf_counter()
+        stepper.moveto(0, 0)
+        times[i] = perf_counter() - t0
+
+    if metrics_path is not None:
+        stepper.metrics.save(metrics_path)
+
+    summary = stepper.metrics.summary()
+    return {
+        'mean_ms': 1e3 * times.mean(),
+        'median_ms': 1e3 * np.median(times),
+        'p95_ms': 1e3 * np.percentile(times, 95),
+        'phases_ms': {phase: summary[phase]['p50_ms'] for phase in PHASES},
+    }
+
+
+def bench_moves_per_second(n=500, step_mm=0.05):
+    """ Short back-and-forth moves, sent one at a time with moveto and streamed with move_through """
+    points = [(step_mm * (i % 2), 0.0) for i in range(1, n + 1)]
+
+    stepper = _homed_stepper()
+    t0 = perf_counter()
+    for x, y in points:
+        stepper.moveto(x, y)
+    single = n / (perf_counter() - t0)
+
+    stepper = _homed_stepper()
+    t0 = perf_counter()
+    for _ in stepper.move_through(points):
+        pass
+    streamed = n / (perf_counter() - t0)
+
+    return {'moveto_per_s': single, 'move_through_per_s': streamed}
+
+
+def bench_cpu(n=10, distance_mm=20.0):
+    """ Host CPU time as a fraction of wall time while waiting on long moves """
+    stepper = _homed_stepper()
+    wall0, cpu0 = perf_counter(), process_time()
+    for i in range(n):
+        stepper.moveto(distance_mm * ((i + 1) % 2), 0)
+    wall, cpu = perf_counter() - wall0, process_time() - cpu0
+    return {'cpu_percent': 100 * cpu / wall, 'wall_s': wall}
+
+
+def bench_home(time_scale=0.01):
+    """
+    Homing from the corner farthest from the limit switches, scaled back to real time.
+    Returns the measured time and the sequential single-speed homing it replaced.
+    """
+    stepper = _homed_stepper(time_scale)
+    limits = stepper._constants['coordinates']
+    stepper.moveto(limits['x_max'], limits['y_max'])
+    stepper.gohome()
+    return {
+        'home_s': stepper.home_time / time_scale,
+        'sequential_s': (limits['x_max'] - limits['x_min'] + limits['y_max'] - limits['y_min']) * stepper.seconds_per_mm,
+    }
+
+
+def bench_scan(n_points, time_scale=0.01, seed=0):
+    """
+    What take_scans does for n_points random points: plan the path, then stream the moves.
+    Returns planning time and the real-time equivalent of the scan duration.
+    """
+    stepper = _homed_stepper(time_scale)
+    limits = stepper._constants['coordinates']
+    rng = np.random.default_rng(seed)
+    points = np.column_stack([
+        rng.uniform(limits['x_min'], limits['x_max'], n_points),
+        rng.uniform(limits['y_min'], limits['y_max'], n_points),
+    ])
+
+    t0 = perf_counter()
+    order, original_time, planned_time = plan_scan_path(
+        points, (stepper.current_x, stepper.current_y), interpolate=stepper.interpolate, axis_time=stepper.axis_time
+    )
+    plan_s = perf_counter() - t0
+
+    t0 = perf_counter()
+    for _ in stepper.move_through(points[order]):
+        pass
+    wall = perf_counter() - t0
+
+    # Motion ran time_scale times real time; host overhead did not
+    overhead = max(wall - planned_time * time_scale, 0.0)
+    return {
+        'points': n_points,
+        'plan_s': plan_s,
+        'motion_s': planned_time,
+        'unplanned_motion_s': original_time,
+        'scan_s': planned_time + overhead,
+        'overhead_s': overhead,
+    }
+
+
+def bench_startup(repeats=5):
+    """
+    Launch XY_UI offscreen in a fresh process and time it to a usable window
+    and to a finished Arduino connection attempt. Returns the median of each in seconds.
+    """
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    code = ('import json; from instruments.xystage.xystage import XY_UI; '
+            'print(json.dumps(XY_UI(exit_after_startup=True)))')
+    runs = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--time-scale', type=float, default=0.01)
+    parser.add_argument('--startup', action='store_true', help='time application startup instead of motion')
+    parser.add_argument('--metrics', help='write the latency run\'s phase timings to this .json or .csv file')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        startup = bench_startup()
+        print(f"Startup: imports {startup['imports']:0.3f} s, window ready {startup['window']:0.3f} s, "
+              f"Arduino connection attempt finished {startup['connected']:0.3f} s")
+        return
+
+    # Keep per-move log lines out of XYpy.log
+    logging.basicConfig(level=logging.WARNING)
+
+    latency = bench_latency(metrics_path=args.metrics)
+    print(f"Command latency: mean {latency['mean_ms']:0.2f} ms, median {latency['median_ms']:0.2f} ms, "
+          f"p95 {latency['p95_ms']:0.2f} ms")
+    print('Median phases: ' + ', '.join(f'{phase} {ms:0.3f} ms' for phase, ms in latency['phases_ms'].items()))
+
+    rate = bench_moves_per_second()
+    print(f"Short moves: {rate['moveto_per_s']:0.1f}/s with moveto, {rate['move_through_per_s']:0.1f}/s streamed")
+
+    cpu = bench_cpu()
+    print(f"Host CPU while moving: {cpu['cpu_percent']:0.1f}% over {cpu['wall_s']:0.2f} s")
+
+    home = bench_home(args.time_scale)
+    print(f"Homing from the far corner: {home['home_s']:0.2f} s (sequential at constant speed: {home['sequential_s']:0.2f} s)")
+
+    print(f"{'points':>8} {'plan s':>9} {'motion s':>10} {'unplanned s':>12} {'scan s':>10} {'overhead s':>11}")
+    for n in args.points:
+        r = bench_scan(n, args.time_scale)
+        print(f"{r['points']:>8} {r['plan_s']:>9.3f} {r['motion_s']:>10.1f} {r['unplanned_motion_s']:>12.1f} "
+              f"{r['scan_s']:>10.1f} {r['overhead_s']:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+import atexit
+import logging
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+
+import yaml
+
+# Directory of the xystage package
+XY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CONSTANTS_PATH = os.path.join(XY_DIR, 'hardware_constants.yaml')
+LOG_PATH = os.path.join(XY_DIR, 'XYpy.log')
+
+_log_listener = None
+
+
+@lru_cache(maxsize=None)
+def load_constants():
+    """
+    Load hardware_constants.yaml once per process.
+    XY and Stepper share the returned dictionary, so treat it as read-only.
+    """
+    with open(CONSTANTS_PATH, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def configure_logging(path=LOG_PATH):
+    """
+    Send log records to path, XYpy.log by default. Only the first call in a process has any
+    effect, and none if logging has already been configured elsewhere.
+    Records are handed to a queue and written by a background thread, so logging never
+    waits on the disk. The log rotates as set in the logging section of hardware_constants.yaml.
+    """
+    global _log_listener
+    root = logging.getLogger()
+    if _log_listener is not None or root.handlers:
+        return
+
+    settings = load_constants()['logging']
+    handler = RotatingFileHandler(path, maxBytes=settings['max_kb'] * 1024, backupCount=settings['backups'])
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'))
+
+    queue = SimpleQueue()
+    root.addHandler(QueueHandler(queue))
+    root.setLevel(logging.INFO)
+    _log_listener = QueueListener(queue, handler)
+    _log_listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(_log_listener.stop)
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+import logging
+import math
+
+import numpy as np
+from PyQt5.QtCore import QRect, QRectF, QSize, Qt
+from PyQt5.QtGui import QImage, QImageIOHandler, QImageReader, QPainter, QPixmap
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+
+class TiledImageItem(QGraphicsItem):
+    """
+    Graphics item that shows a large image file without ever decoding all of it at full size.
+    The image is split into a pyramid of levels, level L being the image downsampled by 2**L,
+    and each level into tile_size x tile_size tiles. paint() picks the level that matches the
+    current zoom and decodes only the rows of tiles it has to draw, keeping recently drawn tiles
+    in an LRU cache of up to cache_mb megabytes.
+    Formats whose reader can decode a region at reduced size (e.g. JPEG) are read a row of tiles at a time;
+    other formats are decoded once at full size and tiles are cut from that.
+    The item spans the full-resolution size, so scene coordinates stay in image pixels.
+    Examples:
+    item = TiledImageItem('sample.jpg')
+    scene.addItem(item)
+    """
+    def __init__(self, filename, tile_size=512, cache_mb=64, parent=None):
+        super(TiledImageItem, self).__init__(parent)
+        self.filename = filename
+        self.tile_size = tile_size
+        self._cache_bytes = cache_mb * 2 ** 20
+
+        reader = QImageReader(filename)
+        self.size = reader.size()
+        if not self.size.isValid():
+            raise ValueError(f'Could not read image {filename}: {reader.errorString()}')
+        self._regions = (reader.supportsOption(QImageIOHandler.ClipRect)
+                         and reader.supportsOption(QImageIOHandler.ScaledSize))
+        self._source = None  # full-size image, only for formats that cannot decode regions
+
+        # The coarsest level fits in a single tile
+        self.levels = 0
+        while max(self.size.width(), self.size.height()) >> self.levels > tile_size:
+            self.levels += 1
+
+        self._tiles = OrderedDict()  # (level, tx, ty) -> QPixmap, least recently drawn first
+        self._tile_bytes = 0
+
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.size.width(), self.size.height())
+
+    def level_for_scale(self, scale):
+        """ Pyramid level to draw at scale device pixels per image pixel """
+        if scale <= 0:
+            return self.levels
+        return min(max(int(math.floor(math.log2(1 / scale))), 0), self.levels)
+
+    def paint(self, painter, option, widget=None):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.level_for_scale(scale)
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+
+        span = self.tile_size << level  # full-resolution pixels per tile
+        painter.save()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        for ty in range(int(exposed.top()) // span, math.ceil(exposed.bottom() / span)):
+            for tx in range(int(exposed.left()) // span, math.ceil(exposed.right() / span)):
+                pixmap = self._tile(level, tx, ty)
+                if pixmap is not None:
+                    painter.drawPixmap(QRectF(self._tile_rect(level, tx, ty)), pixmap, QRectF(pixmap.rect()))
+        painter.restore()
+
+    def _tile_rect(self, level, tx, ty):
+        """ Full-resolution rectangle covered by a tile """
+        span = self.tile_size << level
+        return QRect(tx * span, ty * span, span, span).intersected(QRect(0, 0, self.size.width(), self.size.height()))
+
+    def _tile(self, level, tx, ty):
+        """ Cached tile pixmap, decoding its row of tiles on a cache miss """
+        key = (level, tx, ty)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+            return pixmap
+
+        # Decoders read from the top of the file down to the rows they return, so a whole
+        # row of tiles costs little more than one of its tiles
+        row = self._tile_rect(level, 0, ty).united(self._tile_rect(level, self._columns(level) - 1, ty))
+        if row.isEmpty():
+            return None
+        image = self._decode(row, QSize(math.ceil(row.width() / 2 ** level), math.ceil(row.height() / 2 ** level)))
+        if image.isNull():
+            logging.error(f'Failed to decode tile row {ty} at level {level} of {self.filename}')
+            return None
+
+        for column in range(self._columns(level)):
+            x = column * self.tile_size
+            tile = QPixmap.fromImage(image.copy(x, 0, min(self.tile_size, image.width() - x), image.height()))
+            self._tiles[(level, column, ty)] = tile
+            self._tile_bytes += tile.width() * tile.height() * 4
+
+        # Evict the least recently drawn tiles, never the one being drawn
+        self._tiles.move_to_end(key)
+        while self._tile_bytes > self._cache_bytes and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self._tile_bytes -= old.width() * old.height() * 4
+        return self._tiles.get(key)
+
+    def grayscale(self, max_side):
+        """
+        The whole image as a grayscale uint8 array downsampled so its longer side is at most
+        max_side pixels, and the full-resolution pixels per array pixel along x and y.
+        The image is shrunk by a power of 2, as for the pyramid levels, which JPEG decodes directly.
+        """
+        level = max(0, math.ceil(math.log2(max(self.size.width(), self.size.height()) / max_side)))
+        size = QSize(max(1, math.ceil(self.size.width() / 2 ** level)), max(1, math.ceil(self.size.height() / 2 ** level)))
+        image = self._decode(QRect(0, 0, self.size.width(), self.size.height()), size)
+        if image.isNull():
+            raise ValueError(f'Could not decode {self.filename}')
+        image = image.convertToFormat(QImage.Format_Grayscale8)
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        # Rows are padded to bytesPerLine
+        array = np.frombuffer(bits, np.uint8).reshape(image.height(), image.bytesPerLine())[:, :image.width()].copy()
+        return array, (self.size.width() / image.width(), self.size.height() / image.height())
+
+    def _columns(self, level):
+        """ Number of tile columns at a level """
+        return math.ceil(self.size.width() / (self.tile_size << level))
+
+    def _decode(self, rect, size):
+        """ Decode the full-resolution rect of the image, downsampled to size """
+        if self._regions:
+            reader = QImageReader(self.filename)
+            reader.setClipRect(rect)
+            reader.setScaledSize(size)
+            return reader.read()
+
+        if self._source is None:
+            self._source = QImage(self.filename)
+            logging.info(f'{self.filename} cannot be decoded by region; loaded at full size')
+        return self._source.copy(rect).scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
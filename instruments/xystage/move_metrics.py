@@ -0,0 +1,113 @@
+from collections import deque
+import csv
+import json
+import logging
+
+import numpy as np
+
+# Phases of a move, in the order they happen. total also covers position tracking and saving.
+PHASES = ('reset', 'write', 'motion', 'ack', 'total')
+
+
+class MoveMetrics:
+    """
+    Phase timings, in seconds, of the moves a Stepper has made, newest last.
+    reset clears stale replies, write sends the command, motion waits for the first byte of
+    the acknowledgement, ack reads the rest of it, and total runs from the start of the move
+    until its position is saved. Streamed moves share one reset, and a batch's write is
+    counted against the move that is waiting when it is sent.
+    Each move also records its straight-line distance and the motion time the firmware's
+    speed profile predicts, from which throughput is derived.
+    For a simulated stage running time_scale times real time (see SimulatedArduino), every
+    time recorded is in real seconds, expected_s included, and the moves and millimeters per
+    second under throughput are per second of stage time, as the real stage would reach.
+    Only the latest capacity moves are kept.
+    Examples:
+    metrics = stepper.metrics
+    metrics.summary()['motion']['p95_ms']
+    counts, edges_ms = metrics.histogram('ack')
+    metrics.to_csv('moves.csv')
+    metrics.to_json('moves.json')
+    metrics.save(path) # either, by the extension of path
+    metrics.reset()
+    """
+    COLUMNS = PHASES + ('distance_mm', 'expected_s')
+
+    def __init__(self, capacity=100000, time_scale=1.0):
+        self.time_scale = time_scale
+        self._rows = deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def record(self, reset, write, motion, ack, total, distance_mm, expected_s):
+        """ Add one acknowledged move """
+        self._rows.append((reset, write, motion, ack, total, distance_mm, expected_s))
+
+    def reset(self):
+        """ Forget every recorded move """
+        self._rows.clear()
+
+    def column(self, name):
+        """ Values of one of COLUMNS for every recorded move, as an array """
+        rows = np.array(self._rows, dtype=float).reshape(-1, len(self.COLUMNS))
+        return rows[:, self.COLUMNS.index(name)]
+
+    def histogram(self, phase, bins=20):
+        """ (counts, edges in milliseconds) of one phase's durations """
+        return np.histogram(1e3 * self.column(phase), bins)
+
+    def summary(self):
+        """
+        Count, mean, median, 95th percentile and maximum of each phase in milliseconds,
+        and under 'throughput' the moves and millimeters per second of total time (in stage
+        time) and the fraction of it the stage was predicted to be moving.
+        """
+        summary = {}
+        for phase in PHASES:
+            ms = 1e3 * self.column(phase)
+            if not len(ms):
+                summary[phase] = {'count': 0}
+                continue
+            summary[phase] = {
+                'count': len(ms),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.median(ms)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'max_ms': float(ms.max()),
+            }
+
+        busy = float(self.column('total').sum())
+        stage_s = busy / self.time_scale
+        summary['throughput'] = {
+            'moves_per_s': len(self) / stage_s if busy else 0.0,
+            'mm_per_s': float(self.column('distance_mm').sum()) / stage_s if busy else 0.0,
+            'motion_fraction': float(self.column('expected_s').sum()) / busy if busy else 0.0,
+        }
+        return summary
+
+    def to_csv(self, path):
+        """ Write one row per move, with the COLUMNS in seconds and millimeters """
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(self.COLUMNS)
+            writer.writerows(self._rows)
+
+    def to_json(self, path, bins=20):
+        """ Write the summary and a histogram of each phase """
+        histograms = {}
+        for phase in PHASES:
+            counts, edges = self.histogram(phase, bins)
+            histograms[phase] = {'counts': counts.tolist(), 'edges_ms': edges.tolist()}
+        with open(path, 'w') as file:
+            json.dump({'summary': self.summary(), 'histograms': histograms}, file, indent=2)
+
+    def save(self, path):
+        """ to_csv for a .csv path, otherwise to_json; a failure to write is logged, not raised """
+        try:
+            if path.endswith('.csv'):
+                self.to_csv(path)
+            else:
+                self.to_json(path)
+        except OSError as e:
+            logging.error(f'Could not write move metrics to {path}: {e}')
@@ -0,0 +1,105 @@
+import numpy as np
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from instruments.xystage.scan_points import in_bounds
+
+
+class ScanPointModel(QAbstractTableModel):
+    """
+    Table model over the scan points, held in one (n, 2) NumPy array of X, Y in mm.
+    The view only asks for the rows it shows, so adding thousands of points costs one
+    array concatenation instead of a table item per value.
+    Points are numbered from 1 in table order; the vertical header shows the numbers.
+    Cells are editable; with limits (the coordinates section of hardware_constants.yaml)
+    an edit that would move a point off the stage is refused.
+    Examples:
+    model = ScanPointModel()
+    table_view.setModel(model)
+    model.append([(1.0, 2.0), (3.0, 4.0)])
+    model.remove_rows([0])
+    model.points # array([[3., 4.]])
+    """
+    HEADERS = ('X', 'Y')
+
+    def __init__(self, limits=None, parent=None):
+        super(ScanPointModel, self).__init__(parent)
+        self.points = np.zeros((0, 2))
+        self.limits = limits
+
+    def __len__(self):
+        return len(self.points)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.points)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role in (Qt.DisplayRole, Qt.EditRole) and index.isValid():
+            return f'{self.points[index.row(), index.column()]:.3f}'
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def flags(self, index):
+        return super(ScanPointModel, self).flags(index) | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+        point = self.points[index.row()].copy()
+        point[index.column()] = value
+        if self.limits is not None and not in_bounds(point, self.limits)[0]:
+            return False
+        self.set_point(index.row(), *point)
+        return True
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+    def append(self, points):
+        """ Add (n, 2) points in mm after the existing ones """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if not len(points):
+            return
+        first = len(self.points)
+        self.beginInsertRows(QModelIndex(), first, first + len(points) - 1)
+        self.points = np.concatenate([self.points, points])
+        self.endInsertRows()
+
+    def set_point(self, row, x, y):
+        """ Move one point to x, y in mm """
+        self.points[row] = (x, y)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, 1))
+
+    def remove_rows(self, rows):
+        """ Remove the points at the given rows; later points are renumbered """
+        rows = np.unique(np.asarray(rows, dtype=int))
+        if not len(rows):
+            return
+        if rows[-1] - rows[0] == len(rows) - 1:
+            self.beginRemoveRows(QModelIndex(), rows[0], rows[-1])
+            self.points = np.delete(self.points, rows, axis=0)
+            self.endRemoveRows()
+            return
+
+        # One model reset is far cheaper than a removal signal per scattered row
+        self.beginResetModel()
+        self.points = np.delete(self.points, rows, axis=0)
+        self.endResetModel()
+
+    def clear(self):
+        """ Remove every point """
+        self.beginResetModel()
+        self.points = np.zeros((0, 2))
+        self.endResetModel()
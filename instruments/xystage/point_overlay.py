@@ -0,0 +1,211 @@
+import math
+
+import numpy as np
+
+from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import QColor, QFont, QFontMetricsF, QPen, QPolygonF, QTransform
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+
+class PointIndex:
+    """
+    Uniform grid over (n, 2) points for rectangle and nearest-point queries.
+    Points are bucketed into about sqrt(n) x sqrt(n) cells and sorted by cell, so a query
+    only visits the cells it overlaps.
+    """
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if not len(self.points):
+            self.origin = np.zeros(2)
+            self.cell = 1.0
+            self.shape = (0, 0)
+            self.keys = self.order = np.zeros(0, dtype=np.int64)
+            return
+
+        self.origin = self.points.min(axis=0)
+        side = math.ceil(math.sqrt(len(self.points)))
+        self.cell = float(np.ptp(self.points, axis=0).max()) / side or 1.0
+        cells = ((self.points - self.origin) // self.cell).astype(np.int64)
+        self.shape = (int(cells[:, 0].max()) + 1, int(cells[:, 1].max()) + 1)
+
+        keys = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def query_rect(self, x0, y0, x1, y1):
+        """ Indices, in ascending order, of the points with x0 <= x <= x1 and y0 <= y <= y1 """
+        if not len(self.points):
+            return np.zeros(0, dtype=np.int64)
+        cx0, cy0 = np.floor((np.array([x0, y0]) - self.origin) / self.cell).astype(np.int64)
+        cx1, cy1 = np.floor((np.array([x1, y1]) - self.origin) / self.cell).astype(np.int64)
+        cx0, cy0 = max(cx0, 0), max(cy0, 0)
+        cx1, cy1 = min(cx1, self.shape[0] - 1), min(cy1, self.shape[1] - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.zeros(0, dtype=np.int64)
+
+        # Each column of cells is one contiguous run of the sorted keys
+        columns = np.arange(cx0, cx1 + 1) * self.shape[1]
+        starts = np.searchsorted(self.keys, columns + cy0, 'left')
+        stops = np.searchsorted(self.keys, columns + cy1, 'right')
+        found = np.concatenate([self.order[start:stop] for start, stop in zip(starts, stops)])
+
+        xy = self.points[found]
+        inside = (xy[:, 0] >= x0) & (xy[:, 0] <= x1) & (xy[:, 1] >= y0) & (xy[:, 1] <= y1)
+        return np.sort(found[inside])
+
+    def nearest(self, x, y, radius):
+        """ Index of the point closest to x, y within radius, or None """
+        found = self.query_rect(x - radius, y - radius, x + radius, y + radius)
+        if not len(found):
+            return None
+        distance = np.hypot(self.points[found, 0] - x, self.points[found, 1] - y)
+        best = int(np.argmin(distance))
+        return int(found[best]) if distance[best] <= radius else None
+
+
+def _polygon(points):
+    """ QPolygonF of (n, 2) points, filled through its buffer instead of one QPointF per point """
+    polygon = QPolygonF(len(points))
+    if len(points):
+        buffer = polygon.data()
+        buffer.setsize(16 * len(points))
+        np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)[:] = points
+    return polygon
+
+
+class ScanPointOverlay(QGraphicsItem):
+    """
+    One graphics item that draws a marker and number for every point of a ScanPointModel.
+    Markers are drawn as wide round-capped points, a single drawPoints call per colour for
+    all markers in the exposed area, found through a PointIndex. Numbers keep a readable size
+    on screen and are thinned out as the view zooms out so they never overlap; lower numbers
+    win. Selected rows (from selection_model, if given) are highlighted.
+    scale is in scene pixels per mm. The overlay follows the model's signals, so points are
+    added, edited and removed through the model only.
+    Examples:
+    overlay = ScanPointOverlay(model, 28.2588, table_view.selectionModel())
+    scene.addItem(overlay)
+    row = overlay.point_at(scene_pos, radius)
+    """
+    RADIUS = 20  # marker radius in scene pixels
+    MIN_MARKER = 4  # smallest marker diameter on screen, in device pixels
+    SMALL_MARKER = 8  # markers smaller than this on screen are drawn as plain squares, without an outline
+    LABEL_MARGIN_MM = 10  # numbers are drawn only while they fit within this margin around the points
+    FILL = QColor(50, 205, 50)
+    SELECTED = QColor(255, 140, 0)
+
+    def __init__(self, model, scale, selection_model=None, parent=None):
+        super(ScanPointOverlay, self).__init__(parent)
+        self.model = model
+        self.scale = scale
+        self.selection_model = selection_model
+        self.pixels = np.zeros((0, 2))
+        self.selected = np.zeros(0, dtype=bool)
+        self.index = PointIndex(self.pixels)
+        self._bounds = QRectF()
+        self._margin = 0.0
+
+        self.label_font = QFont('Arial', 10)
+        self.label_font.setBold(True)
+        self._label_metrics = QFontMetricsF(self.label_font)
+
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(1)
+
+        for signal in (model.modelReset, model.rowsInserted, model.rowsRemoved, model.dataChanged):
+            signal.connect(self.refresh)
+        if selection_model is not None:
+            selection_model.selectionChanged.connect(self.refresh_selection)
+
+    def refresh(self, *args):
+        """ Re-read the points from the model """
+        self.prepareGeometryChange()
+        self.pixels = self.model.points * self.scale
+        self.index = PointIndex(self.pixels)
+        if len(self.pixels):
+            low, high = self.pixels.min(axis=0), self.pixels.max(axis=0)
+            # Room for the markers and the numbers above them
+            self._margin = max(self.LABEL_MARGIN_MM * self.scale, 0.05 * float((high - low).max()), 2 * self.RADIUS)
+            self._bounds = QRectF(*(low - self._margin), *(high - low + 2 * self._margin))
+        else:
+            self._bounds = QRectF()
+        self.refresh_selection()
+
+    def refresh_selection(self, *args):
+        """ Re-read the selected rows from the selection model """
+        self.selected = np.zeros(len(self.pixels), dtype=bool)
+        if self.selection_model is not None:
+            rows = [index.row() for index in self.selection_model.selectedRows()]
+            self.selected[[row for row in rows if row < len(self.selected)]] = True
+        self.update()
+
+    def point_at(self, scene_pos, radius):
+        """ Row of the point nearest scene_pos within radius scene pixels, or None """
+        return self.index.nearest(scene_pos.x(), scene_pos.y(), radius)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def paint(self, painter, option, widget=None):
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        if lod <= 0:
+            return
+        # Markers keep a minimum size on screen, so they can grow past RADIUS when zoomed out
+        radius = min(max(self.RADIUS, self.MIN_MARKER / 2 / lod), self._margin)
+        rect = option.exposedRect
+        if painter.hasClipping() and not painter.clipBoundingRect().isEmpty():
+            # QGraphicsView.render and scene exports expose the whole item; only the clip is drawn
+            rect = rect.intersected(painter.clipBoundingRect())
+        rows = self.index.query_rect(rect.left() - self._margin, rect.top() - self._margin,
+                                     rect.right() + self._margin, rect.bottom() + self._margin)
+        if not len(rows):
+            return
+
+        painter.save()
+        diameter = 2 * radius * lod  # on screen
+        small = diameter < self.SMALL_MARKER
+        if not small:
+            painter.setPen(QPen(Qt.black, 2 * radius + 2 / lod, Qt.SolidLine, Qt.RoundCap))
+            painter.drawPoints(_polygon(self.pixels[rows]))
+        for colour, mask in ((self.FILL, ~self.selected[rows]), (self.SELECTED, self.selected[rows])):
+            if mask.any():
+                shown = rows[mask]
+                if small:
+                    # Tiny markers sharing a screen cell look the same as one marker
+                    shown = self._thin(shown, painter.worldTransform(), diameter / 2)
+                painter.setPen(QPen(colour, 2 * radius, Qt.SolidLine, Qt.SquareCap if small else Qt.RoundCap))
+                painter.drawPoints(_polygon(self.pixels[shown]))
+
+        self._paint_labels(painter, rows, radius)
+        painter.restore()
+
+    def _thin(self, rows, transform, cell):
+        """ The lowest of rows in each cell of device pixels, cell being a size or (width, height) """
+        device = self.pixels[rows] * (transform.m11(), transform.m22()) + (transform.dx(), transform.dy())
+        cells = np.floor(device / cell).astype(np.int64)
+        cells -= cells.min(axis=0)
+        # One integer per cell; a 1-D unique is far cheaper than a row-wise one
+        keys = cells[:, 0] * (int(cells[:, 1].max()) + 1) + cells[:, 1]
+        _, first = np.unique(keys, return_index=True)
+        return rows[np.sort(first)]
+
+    def _paint_labels(self, painter, rows, radius):
+        """ Number the markers in device pixels, keeping the lowest number in each label-sized cell """
+        transform = painter.worldTransform()
+        if transform.isRotating():
+            return
+        width = self._label_metrics.horizontalAdvance(str(len(self.pixels))) + 4
+        height = self._label_metrics.height()
+        offset = radius * abs(transform.m22()) + 2
+        margin = self._margin * min(abs(transform.m11()), abs(transform.m22()))
+        if offset + height > margin or width / 2 > margin:
+            return  # zoomed too far out for the numbers to stay inside the bounding rect
+
+        rows = self._thin(rows, transform, (width, height))
+        device = self.pixels[rows] * (transform.m11(), transform.m22()) + (transform.dx(), transform.dy())
+
+        painter.setWorldTransform(QTransform())
+        painter.setFont(self.label_font)
+        painter.setPen(Qt.white)
+        for row, (x, y) in zip(rows.tolist(), device.tolist()):
+            painter.drawText(QRectF(x - width / 2, y - offset - height, width, height), Qt.AlignCenter, str(row + 1))
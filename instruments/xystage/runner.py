@@ -0,0 +1,229 @@
+"""
+Headless scan runner: drives a Stepper through the points of a scan-plan CSV with no Qt.
+
+    python -m instruments.xystage run plan.csv
+    python -m instruments.xystage run plan.csv --port COM5 --out scans/stage_a
+    python -m instruments.xystage run plan.csv --simulate --time-scale 0.01
+    python -m instruments.xystage run --resume scans/stage_a
+    python -m instruments.xystage run plan.csv --metrics moves.csv
+
+The plan is X, Y in mm per row, as written by Export CSV; points are numbered from 1 in
+file order. Progress goes to stderr and a JSON summary of the run to stdout. Results are
+streamed to the output directory (see scan_store.py) together with the scan journal and
+the run's log, so an interrupted run can be continued with --resume.
+--metrics writes the phase timings of every move (see move_metrics.py) as JSON (summary and
+histograms) or, for a .csv path, one row per move.
+Several stages can run at once as separate processes, each with its own --port and --out.
+Exit status is 0 when every point was visited, 1 on error and 130 when interrupted.
+"""
+import argparse
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+from time import monotonic
+
+import numpy as np
+
+from instruments.xystage.config import XY_DIR, configure_logging, load_constants
+from instruments.xystage import scan_points
+from instruments.xystage.scan_session import ScanSession
+
+JOURNAL_FILE = 'journal.jsonl'
+LOG_FILE = 'run.log'
+
+
+class Progress:
+    """
+    One-line progress report on stderr: points done, percent, current point and time left.
+    On a terminal the line is redrawn in place, otherwise a line is printed every 10%.
+    """
+    def __init__(self, total, done=0, stream=sys.stderr):
+        self.total = total
+        self.first = done
+        self.stream = stream
+        self.started = monotonic()
+        self._tty = stream.isatty()
+        self._reported = -1
+
+    def update(self, done, label, x, y):
+        percent = 100 * done / self.total
+        rate = (done - self.first) / max(monotonic() - self.started, 1e-9)
+        left = (self.total - done) / rate if rate else 0.0
+        line = (f'[{done:>{len(str(self.total))}}/{self.total}] {percent:5.1f}% '
+                f'point {label} ({x:0.3f}, {y:0.3f}) {int(left) // 60}:{int(left) % 60:02d} left')
+        if self._tty:
+            self.stream.write('\r' + line + ('\n' if done == self.total else ''))
+            self.stream.flush()
+        elif int(percent // 10) > self._reported or done == self.total:
+            self._reported = int(percent // 10)
+            print(line, file=self.stream, flush=True)
+
+
+@contextmanager
+def stop_on_interrupt():
+    """
+    Turn the first Ctrl+C into a request to stop, kept in the yielded list, instead of a
+    KeyboardInterrupt that could land inside Stepper.wait_for_done halfway through a reply and
+    leave the host's position behind the stage's. A second Ctrl+C interrupts at once.
+    Off the main thread, where no signal handler can be set, the list just stays empty.
+    """
+    stop = []
+    if threading.current_thread() is not threading.main_thread():
+        yield stop
+        return
+
+    def interrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        stop.append(signum)
+
+    previous = signal.signal(signal.SIGINT, interrupt)
+    try:
+        yield stop
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def connect(port=None, simulate=False, time_scale=1.0, no_home=False):
+    """
+    Create a Stepper and bring it to a known position by homing. With no_home=True the position
+    saved by the last session is trusted instead, unchecked (see Stepper.restore_position), and
+    the stage is homed only if there is none. Raises RuntimeError if there is no Arduino.
+    """
+    from instruments.xystage.stepper_util import Stepper
+
+    stepper = Stepper(simulate=simulate, time_scale=time_scale, port=port)
+    if stepper.arduino is None:
+        stepper.find_arduino()
+    if stepper.arduino is None:
+        raise RuntimeError(f'Arduino not found{"" if port is None else f" at {port}"}')
+
+    if not no_home or not stepper.restore_position():
+        logging.info('Homing stage')
+        stepper.gohome()
+    return stepper
+
+
+def run_scan(stepper, points, out, trigger=False, plan=True, resume=False, progress=True):
+    """
+    Visit the (label, x, y) points with stepper, streaming results to the directory out.
+    With plan=True the points are reordered for the least travel time first. With resume=True,
+    points are ignored and the unfinished scan journaled in out is continued, after checking
+    the stage position against the firmware.
+    Ctrl+C stops the scan once the move under way is acknowledged and the moves already sent
+    have finished, so the position the next run resumes from is the stage's own.
+    Returns a summary dict, whose status is 'complete' or, if stopped with Ctrl+C, 'interrupted'.
+    """
+    journal_path = os.path.join(out, JOURNAL_FILE)
+    if resume:
+        session = ScanSession.resume(journal_path)
+        if not stepper.verify_position():
+            logging.info('Stage position not verified; homing before resuming the scan')
+            stepper.gohome()
+    else:
+        if plan and len(points) > 1:
+            from instruments.xystage.scan_path import plan_scan_path
+
+            xy = np.array([(x, y) for _, x, y in points], dtype=float).reshape(-1, 2)
+            order, original_time, planned_time = plan_scan_path(
+                xy, (stepper.current_x, stepper.current_y), interpolate=stepper.interpolate, axis_time=stepper.axis_time
+            )
+            logging.info(f'Scan path planned: {original_time:0.3f} s -> {planned_time:0.3f} s')
+            points = [points[i] for i in order]
+        session = ScanSession.start(points, out, journal_path, trigger, stepper.interpolate)
+
+    report = Progress(session.total, session.first) if progress else None
+    started = monotonic()
+    status = 'complete'
+    stepper.metrics.reset()
+    moves = stepper.move_through(session.targets(), trigger=session.trigger)
+    try:
+        with stop_on_interrupt() as stop:
+            for i, x, y, *fired in moves:
+                session.record(i, x, y, *fired)
+                if report is not None:
+                    report.update(session.first + i + 1, session.points[i][0], x, y)
+                if stop:
+                    raise KeyboardInterrupt
+            session.finish()
+    except KeyboardInterrupt:
+        status = 'interrupted'
+        logging.info(f'Scan interrupted after {session.completed} of {session.total} points')
+    finally:
+        # Waits for moves already sent to the Arduino, so the position stays correct
+        moves.close()
+        session.close()
+
+    return {
+        'status': status,
+        'points': session.total,
+        'completed': session.completed,
+        'out': os.path.abspath(out),
+        'elapsed_s': monotonic() - started,
+        'position': [stepper.current_x, stepper.current_y],
+        'throughput': stepper.metrics.summary()['throughput'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m instruments.xystage', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run a scan from a plan CSV')
+    run.add_argument('plan', nargs='?', help='CSV of X, Y in mm')
+    run.add_argument('--resume', metavar='OUT', help='continue the unfinished scan in this output directory')
+    run.add_argument('--out', help='output directory (default: a new folder under the scans directory)')
+    run.add_argument('--port', help='serial port of the Arduino (default: search for it)')
+    run.add_argument('--simulate', action='store_true', help='use a simulated Arduino')
+    run.add_argument('--time-scale', type=float, default=1.0, help='simulated time per real second')
+    run.add_argument('--no-home', action='store_true',
+                     help='trust the position saved by the last run instead of homing; the Arduino cannot check it, '
+                          'so only if the stage has not been moved since')
+    run.add_argument('--trigger', action='store_true', help='pulse OPTO at each point (see the trigger settings)')
+    run.add_argument('--keep-order', action='store_true', help='visit the points in file order')
+    run.add_argument('--quiet', action='store_true', help='no progress on stderr')
+    run.add_argument('--metrics', metavar='PATH', help='write the moves\' phase timings to this .json or .csv file')
+    args = parser.parse_args(argv)
+
+    if (args.plan is None) == (args.resume is None):
+        parser.error('give either a plan CSV or --resume')
+
+    constants = load_constants()
+    if args.resume is not None:
+        out = args.resume
+        points = None
+    else:
+        xy = scan_points.load_csv(args.plan)
+        inside = scan_points.in_bounds(xy, constants['coordinates'])
+        if not inside.all():
+            parser.error(f'{int((~inside).sum())} points in {args.plan} are outside the stage limits')
+        points = [(k + 1, x, y) for k, (x, y) in enumerate(xy.tolist())]
+        out = args.out or os.path.join(XY_DIR, constants['scans']['directory'], datetime.now().strftime('%Y%m%d_%H%M%S'))
+        os.makedirs(out, exist_ok=True)
+
+    # Each run logs next to its results, so runs in parallel processes never share a log file
+    configure_logging(os.path.join(out, LOG_FILE))
+
+    try:
+        # Stepper prints its own messages; stdout is kept for the summary
+        with redirect_stdout(sys.stderr):
+            stepper = connect(args.port, args.simulate, args.time_scale, args.no_home)
+            try:
+                summary = run_scan(stepper, points, out, args.trigger, not args.keep_order, args.resume is not None,
+                                   not args.quiet)
+            finally:
+                if args.metrics is not None:
+                    stepper.metrics.save(args.metrics)
+                stepper.disconnect()
+    except KeyboardInterrupt:
+        summary = {'status': 'interrupted', 'out': os.path.abspath(out)}
+    except (OSError, RuntimeError, TimeoutError, ValueError) as e:
+        logging.error(f'Scan failed: {e}', exc_info=True)
+        summary = {'status': 'error', 'error': str(e), 'out': os.path.abspath(out)}
+
+    print(json.dumps(summary))
+    return {'complete': 0, 'interrupted': 130}.get(summary['status'], 1)
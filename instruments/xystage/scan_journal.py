@@ -0,0 +1,109 @@
+import json
+import os
+from time import monotonic
+
+
+class ScanJournal:
+    """
+    Append-only record of a scan, one JSON object per line, so a scan cut short by a crash or
+    a lost connection can be resumed (see load_journal).
+    The plan is written and synced to disk before the first move; each completed point adds a
+    line, and those are synced in batches of fsync_every points or every fsync_s seconds.
+    Points complete in plan order, so the journal only counts them.
+    Examples:
+    journal = ScanJournal(path)
+    journal.start(points, {'store': writer.path})
+    journal.complete() # after each point
+    journal.finish()
+
+    state = load_journal(path)
+    journal.resume(state['completed']) # continue an unfinished scan
+    """
+    def __init__(self, path, fsync_every=10, fsync_s=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_s = fsync_s
+        self.completed = 0
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = monotonic()
+
+    def start(self, points, attrs=None):
+        """ Begin a new scan of (label, x, y) points, replacing any previous journal """
+        self.close()
+        self._file = open(self.path, 'w')
+        self.completed = 0
+        self._write({'plan': [[label, float(x), float(y)] for label, x, y in points], 'attrs': attrs or {}}, sync=True)
+
+    def resume(self, first):
+        """ Continue the journaled scan from point first, the number of points already done """
+        self.close()
+        # Drop a last line cut off by a crash, which load_journal would stop at
+        with open(self.path, 'r+b') as file:
+            data = file.read()
+            file.truncate(data.rfind(b'\n') + 1)
+        self._file = open(self.path, 'a')
+        self.completed = first
+        self._write({'resume': first}, sync=True)
+
+    def complete(self):
+        """ Record that the next point of the plan is done """
+        self.completed += 1
+        self._write({'done': self.completed})
+
+    def finish(self):
+        """ Record that every point is done """
+        self._write({'finished': True}, sync=True)
+        self.close()
+
+    def close(self):
+        """ Sync and close the journal, leaving it resumable if the scan did not finish """
+        if self._file is None:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+
+    def _write(self, record, sync=False):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if sync or self._unsynced >= self.fsync_every or monotonic() - self._last_sync >= self.fsync_s:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = monotonic()
+
+
+def load_journal(path):
+    """
+    Read the journal at path as {'points': [(label, x, y)], 'attrs': {...}, 'completed': n,
+    'finished': bool}, or None if there is no readable plan.
+    A last line cut off by a crash is ignored.
+    """
+    try:
+        with open(path, 'r') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return None
+
+    state = None
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break
+        if 'plan' in record:
+            state = {'points': [tuple(point) for point in record['plan']], 'attrs': record['attrs'],
+                     'completed': 0, 'finished': False}
+        elif state is None:
+            return None
+        elif 'resume' in record:
+            state['completed'] = record['resume']
+        elif 'done' in record:
+            state['completed'] = record['done']
+        elif 'finished' in record:
+            state['finished'] = True
+    return state
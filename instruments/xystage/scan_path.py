@@ -0,0 +1,143 @@
+import numpy as np
+
+
+def travel_cost(a, b, seconds_per_mm=1.0, interpolate=False, axis_time=None):
+    """
+    Time to travel between points a and b (arrays of shape (..., 2), in mm).
+    Sequential moves step the whole X move and then the whole Y move, so a
+    move costs time(|dx|) + time(|dy|). Interpolated moves step both axes
+    together and cost time(max(|dx|, |dy|)).
+    time is axis_time (e.g. Stepper.axis_time, which follows the acceleration
+    profile) if given, otherwise seconds_per_mm * distance.
+    Broadcasts like any NumPy expression.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if axis_time is None:
+        def axis_time(distance):
+            return seconds_per_mm * distance
+
+    d = np.abs(a - b)
+    if interpolate:
+        return axis_time(d.max(axis=-1))
+    return axis_time(d[..., 0]) + axis_time(d[..., 1])
+
+
+def path_cost(points, order, start=None, seconds_per_mm=1.0, interpolate=False, axis_time=None):
+    """
+    Total travel time of visiting points in the given order, optionally starting at start.
+    """
+    path = np.asarray(points, dtype=float)[np.asarray(order, dtype=int)]
+    if start is not None:
+        path = np.vstack([np.asarray(start, dtype=float)[None, :], path])
+    if len(path) < 2:
+        return 0.0
+    return float(travel_cost(path[1:], path[:-1], seconds_per_mm, interpolate, axis_time).sum())
+
+
+def nearest_neighbour_order(points, start=None, interpolate=False, axis_time=None):
+    """
+    Greedy tour: from start (or the first point), always move to the closest unvisited point.
+    Returns the visiting order as an index array into points.
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+
+    if start is None:
+        current = points[0]
+        order[0] = 0
+        visited[0] = True
+        first = 1
+    else:
+        current = np.asarray(start, dtype=float)
+        first = 0
+
+    for k in range(first, n):
+        cost = travel_cost(points, current, interpolate=interpolate, axis_time=axis_time)
+        cost[visited] = np.inf
+        nxt = int(np.argmin(cost))
+        order[k] = nxt
+        visited[nxt] = True
+        current = points[nxt]
+
+    return order
+
+
+def two_opt(points, order, start=None, max_passes=50, interpolate=False, axis_time=None):
+    """
+    Improve an open path with 2-opt segment reversals until no reversal shortens it.
+    Each candidate row of reversals is evaluated at once over a precomputed cost matrix.
+    """
+    points = np.asarray(points, dtype=float)
+    order = np.asarray(order, dtype=int).copy()
+    n = len(order)
+    if n < 3:
+        return order
+
+    # Node 0 is the fixed start (or the fixed first point) and node n + 1 is a
+    # free end with zero cost to everything, so the path may end anywhere.
+    if start is None:
+        nodes = points[order]
+        head = nodes[:1]
+        nodes = nodes[1:]
+        order_head, order = order[:1], order[1:]
+    else:
+        nodes = points[order]
+        head = np.asarray(start, dtype=float)[None, :]
+        order_head = order[:0]
+
+    m = len(nodes)
+    xy = np.vstack([head, nodes])
+    cost = np.zeros((m + 2, m + 2))
+    cost[:m + 1, :m + 1] = travel_cost(xy[:, None, :], xy[None, :, :], interpolate=interpolate, axis_time=axis_time)
+
+    path = np.arange(m + 2)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, m):
+            # Reverse path[i:j + 1] for every j in i+1..m
+            j = np.arange(i + 1, m + 1)
+            a, b = path[i - 1], path[i]
+            c, d = path[j], path[j + 1]
+            delta = cost[a, c] + cost[b, d] - cost[a, b] - cost[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                jb = j[best]
+                path[i:jb + 1] = path[i:jb + 1][::-1]
+                improved = True
+        if not improved:
+            break
+
+    return np.concatenate([order_head, order[path[1:m + 1] - 1]])
+
+
+def plan_scan_path(points, start=None, seconds_per_mm=1.0, max_passes=50, interpolate=False, axis_time=None,
+                   max_two_opt_points=2000):
+    """
+    Reorder scan points to minimise total stage travel time.
+
+    Starts from a nearest-neighbour tour and refines it with 2-opt, using the
+    cost of sequential or interpolated moves to match how the stage will move.
+    2-opt needs an n x n cost matrix, so it is skipped above max_two_opt_points.
+    Returns (order, original_time, planned_time), where order indexes into points
+    and the times are in seconds for the original and the planned order.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    original = np.arange(len(points))
+    original_time = path_cost(points, original, start, seconds_per_mm, interpolate, axis_time)
+
+    order = nearest_neighbour_order(points, start, interpolate, axis_time)
+    if len(points) <= max_two_opt_points:
+        order = two_opt(points, order, start, max_passes, interpolate, axis_time)
+    planned_time = path_cost(points, order, start, seconds_per_mm, interpolate, axis_time)
+
+    # Never hand back something worse than what the user clicked
+    if planned_time > original_time:
+        return original, original_time, original_time
+
+    return order, original_time, planned_time
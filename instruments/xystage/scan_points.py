@@ -0,0 +1,98 @@
+import numpy as np
+
+MAX_POINTS = 1000000  # most points one grid or polygon fill may generate
+
+
+def grid_points(x_start, x_stop, y_start, y_stop, pitch_x, pitch_y=None, serpentine=True):
+    """
+    Rectangular grid of scan points (n, 2) in mm, row by row along x.
+    Rows run from y_start towards y_stop and points within a row from x_start towards x_stop,
+    pitch_x and pitch_y apart (pitch_y defaults to pitch_x); the stop values are included
+    when they fall on the grid. With serpentine=True every other row runs backwards, so the
+    stage never travels back across the grid between rows.
+    Raises ValueError for a pitch that is not positive or a grid of more than MAX_POINTS points.
+    """
+    if pitch_y is None:
+        pitch_y = pitch_x
+    if pitch_x <= 0 or pitch_y <= 0:
+        raise ValueError('Grid pitch must be positive')
+
+    nx = _count(x_start, x_stop, pitch_x)
+    ny = _count(y_start, y_stop, pitch_y)
+    # Checked before anything is allocated, so a tiny pitch cannot exhaust memory
+    if nx * ny > MAX_POINTS:
+        raise ValueError(f'A grid of {nx * ny} points is more than {MAX_POINTS}; use a larger pitch')
+    xs = _axis(x_start, x_stop, pitch_x, nx)
+    ys = _axis(y_start, y_stop, pitch_y, ny)
+    X, Y = np.meshgrid(xs, ys)
+    if serpentine:
+        X[1::2] = X[1::2, ::-1]
+    return np.column_stack([X.ravel(), Y.ravel()])
+
+
+def _count(start, stop, pitch):
+    """ Number of grid points from start to stop, pitch apart """
+    return int(np.floor(abs(stop - start) / pitch + 1e-9)) + 1
+
+
+def _axis(start, stop, pitch, n):
+    """ n points start, start + pitch, ... towards stop, stepping downwards if stop < start """
+    return float(start) + np.sign(stop - start or 1) * pitch * np.arange(n)
+
+
+def points_in_polygon(points, vertices):
+    """
+    Boolean mask of the points (n, 2) inside the polygon with the given (m, 2) vertices,
+    by the even-odd rule. Loops over the polygon's edges, never over the points.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    x, y = points[:, 0], points[:, 1]
+
+    inside = np.zeros(len(points), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        # Edges that a ray from each point towards +x crosses
+        spans = (y1 > y) != (y2 > y)
+        if y1 != y2:
+            inside ^= spans & (x < x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+    return inside
+
+
+def polygon_points(vertices, pitch_x, pitch_y=None, serpentine=True):
+    """
+    Grid points (n, 2) in mm that fill the polygon with the given (m, 2) vertices.
+    The grid is aligned to the polygon's lowest x and y and keeps the row order of grid_points.
+    Raises ValueError if the grid over the polygon's bounding box has more than MAX_POINTS points.
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    if len(vertices) < 3:
+        raise ValueError('A polygon needs at least 3 vertices')
+    low, high = vertices.min(axis=0), vertices.max(axis=0)
+    points = grid_points(low[0], high[0], low[1], high[1], pitch_x, pitch_y, serpentine)
+    return points[points_in_polygon(points, vertices)]
+
+
+def in_bounds(points, limits):
+    """
+    Boolean mask of the points (n, 2) inside the stage limits, the coordinates section of
+    hardware_constants.yaml.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return ((points[:, 0] >= limits['x_min']) & (points[:, 0] <= limits['x_max'])
+            & (points[:, 1] >= limits['y_min']) & (points[:, 1] <= limits['y_max']))
+
+
+def load_csv(path):
+    """
+    Read scan points (n, 2) in mm from the first two columns of a CSV file.
+    A header row, if there is one, is skipped.
+    """
+    try:
+        return np.loadtxt(path, delimiter=',', usecols=(0, 1), ndmin=2)
+    except ValueError:
+        return np.loadtxt(path, delimiter=',', usecols=(0, 1), ndmin=2, skiprows=1)
+
+
+def save_csv(path, points):
+    """ Write scan points (n, 2) in mm to a CSV file with an x,y header """
+    np.savetxt(path, np.asarray(points, dtype=float).reshape(-1, 2), fmt='%.3f', delimiter=',', header='x,y', comments='')
@@ -0,0 +1,108 @@
+import logging
+from time import time
+
+from instruments.xystage.config import load_constants
+from instruments.xystage.scan_journal import ScanJournal, load_journal
+from instruments.xystage.scan_store import ScanWriter, load_meta
+
+
+class ScanSession:
+    """
+    The results store and journal of one scan, kept in step: each point reached is appended
+    to the ScanWriter and then counted in the ScanJournal, so an interrupted scan can be
+    continued with resume(). Used by both the window's StageWorker and the headless runner.
+    points are the (label, x, y) points still to visit, first the number already done and
+    total the number in the whole scan.
+    Examples:
+    session = ScanSession.start(points, 'scans/stage_a', 'scans/stage_a/journal.jsonl')
+    session = ScanSession.resume('scans/stage_a/journal.jsonl')
+    for i, x, y, *fired in stepper.move_through(session.targets(), trigger=session.trigger):
+        session.record(i, x, y, *fired)
+    session.finish()
+    session.close()
+    """
+    def __init__(self, points, writer, journal, trigger=False, first=0, total=None):
+        self.points = list(points)
+        self.writer = writer
+        self.journal = journal
+        self.trigger = trigger
+        self.first = first
+        self.total = first + len(self.points) if total is None else total
+
+    @classmethod
+    def start(cls, points, store, journal_path, trigger=False, interpolate=False):
+        """
+        Begin a scan of (label, x, y) points, with results in the directory store and the
+        journal at journal_path, replacing any previous journal there.
+        """
+        settings = load_constants()['scans']
+        writer = ScanWriter(store, attrs={'trigger': trigger, 'interpolate': interpolate},
+                            chunk_rows=settings['chunk_rows'], flush_s=settings['flush_s'])
+        journal = ScanJournal(journal_path, settings['fsync_every'], settings['fsync_s'])
+        journal.start(points, {'store': writer.path, 'trigger': trigger})
+        logging.info(f'Saving scan results to {writer.path}')
+        return cls(points, writer, journal, trigger)
+
+    @classmethod
+    def resume(cls, journal_path, new_store=None, interpolate=False):
+        """
+        Continue the unfinished scan journaled at journal_path, appending to its results store.
+        If that store cannot be reopened, the rest of the results go to a new store at
+        new_store, or with new_store=None the error (OSError or ValueError) is raised.
+        Raises ValueError if there is no journaled scan.
+        """
+        state = load_journal(journal_path)
+        if state is None:
+            raise ValueError(f'No scan journal at {journal_path}')
+
+        settings = load_constants()['scans']
+        trigger = state['attrs']['trigger']
+        store = state['attrs']['store']
+        try:
+            # Points journaled as done whose results never reached the store are visited again
+            first = min(state['completed'], load_meta(store)['rows'])
+            writer = ScanWriter(store, chunk_rows=settings['chunk_rows'], flush_s=settings['flush_s'], resume_rows=first)
+        except (OSError, ValueError) as e:
+            if new_store is None:
+                raise
+            logging.error(f'Could not reopen scan results at {store}: {e}')
+            first = state['completed']
+            writer = ScanWriter(new_store, attrs={'trigger': trigger, 'interpolate': interpolate},
+                                chunk_rows=settings['chunk_rows'], flush_s=settings['flush_s'])
+
+        journal = ScanJournal(journal_path, settings['fsync_every'], settings['fsync_s'])
+        journal.resume(first)
+        logging.info(f'Resuming scan at point {first + 1} of {len(state["points"])}, saving results to {writer.path}')
+        return cls(state['points'][first:], writer, journal, trigger, first, len(state['points']))
+
+    @property
+    def path(self):
+        """ Directory of the results store """
+        return self.writer.path
+
+    @property
+    def completed(self):
+        """ Points of the whole scan done so far """
+        return self.journal.completed
+
+    def targets(self):
+        """ (x, y) of the points still to visit, for Stepper.move_through """
+        return [(x, y) for _, x, y in self.points]
+
+    def record(self, i, x, y, *fired):
+        """
+        Store the result for points[i], reached at (x, y) with OPTO fired at fired if the scan is
+        triggered, and journal the point as done. Points must be recorded in order.
+        """
+        label, scan_x, scan_y = self.points[i]
+        self.writer.append(label, (scan_x, scan_y), (x, y), time(), *fired)
+        self.journal.complete()
+
+    def finish(self):
+        """ Journal the scan as complete """
+        self.journal.finish()
+
+    def close(self):
+        """ Flush the results and close the journal, leaving it resumable if the scan did not finish """
+        self.writer.close()
+        self.journal.close()
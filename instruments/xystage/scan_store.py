@@ -0,0 +1,177 @@
+import json
+import os
+from time import monotonic
+
+import numpy as np
+
+META_FILE = 'meta.json'
+
+# Columns every scan has: the point's label, where it was commanded to and where the stage
+# reported it reached (mm), when the move was acknowledged and when OPTO fired (time.time(),
+# NaN for untriggered scans)
+BASE_COLUMNS = {
+    'label': ((), 'i4'),
+    'commanded_x': ((), 'f8'),
+    'commanded_y': ((), 'f8'),
+    'actual_x': ((), 'f8'),
+    'actual_y': ((), 'f8'),
+    'moved_at': ((), 'f8'),
+    'fired_at': ((), 'f8'),
+}
+
+
+class ScanWriter:
+    """
+    Streams scan results to a directory with one raw little-endian file per column (<name>.bin)
+    and meta.json describing them. measurements maps extra column names to (shape, dtype) of
+    the array attached to each point, e.g. a spectrum. attrs are stored in meta.json as given.
+    Rows are buffered and appended to the column files in chunks of chunk_rows, or sooner once
+    flush_s seconds have passed; meta.json counts only rows that are fully written, so
+    read_scan can map a running scan at any time.
+    With resume_rows, the scan already at path is reopened and continued after its first
+    resume_rows rows, dropping any later ones; its columns and attrs are kept.
+    Examples:
+    with ScanWriter('scans/run1', {'counts': ((1024,), 'u4')}) as writer:
+        writer.append(1, (x, y), (stage_x, stage_y), moved_at, counts=counts)
+    scan = read_scan('scans/run1')
+    scan['actual_x'], scan['counts'][-1]
+    writer = ScanWriter('scans/run1', resume_rows=120)
+    """
+    def __init__(self, path, measurements=None, attrs=None, chunk_rows=64, flush_s=1.0, resume_rows=None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.flush_s = flush_s
+        if resume_rows is not None:
+            self._reopen(resume_rows)
+        else:
+            self._create(measurements, attrs)
+        self._buffer = []
+        self._last_flush = monotonic()
+        self._write_meta()
+
+    def _create(self, measurements, attrs):
+        """ Start a new scan at path """
+        self.columns = dict(BASE_COLUMNS)
+        for name, (shape, dtype) in (measurements or {}).items():
+            if name in self.columns:
+                raise ValueError(f'{name} is a built-in scan column')
+            self.columns[name] = (tuple(shape), dtype)
+        self.dtypes = {name: np.dtype(dtype).newbyteorder('<') for name, (_, dtype) in self.columns.items()}
+
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(os.path.join(self.path, META_FILE)):
+            raise FileExistsError(f'{self.path} already holds a scan')
+
+        self.meta = {
+            'columns': {name: {'shape': list(shape), 'dtype': self.dtypes[name].str}
+                        for name, (shape, _) in self.columns.items()},
+            'rows': 0,
+            'closed': False,
+            'attrs': attrs or {},
+        }
+        self._files = {name: open(os.path.join(self.path, f'{name}.bin'), 'wb') for name in self.columns}
+
+    def _reopen(self, rows):
+        """ Continue the scan at path after its first rows rows """
+        self.meta = load_meta(self.path)
+        if rows > self.meta['rows']:
+            raise ValueError(f'{self.path} holds only {self.meta["rows"]} rows')
+        self.columns = {name: (tuple(column['shape']), column['dtype']) for name, column in self.meta['columns'].items()}
+        self.dtypes = {name: np.dtype(dtype) for name, (_, dtype) in self.columns.items()}
+
+        self.meta['rows'] = rows
+        self.meta['closed'] = False
+        self._files = {}
+        for name, (shape, _) in self.columns.items():
+            file = open(os.path.join(self.path, f'{name}.bin'), 'r+b')
+            # Drops later rows, including any left half written by a crash
+            file.truncate(rows * self.dtypes[name].itemsize * int(np.prod(shape)))
+            file.seek(0, os.SEEK_END)
+            self._files[name] = file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.meta['rows'] + len(self._buffer)
+
+    def append(self, label, commanded, actual, moved_at, fired_at=np.nan, **measurements):
+        """
+        Add one point; every measurement column must be given, with its column's shape.
+        A point that does not fit the columns raises ValueError and is not stored.
+        """
+        missing = set(self.columns) - set(BASE_COLUMNS) - set(measurements)
+        if missing:
+            raise ValueError(f'Missing measurements: {", ".join(sorted(missing))}')
+        row = dict(measurements, label=label, commanded_x=commanded[0], commanded_y=commanded[1],
+                   actual_x=actual[0], actual_y=actual[1], moved_at=moved_at, fired_at=fired_at)
+        # Checked before buffering, so a bad point can never leave the columns different lengths
+        for name, (shape, _) in self.columns.items():
+            try:
+                value = np.asarray(row[name], dtype=self.dtypes[name])
+            except (TypeError, ValueError) as e:
+                raise ValueError(f'{name} cannot be stored as {self.dtypes[name]}: {e}') from None
+            if value.shape != shape:
+                raise ValueError(f'{name} has shape {value.shape}, expected {shape}')
+            row[name] = value
+        self._buffer.append(row)
+        if len(self._buffer) >= self.chunk_rows or monotonic() - self._last_flush >= self.flush_s:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered rows, then count them in meta.json """
+        if self._buffer:
+            # Every column is built before any is written
+            chunks = {name: np.stack([row[name] for row in self._buffer]).tobytes() for name in self.columns}
+            for name, chunk in chunks.items():
+                self._files[name].write(chunk)
+                self._files[name].flush()
+            self.meta['rows'] += len(self._buffer)
+            self._buffer = []
+            self._write_meta()
+        self._last_flush = monotonic()
+
+    def close(self):
+        """ Write the remaining rows and mark the scan closed """
+        if self._files is None:
+            return
+        self.flush()
+        for file in self._files.values():
+            file.close()
+        self._files = None
+        self.meta['closed'] = True
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump(self.meta, file, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+
+def load_meta(path):
+    """ meta.json of the scan at path: columns, rows written so far, closed and attrs """
+    with open(os.path.join(path, META_FILE), 'r') as file:
+        return json.load(file)
+
+
+def read_scan(path):
+    """
+    Map every column of the scan at path read-only, without copying, as {name: array} with
+    one row per point. A running scan is mapped up to the rows written so far; call again
+    to see more.
+    """
+    meta = load_meta(path)
+    rows = meta['rows']
+    columns = {}
+    for name, column in meta['columns'].items():
+        shape = (rows, *column['shape'])
+        dtype = np.dtype(column['dtype'])
+        if rows == 0:
+            columns[name] = np.empty(shape, dtype)  # a file cannot be mapped with zero length
+        else:
+            columns[name] = np.memmap(os.path.join(path, f'{name}.bin'), dtype, 'r', shape=shape)
+    return columns
@@ -0,0 +1,281 @@
+from collections import deque
+from time import monotonic, sleep
+import logging
+import struct
+
+from instruments.xystage.config import load_constants
+from instruments.xystage.stepper_util import (
+    MotionProfile, BATCH_MAX, CMD_BATCH, CMD_HOME, CMD_MOVE, CMD_PROFILE, CMD_PROGRESS, CMD_SETPOS, CMD_STATUS,
+    CMD_TRIGGER, FLAG_INTERPOLATE, FLAG_TRIGGER, REPLY_DONE, REPLY_ERR, REPLY_PROGRESS, REPLY_TRIGGERED, SYNC,
+    decode_frame, encode_frame,
+)
+
+# Error codes sent in REPLY_ERR frames
+ERR_CHECKSUM = 1
+ERR_LENGTH = 2
+ERR_COMMAND = 3
+ERR_ARGS = 4
+
+
+class SimulatedArduino:
+    def __init__(self, constants=None, time_scale=1.0, start=None):
+        """
+        Stand-in for an Arduino running stepper_control.ino, with the parts of the
+        serial.Serial interface that Stepper uses.
+        Command frames run on a virtual timeline: each starts when the previous one finishes
+        (queued frames wait in the receive buffer, as on the real board) and each DONE
+        frame becomes readable once its motion would have finished. Motion times follow
+        the same ramp table as the firmware, and serial transfer takes 10 bits per byte
+        at the configured baudrate. Triggered moves report when OPTO would have fired on a
+        simulated micros() clock that starts at zero when the simulator is created.
+        Once the host sets an interval with CMD_PROGRESS, moves report their position that often
+        while stepping; the position is interpolated in time along each axis, which is close
+        enough to the firmware's step count for following a move.
+        time_scale < 1 runs faster than real time, e.g. 0.01 for a 100x speed-up.
+        start is the initial (x, y) in millimeters from home, defaulting to the stage center.
+        Examples:
+        stepper = Stepper(simulate=True)
+        stepper.arduino = SimulatedArduino(time_scale=0.01)
+        """
+        if constants is None:
+            constants = load_constants()
+
+        self.name = 'SIMULATED'
+        self.port = 'SIMULATED'
+        self.is_open = True
+        self.timeout = 1
+        self.time_scale = time_scale
+
+        self.PWM = constants['stepper']['pwm']
+        self.PPR = constants['stepper']['ppr']
+        self.mm_per_rev = constants['stepper']['mm_per_rev']
+        self.rx_buffer = constants['stepper']['rx_buffer']
+        self._byte_time = 10 / constants['stepper']['baudrate']
+
+        # Same power-on profile as the firmware: a fixed PWM with no acceleration
+        self.profile = MotionProfile(500000 // self.PWM, 500000 // self.PWM, 0)
+
+        if start is None:
+            start = (constants['coordinates']['x_max'] / 2, constants['coordinates']['y_max'] / 2)
+        self.steps_x = int(start[0] / self.mm_per_rev * self.PPR)  # physical position in steps from home
+        self.steps_y = int(start[1] / self.mm_per_rev * self.PPR)
+        self.pos_x = 0  # the firmware's position count, which starts at 0 on power-up
+        self.pos_y = 0
+
+        # Trigger settings in microseconds, off until the host sends CMD_TRIGGER
+        self.settle_us = 0
+        self.pulse_us = 0
+        self.dwell_us = 0
+        self.progress_us = 0  # off until the host sends CMD_PROGRESS
+
+        self._rx = b''
+        self._created = monotonic()
+        self._busy_until = monotonic()
+        self._queued = deque()  # (start time, size) of commands waiting in the receive buffer
+        self._output = deque()  # (time readable, frame) replies
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def reset_input_buffer(self):
+        """ Discard replies that have already arrived """
+        now = monotonic()
+        while self._output and self._output[0][0] <= now:
+            self._output.popleft()
+
+    def reset_output_buffer(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        now = monotonic()
+        return sum(len(frame) for ready, frame in self._output if ready <= now)
+
+    def write(self, data):
+        """ Receive bytes and schedule every complete frame they contain """
+        now = monotonic()
+        arrival = now + len(data) * self._byte_time * self.time_scale
+
+        while self._queued and self._queued[0][0] <= now:
+            self._queued.popleft()
+        if sum(size for _, size in self._queued) + len(data) > self.rx_buffer:
+            logging.warning('Simulated Arduino receive buffer overflowed')
+
+        self._rx += data
+        while True:
+            try:
+                frame = decode_frame(self._rx)
+            except ValueError as e:
+                error = ERR_CHECKSUM if 'checksum' in str(e) else ERR_LENGTH
+                self._rx = self._rx[self._rx.find(bytes([SYNC])) + 1:]
+                self._reply(max(arrival, self._busy_until), [(0, self._error(error))])
+                continue
+            if frame is None:
+                break
+
+            frame_type, payload, consumed = frame
+            self._rx = self._rx[consumed:]
+            start = max(arrival, self._busy_until)
+            self._queued.append((start, consumed))
+            self._reply(start, self._execute(frame_type, payload))
+
+        return len(data)
+
+    def _reply(self, start, steps):
+        """
+        Queue the replies of a command's (seconds, reply) steps, run back to back from start.
+        reply may also be a function of the firmware's micros() when the step ends, or None for a
+        step that sends nothing.
+        """
+        for duration, reply in steps:
+            start += duration * self.time_scale
+            self._busy_until = start
+            if callable(reply):
+                reply = reply(int((start - self._created) / self.time_scale * 1e6) & 0xFFFFFFFF)
+            if reply is not None:
+                self._output.append((start + len(reply) * self._byte_time * self.time_scale, reply))
+
+    def read(self, size=1):
+        """ Return up to size bytes of replies, waiting up to timeout seconds for them """
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        data = b''
+        while len(data) < size:
+            now = monotonic()
+            if self._output and self._output[0][0] <= now:
+                ready, frame = self._output.popleft()
+                taken = size - len(data)
+                data += frame[:taken]
+                if len(frame) > taken:
+                    self._output.appendleft((ready, frame[taken:]))
+                continue
+
+            wait = self._output[0][0] - now if self._output else 0.1
+            if deadline is not None:
+                if deadline <= now:
+                    break
+                wait = min(wait, deadline - now)
+            sleep(wait)
+        return data
+
+    def _done(self):
+        return encode_frame(REPLY_DONE, struct.pack('<ii', self.pos_x, self.pos_y))
+
+    def _finish(self, motion, trigger):
+        """
+        (seconds, reply) steps of a move and its acknowledgement, as finishMove() in the firmware.
+        motion is the move's steps from _move, ending when stepping does.
+        """
+        motion, (duration, _) = motion[:-1], motion[-1]
+        if not trigger:
+            return motion + [(duration, self._done())]
+        # The position is bound now, since later moves of the batch change it before the reply is built
+        x, y, pulse_us = self.pos_x, self.pos_y, self.pulse_us
+
+        def triggered(pulse_end_us):
+            fired_us = (pulse_end_us - pulse_us) & 0xFFFFFFFF
+            return encode_frame(REPLY_TRIGGERED, struct.pack('<iiI', x, y, fired_us))
+
+        return motion + [
+            (duration + 1e-6 * self.settle_us, None),
+            (1e-6 * pulse_us, triggered),
+            (1e-6 * self.dwell_us, None),
+        ]
+
+    def _error(self, code):
+        return encode_frame(REPLY_ERR, bytes([code]))
+
+    def _move(self, nPulsesX, nPulsesY, interpolate):
+        """
+        Run one move as the firmware would, returning its (seconds, reply) steps: a PROGRESS
+        frame every progress_us, then the rest of the motion with no reply.
+        """
+        from_x, from_y = self.pos_x, self.pos_y
+        self.steps_x -= nPulsesX
+        self.steps_y -= nPulsesY
+        self.pos_x -= nPulsesX
+        self.pos_y -= nPulsesY
+        if interpolate:
+            duration = time_x = time_y = self.profile.pulses_time(max(abs(nPulsesX), abs(nPulsesY)))
+            start_y = 0.0
+        else:
+            time_x = self.profile.pulses_time(nPulsesX)
+            time_y = self.profile.pulses_time(nPulsesY)
+            duration = start_y = time_x
+            duration += time_y
+
+        steps = []
+        interval = 1e-6 * self.progress_us
+        elapsed = interval
+        while interval and elapsed < duration:
+            done_x = min(elapsed / time_x, 1.0) if time_x else 1.0
+            done_y = min(max(elapsed - start_y, 0.0) / time_y, 1.0) if time_y else 1.0
+            live = struct.pack('<ii', from_x - round(done_x * nPulsesX), from_y - round(done_y * nPulsesY))
+            steps.append((interval, encode_frame(REPLY_PROGRESS, live)))
+            elapsed += interval
+        return steps + [(duration - interval * len(steps), None)]
+
+    def _execute(self, frame_type, payload):
+        """ Run one command frame as the firmware would, returning its (seconds, reply) steps """
+        if frame_type == CMD_MOVE:
+            if len(payload) != 9:
+                return [(0, self._error(ERR_ARGS))]
+            flags, nPulsesX, nPulsesY = struct.unpack('<Bii', payload)
+            return self._finish(self._move(nPulsesX, nPulsesY, flags & FLAG_INTERPOLATE), flags & FLAG_TRIGGER)
+
+        if frame_type == CMD_BATCH:
+            if len(payload) < 2 or payload[1] > BATCH_MAX or len(payload) != 2 + 8 * payload[1]:
+                return [(0, self._error(ERR_ARGS))]
+            interpolate = payload[0] & FLAG_INTERPOLATE
+            steps = []
+            for nPulsesX, nPulsesY in struct.iter_unpack('<ii', payload[2:]):
+                steps += self._finish(self._move(nPulsesX, nPulsesY, interpolate), payload[0] & FLAG_TRIGGER)
+            return steps
+
+        if frame_type == CMD_HOME:
+            if len(payload) != 12:
+                return [(0, self._error(ERR_ARGS))]
+            fast_pps, slow_pps, backoff = struct.unpack('<IIi', payload)
+            if fast_pps == 0 or slow_pps == 0 or backoff < 0:
+                return [(0, self._error(ERR_ARGS))]
+            # Both axes home at once, so the farther one sets the time
+            steps = max(abs(self.steps_x), abs(self.steps_y))
+            self.steps_x = 0
+            self.steps_y = 0
+            self.pos_x = 0
+            self.pos_y = 0
+            return [(self.profile.homing_time(steps, fast_pps, slow_pps, backoff), self._done())]
+
+        if frame_type == CMD_PROFILE:
+            if len(payload) != 12:
+                return [(0, self._error(ERR_ARGS))]
+            start_pps, max_pps, accel_pps2 = struct.unpack('<iii', payload)
+            if start_pps <= 0 or max_pps < start_pps or accel_pps2 < 0:
+                return [(0, self._error(ERR_ARGS))]
+            self.profile = MotionProfile(start_pps, max_pps, accel_pps2)
+            return [(0, self._done())]
+
+        if frame_type == CMD_STATUS:
+            return [(0, self._done())]
+
+        if frame_type == CMD_SETPOS:
+            if len(payload) != 8:
+                return [(0, self._error(ERR_ARGS))]
+            self.pos_x, self.pos_y = struct.unpack('<ii', payload)
+            return [(0, self._done())]
+
+        if frame_type == CMD_TRIGGER:
+            if len(payload) != 12:
+                return [(0, self._error(ERR_ARGS))]
+            self.settle_us, self.pulse_us, self.dwell_us = struct.unpack('<III', payload)
+            return [(0, self._done())]
+
+        if frame_type == CMD_PROGRESS:
+            if len(payload) != 4:
+                return [(0, self._error(ERR_ARGS))]
+            self.progress_us, = struct.unpack('<I', payload)
+            return [(0, self._done())]
+
+        return [(0, self._error(ERR_COMMAND))]
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def spot_threshold(image, sigma=5.0):
+    """
+    Brightness above which a pixel of the grayscale image belongs to a spot: the background
+    level (median) plus sigma times the background noise (from the median absolute deviation),
+    and at least one grey level above the background. Suits a few bright spots on a dark image.
+    """
+    sample = np.asarray(image, dtype=np.float32)
+    # Every 4th pixel of every 4th row estimates the background as well as all of them
+    sample = sample[::4, ::4] if sample.size > 1 << 20 else sample
+    background = float(np.median(sample))
+    noise = 1.4826 * float(np.median(np.abs(sample - background)))
+    return background + max(sigma * noise, 1.0)
+
+
+def label_components(mask):
+    """
+    Label the 8-connected regions of a boolean image, with NumPy only.
+    Returns (labels, count): labels is an int array shaped like mask, 0 for background and
+    1 to count for the regions, numbered in order of their first pixel in raster order.
+    Horizontal runs of set pixels are joined where they touch in the next row, by min-label
+    propagation with pointer jumping, which needs few passes even for large regions.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    height, width = mask.shape
+    if not mask.any():
+        return np.zeros(mask.shape, dtype=np.int32), 0
+
+    # Number the runs: a run starts at every set pixel whose left neighbour is clear
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    run = np.cumsum(starts.ravel()).reshape(mask.shape) - 1
+    run[~mask] = -1
+    n_runs = int(starts.sum())
+
+    # Runs touching in the next row, straight down or diagonally
+    below = mask[:-1] & mask[1:]
+    down_right = mask[:-1, :-1] & mask[1:, 1:]
+    down_left = mask[:-1, 1:] & mask[1:, :-1]
+    a = np.concatenate([run[:-1][below], run[:-1, :-1][down_right], run[:-1, 1:][down_left]])
+    b = np.concatenate([run[1:][below], run[1:, 1:][down_right], run[1:, :-1][down_left]])
+
+    parent = np.arange(n_runs)
+    while True:
+        # Hook the root of each touching pair onto the lower of the two
+        root_a, root_b = parent[a], parent[b]
+        low = np.minimum(root_a, root_b)
+        previous = parent.copy()
+        np.minimum.at(parent, root_a, low)
+        np.minimum.at(parent, root_b, low)
+        # Point every run at its root
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+        if np.array_equal(parent, previous):
+            break
+
+    # Roots are the lowest run of each region, so regions keep raster order
+    roots, component = np.unique(parent, return_inverse=True)
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    labels[mask] = component[run[mask]] + 1
+    return labels, len(roots)
+
+
+def detect_spots(image, threshold=None, sigma=5.0, min_area=2, max_area=None):
+    """
+    Centroids (n, 2) of the bright spots in a grayscale image, as (column, row) in pixels
+    with (0, 0) the center of the top-left pixel, in raster order of the spots.
+    Pixels above threshold (by default spot_threshold(image, sigma)) form the spots; each
+    centroid is weighted by the pixels' brightness above the threshold. Spots of fewer than
+    min_area or more than max_area pixels are dropped.
+    Examples:
+    centroids = detect_spots(image)
+    centroids = detect_spots(image, threshold=128, min_area=4)
+    """
+    image = np.asarray(image, dtype=np.float32)
+    if threshold is None:
+        threshold = spot_threshold(image, sigma)
+    mask = image > threshold
+    labels, count = label_components(mask)
+    if not count:
+        return np.empty((0, 2))
+
+    rows, columns = np.nonzero(mask)
+    spot = labels[rows, columns]
+    weight = image[rows, columns] - threshold
+    total = np.bincount(spot, weight, count + 1)[1:]
+    centroids = np.column_stack([
+        np.bincount(spot, weight * columns, count + 1)[1:] / total,
+        np.bincount(spot, weight * rows, count + 1)[1:] / total,
+    ])
+
+    area = np.bincount(spot, minlength=count + 1)[1:]
+    keep = area >= min_area
+    if max_area is not None:
+        keep &= area <= max_area
+    return centroids[keep]
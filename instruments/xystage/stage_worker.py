@@ -0,0 +1,127 @@
+import asyncio
+from contextlib import aclosing
+import logging
+import os
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from instruments.xystage.stepper_util import StallError
+
+METRICS_FILE = 'moves.json'
+
+
+class StageWorker(QThread):
+    """
+    Drives the stage through an AsyncStepper on a worker thread so the window never blocks.
+    With session=None the stage is homed, otherwise the points of session (a ScanSession) are
+    visited in order and each one reached is recorded in it. If the scan is triggered, the firmware
+    triggers acquisition at each point and the time it fired is logged. The session is closed
+    when the scan ends, and the scan's move timings (Stepper.metrics) are saved next to its
+    results as moves.json. With verify=True, as when resuming a journaled scan, the stage
+    position is checked against the firmware first and the stage is homed if they disagree.
+    note, such as the time saved by planning the scan path, is added to each point's status.
+    position carries the stage's (x, y) in millimeters from the firmware's progress reports
+    while a move is under way.
+    """
+    status = pyqtSignal(str)
+    moved = pyqtSignal()
+    position = pyqtSignal(float, float)
+
+    def __init__(self, stage, session=None, verify=False, note=None, parent=None):
+        super(StageWorker, self).__init__(parent)
+        self.stage = stage
+        self.session = session
+        self.verify = verify
+        self.note = note
+        self._cancelled = False
+        self._loop = None
+        self._task = None
+
+    def run(self):
+        # Called on the serial thread; the signal carries it to the window's thread
+        self.stage.stepper.on_progress = self.position.emit
+        try:
+            asyncio.run(self._run())
+        finally:
+            self.stage.stepper.on_progress = None
+            if self.session is not None:
+                self.session.close()
+                if len(self.stage.stepper.metrics):
+                    self.stage.stepper.metrics.save(os.path.join(self.session.path, METRICS_FILE))
+
+    def cancel(self):
+        """
+        Stop after the move in progress; moves not yet sent are dropped.
+        """
+        self._cancelled = True
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        try:
+            if self.session is None:
+                await self._home()
+            else:
+                await self._scan()
+        except asyncio.CancelledError:
+            self.status.emit('Stage motion stopped.')
+        except StallError:
+            self.status.emit('Stage stopped moving. Check the stage and Home Stage.')
+        except TimeoutError:
+            self.status.emit('Stage did not respond. Check connection and Home Stage.')
+        except RuntimeError as e:
+            # Rejected command or lost position; the stage must not carry on
+            logging.error(f'Stage motion failed: {e}')
+            self.status.emit(f'{e}')
+
+    async def _home(self):
+        self.status.emit('Stage is going home...')
+        await self.stage.gohome()
+        self.status.emit('Stage homed.')
+        self.moved.emit()
+
+    async def _scan(self):
+        session = self.session
+        if not session.points:
+            return
+
+        if self.verify:
+            self.status.emit('Verifying stage position...')
+            if not await self.stage.verify_position():
+                logging.info('Stage position not verified; homing before resuming the scan')
+                await self._home()
+
+        # Moves are streamed ahead of the stage, so announce each point as the previous one is reached
+        # Stepper.metrics then describes this scan alone
+        self.stage.stepper.metrics.reset()
+        self.status.emit(self._moving_text(0))
+        moves = self.stage.move_through(session.targets(), trigger=session.trigger)
+        async with aclosing(moves):
+            async for i, x, y, *fired in moves:
+                self.moved.emit()
+                print(f'Moved to ({x:0.3f}, {y:0.3f})')
+                if fired:
+                    logging.info(f'Point {session.points[i][0]} triggered at {fired[0]:0.6f} ({x:0.3f}, {y:0.3f})')
+                session.record(i, x, y, *fired)
+
+                if self._cancelled:
+                    raise asyncio.CancelledError
+                if i + 1 < len(session.points):
+                    self.status.emit(self._moving_text(i + 1))
+
+        if self.stage.current_x is None or self.stage.current_y is None:
+            self.status.emit('Please home stage before taking a scan.')
+            return
+
+        session.finish()
+        throughput = self.stage.stepper.metrics.summary()['throughput']
+        logging.info(f"Scan moves: {throughput['moves_per_s']:0.2f} moves/s, {throughput['mm_per_s']:0.1f} mm/s, "
+                     f"{100 * throughput['motion_fraction']:0.0f}% of the time in motion")
+        self.status.emit('Scanning complete.')
+
+    def _moving_text(self, i):
+        k, scan_x, scan_y = self.session.points[i]
+        text = f'Moving to Point {k}: (X: {scan_x:0.3f}, Y: {scan_y:0.3f})'
+        return text if self.note is None else f'{text} ({self.note})'
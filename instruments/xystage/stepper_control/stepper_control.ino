@@ -8,21 +8,77 @@
 #define stepPinY 3
 #define limitPinY A5
 
-// Define OPTO pin
+// Define OPTO pin, which idles HIGH and is pulsed LOW to trigger acquisition
 #define OPTO 7
 
-String tempString = "temp";
-
 int PWM = 70;   // Delay between pin on and off, in microseconds
-int PPR = 1600;  // Pulses per revolution, set using switches on driver
 
-// Initiate variables for X revolutions and pulses
-int revX = 0;
-int modX = 0;
+// Binary serial protocol, mirrored by the codec in stepper_util.py:
+//   frame = SYNC, length, type, payload[length - 1], crc8(length, type, payload)
+// Multi-byte values are little-endian; step counts are signed 32-bit pulses,
+// positive towards home.
+#define SYNC 0xA5
+#define CMD_MOVE 0x01     // flags, stepsX, stepsY
+#define CMD_HOME 0x02     // fastPps, slowPps, backoffSteps (unsigned 32-bit)
+#define CMD_PROFILE 0x03  // startPps, maxPps, accelPps2 (unsigned 32-bit)
+#define CMD_STATUS 0x04   // no payload
+#define CMD_BATCH 0x05    // flags, count, count * (stepsX, stepsY)
+#define CMD_SETPOS 0x06   // posX, posY, restored by the host after a reset
+#define CMD_TRIGGER 0x07  // settleUs, pulseUs, dwellUs (unsigned 32-bit)
+#define CMD_PROGRESS 0x08  // intervalUs (unsigned 32-bit), 0 to stop progress reports
+#define REPLY_DONE 0x80   // posX, posY after each move or command
+#define REPLY_ERR 0x81    // error code
+#define REPLY_TRIGGERED 0x82  // posX, posY, micros() when OPTO fired, instead of DONE for triggered moves
+#define REPLY_PROGRESS 0x83  // posX, posY reached so far, while a move is stepping
+#define ERR_CHECKSUM 1
+#define ERR_LENGTH 2
+#define ERR_COMMAND 3
+#define ERR_ARGS 4
+#define FLAG_INTERPOLATE 0x01
+#define FLAG_TRIGGER 0x02  // pulse OPTO after each move
+#define MAX_FRAME 59  // largest length byte: a full batch, 3 + 8 * BATCH_MAX, so its 62 byte frame fits the 63 bytes the receive buffer holds
+#define BATCH_MAX 7
+
+byte frame[MAX_FRAME];
+
+// Steps of the current move and the position in steps from home
+long stepsX = 0;
+long stepsY = 0;
+long posX = 0;
+long posY = 0;
+
+// Position while a move is stepping, reported every progressUs (set by the
+// host with CMD_PROGRESS) so the host can follow long moves and notice stalls
+long liveX = 0;
+long liveY = 0;
+int stepDirX = 0;  // change of liveX, liveY per step
+int stepDirY = 0;
+unsigned long progressUs = 0;
+unsigned long lastProgress = 0;
 
-// Initiate variables for Y revolutions and pulses
-int revY = 0;
-int modY = 0;
+// Step both axes together (Bresenham interpolation) instead of X then Y
+bool interpolate = false;
+
+// Acquisition trigger, set by the host with CMD_TRIGGER. After each move of a
+// triggered frame the stage settles for settleUs, OPTO is pulsed for pulseUs,
+// and the next move waits dwellUs while the instrument acquires.
+bool trigger = false;
+unsigned long settleUs = 0;
+unsigned long pulseUs = 0;
+unsigned long dwellUs = 0;
+
+// Trapezoidal speed profile, set by the host with CMD_PROFILE.
+// rampHalf[j] is the half-period (microseconds) used while the axis is between
+// j * RAMP_SEGMENT and (j + 1) * RAMP_SEGMENT steps from either end of the move;
+// the last entry is the cruise half-period. The defaults reproduce a fixed PWM.
+// stepper_util.MotionProfile computes the same table to predict move times.
+#define RAMP_SEGMENT 16
+#define RAMP_MAX 256
+unsigned int rampHalf[RAMP_MAX];
+int rampLen = 1;
+unsigned long startPps = 500000UL / PWM;
+unsigned long maxPps = 500000UL / PWM;
+unsigned long accelPps2 = 0;
 
 void setup() {
   // Declare the X pins as output:
@@ -43,127 +99,454 @@ void setup() {
   digitalWrite(dirPinY, HIGH);
   digitalWrite(OPTO, HIGH);
 
+  buildRamp();
+
   Serial.begin(115200);
+  Serial.setTimeout(20);  // a frame's bytes arrive back to back
 }
 
-void checkLimit() {
-  // Function to check limit switches and stop motor at maximum position
+unsigned long isqrt(unsigned long n) {
+  // Function to compute floor(sqrt(n)) with integer arithmetic only
 
-  digitalWrite(dirPinX, HIGH);
-  while (analogRead(limitPinX) != 1023) {
-    digitalWrite(stepPinX, HIGH);
-    delayMicroseconds(PWM);
-    digitalWrite(stepPinX, LOW);
-    delayMicroseconds(PWM);
+  unsigned long root = 0;
+  unsigned long bit = 1UL << 30;
+  while (bit > n) {
+    bit >>= 2;
+  }
+  while (bit != 0) {
+    if (n >= root + bit) {
+      n -= root + bit;
+      root = (root >> 1) + bit;
+    } else {
+      root >>= 1;
+    }
+    bit >>= 2;
+  }
+  return root;
+}
+
+void buildRamp() {
+  // Function to fill rampHalf from startPps, maxPps and accelPps2
+
+  unsigned int minHalf = 500000UL / maxPps;
+  rampLen = RAMP_MAX;
+  for (int j = 0; j < RAMP_MAX; j++) {
+    unsigned long pps = isqrt(startPps * startPps + 2UL * accelPps2 * j * RAMP_SEGMENT);
+    unsigned int half = 500000UL / pps;
+    if (half <= minHalf) {
+      rampHalf[j] = minHalf;
+      rampLen = j + 1;
+      break;
+    }
+    rampHalf[j] = half;
   }
+}
+
+unsigned int stepHalf(long k, long n) {
+  // Function to look up the half-period of step k of an n step move
+
+  long d = min(k, n - 1 - k);
+  long j = min(d / RAMP_SEGMENT, (long)rampLen - 1);
+  return rampHalf[j];
+}
+
+void waitMicros(unsigned long us) {
+  // Function to busy-wait for us microseconds; delayMicroseconds is only
+  // accurate up to about 16 ms
+
+  unsigned long start = micros();
+  while (micros() - start < us) {
+    continue;
+  }
+}
+
+bool atLimit(int limitPin) {
+  // Function to read a limit switch. A digital read takes a few microseconds,
+  // where analogRead takes about 100.
+
+  return digitalRead(limitPin) == HIGH;
+}
 
+void approachLimits(unsigned int minHalf) {
+  // Function to step both axes towards their limit switches at the same time,
+  // each stopping at its own switch. Speed follows the acceleration profile
+  // up to the half-period minHalf.
+
+  digitalWrite(dirPinX, HIGH);
   digitalWrite(dirPinY, HIGH);
-  while (analogRead(limitPinY) != 1023) {
-    digitalWrite(stepPinY, HIGH);
-    delayMicroseconds(PWM);
-    digitalWrite(stepPinY, LOW);
-    delayMicroseconds(PWM);
+  bool doneX = atLimit(limitPinX);
+  bool doneY = atLimit(limitPinY);
+  for (long k = 0; !(doneX && doneY); k++) {
+    long j = min(k / RAMP_SEGMENT, (long)rampLen - 1);
+    stepPins(!doneX, !doneY, max(rampHalf[j], minHalf));
+    doneX = doneX || atLimit(limitPinX);
+    doneY = doneY || atLimit(limitPinY);
   }
 }
 
-void moveTo() {
-  // Function to move the stepper motors based on received commands
+void backOff(long steps, unsigned int half) {
+  // Function to step both axes away from their limit switches
 
-  readMove();
+  digitalWrite(dirPinX, LOW);
+  digitalWrite(dirPinY, LOW);
+  for (long k = 0; k < steps; k++) {
+    stepPins(true, true, half);
+  }
+}
+
+void checkLimit(unsigned long fastPps, unsigned long slowPps, long backoffSteps) {
+  // Function to home both axes together: a fast approach to the limit
+  // switches, a back-off, then a slow approach so the switches are met at the
+  // same speed every time
+
+  unsigned int slowHalf = 500000UL / slowPps;
+  approachLimits(500000UL / fastPps);
+  backOff(backoffSteps, slowHalf);
+  approachLimits(slowHalf);
+}
+
+void moveSteps() {
+  // Function to move the stepper motors by stepsX, stepsY
+
+  liveX = posX;
+  liveY = posY;
+  stepDirX = (stepsX > 0) ? -1 : 1;
+  stepDirY = (stepsY > 0) ? -1 : 1;
+  lastProgress = micros();
+  posX -= stepsX;
+  posY -= stepsY;
 
   // Set direction for X position
-  if (revX < 0 || modX < 0) {
+  if (stepsX < 0) {
     digitalWrite(dirPinX, LOW);
-    revX *= -1;
-    modX *= -1;
-  } else if (revX > 0 || modX > 0) {
+    stepsX *= -1;
+  } else if (stepsX > 0) {
     digitalWrite(dirPinX, HIGH);
   }
 
   // Set direction for Y position
-  if (revY < 0 || modY < 0) {
+  if (stepsY < 0) {
     digitalWrite(dirPinY, LOW);
-    revY *= -1;
-    modY *= -1;
-  } else if (revY > 0 || modY > 0) {
+    stepsY *= -1;
+  } else if (stepsY > 0) {
     digitalWrite(dirPinY, HIGH);
   }
 
-  // Move X axis
-  while (revX != 0) {
-    int i = PPR;
-    while (i != 0) {
-      digitalWrite(stepPinX, HIGH);
-      delayMicroseconds(PWM);
-      digitalWrite(stepPinX, LOW);
-      delayMicroseconds(PWM);
-      i -= 1;
+  if (interpolate) {
+    moveInterpolated();
+    return;
+  }
+
+  // Move X axis, then Y axis
+  stepAxis(stepPinX, stepsX);
+  stepAxis(stepPinY, stepsY);
+}
+
+void stepAxis(int stepPin, long steps) {
+  // Function to step one axis through the speed profile
+
+  for (long k = 0; k < steps; k++) {
+    unsigned int half = stepHalf(k, steps);
+    digitalWrite(stepPin, HIGH);
+    delayMicroseconds(half);
+    digitalWrite(stepPin, LOW);
+    delayMicroseconds(half);
+    countSteps(stepPin == stepPinX, stepPin == stepPinY);
+  }
+}
+
+void countSteps(bool stepX, bool stepY) {
+  // Function to follow the position through a move, reporting it at most
+  // once every progressUs. The reply fits the serial transmit buffer, so
+  // sending it does not hold up stepping.
+
+  if (stepX) liveX += stepDirX;
+  if (stepY) liveY += stepDirY;
+  if (progressUs != 0 && micros() - lastProgress >= progressUs) {
+    lastProgress = micros();
+    sendProgress();
+  }
+}
+
+void stepPins(bool stepX, bool stepY, unsigned int half) {
+  // Function to send one pulse to each selected axis at the same time
+
+  if (stepX) digitalWrite(stepPinX, HIGH);
+  if (stepY) digitalWrite(stepPinY, HIGH);
+  delayMicroseconds(half);
+  digitalWrite(stepPinX, LOW);
+  digitalWrite(stepPinY, LOW);
+  delayMicroseconds(half);
+}
+
+void moveInterpolated() {
+  // Function to step both axes simultaneously along a straight line.
+  // The longer axis steps every pulse and the shorter axis is spread evenly
+  // over the move, so the move takes max(|dx|, |dy|) pulses, following the
+  // speed profile of the longer axis.
+
+  long major = max(stepsX, stepsY);
+  long errX = major / 2;
+  long errY = major / 2;
+
+  for (long i = 0; i < major; i++) {
+    bool stepX = false;
+    bool stepY = false;
+
+    errX -= stepsX;
+    if (errX < 0) {
+      errX += major;
+      stepX = true;
     }
-    revX -= 1;
-  }
-  while (modX != 0) {
-    digitalWrite(stepPinX, HIGH);
-    delayMicroseconds(PWM);
-    digitalWrite(stepPinX, LOW);
-    delayMicroseconds(PWM);
-    modX -= 1;
-  }
-
-  // Move Y axis
-  while (revY != 0) {
-    int i = PPR;
-    while (i != 0) {
-      digitalWrite(stepPinY, HIGH);
-      delayMicroseconds(PWM);
-      digitalWrite(stepPinY, LOW);
-      delayMicroseconds(PWM);
-      i -= 1;
+    errY -= stepsY;
+    if (errY < 0) {
+      errY += major;
+      stepY = true;
+    }
+    stepPins(stepX, stepY, stepHalf(i, major));
+    countSteps(stepX, stepY);
+  }
+}
+
+byte crc8(byte length, byte *data, int n) {
+  // Function to compute the CRC-8 (polynomial 0x07) of the length byte and data
+
+  byte crc = 0;
+  for (int i = -1; i < n; i++) {
+    crc ^= (i < 0) ? length : data[i];
+    for (int b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : (crc << 1);
     }
-    revY -= 1;
   }
-  while (modY != 0) {
-    digitalWrite(stepPinY, HIGH);
-    delayMicroseconds(PWM);
-    digitalWrite(stepPinY, LOW);
-    delayMicroseconds(PWM);
-    modY -= 1;
+  return crc;
+}
+
+long readLong(int i) {
+  // Function to decode a little-endian 32-bit value from the frame
+
+  return (long)((unsigned long)frame[i]
+                | ((unsigned long)frame[i + 1] << 8)
+                | ((unsigned long)frame[i + 2] << 16)
+                | ((unsigned long)frame[i + 3] << 24));
+}
+
+void writeLong(byte *out, long value) {
+  // Function to encode a little-endian 32-bit value
+
+  for (int i = 0; i < 4; i++) {
+    out[i] = (value >> (8 * i)) & 0xFF;
+  }
+}
+
+void sendFrame(byte type, byte *payload, int n) {
+  // Function to send one reply frame to the host
+
+  byte body[13];
+  body[0] = type;
+  for (int i = 0; i < n; i++) {
+    body[i + 1] = payload[i];
+  }
+  Serial.write(SYNC);
+  Serial.write((byte)(n + 1));
+  Serial.write(body, n + 1);
+  Serial.write(crc8(n + 1, body, n + 1));
+}
+
+void sendDone() {
+  // Function to acknowledge a finished command with the current position
+
+  byte payload[8];
+  writeLong(payload, posX);
+  writeLong(payload + 4, posY);
+  sendFrame(REPLY_DONE, payload, 8);
+}
+
+void sendProgress() {
+  // Function to report the position reached so far in a move
+
+  byte payload[8];
+  writeLong(payload, liveX);
+  writeLong(payload + 4, liveY);
+  sendFrame(REPLY_PROGRESS, payload, 8);
+}
+
+void sendTriggered(unsigned long firedAt) {
+  // Function to acknowledge a finished move with the position and when OPTO fired
+
+  byte payload[12];
+  writeLong(payload, posX);
+  writeLong(payload + 4, posY);
+  writeLong(payload + 8, (long)firedAt);
+  sendFrame(REPLY_TRIGGERED, payload, 12);
+}
+
+void finishMove() {
+  // Function to acknowledge a move, first triggering acquisition if requested.
+  // The reply goes out before the dwell, so the host learns the position while
+  // the instrument is still acquiring.
+
+  if (!trigger) {
+    sendDone();
+    return;
   }
+  waitMicros(settleUs);
+  unsigned long firedAt = micros();
+  digitalWrite(OPTO, LOW);
+  waitMicros(pulseUs);
+  digitalWrite(OPTO, HIGH);
+  sendTriggered(firedAt);
+  waitMicros(dwellUs);
 }
 
-void readMove() {
-  // Function to read and parse movement commands from serial
+void sendError(byte code) {
+  // Function to reject a command
 
-  while (Serial.available() == 0) {
-    continue;  // Wait for serial input
+  sendFrame(REPLY_ERR, &code, 1);
+}
+
+int readFrame() {
+  // Function to read one command frame into frame[].
+  // Returns its length, or -1 after replying with an error.
+
+  // Wait for the start of a frame, skipping anything else
+  while (true) {
+    while (Serial.available() == 0) {
+      continue;  // Wait for serial input
+    }
+    if (Serial.read() == SYNC) {
+      break;
+    }
   }
-  delayMicroseconds(1000);
-  tempString = Serial.readStringUntil('\n');
 
-  if (tempString == "HOME") {
-    checkLimit();  // If command is HOME, execute homing procedure
-    Serial.println(String("HOME"));
-  } else {
-    int spaceIndex = tempString.indexOf(' ');
-    if (spaceIndex != -1) {
-      String x_str = tempString.substring(0, spaceIndex);
-      String y_str = tempString.substring(spaceIndex + 1);
+  byte length;
+  if (Serial.readBytes(&length, 1) != 1 || length == 0 || length > MAX_FRAME) {
+    sendError(ERR_LENGTH);
+    return -1;
+  }
+  if (Serial.readBytes(frame, length) != length) {
+    sendError(ERR_LENGTH);
+    return -1;
+  }
+  byte crc;
+  if (Serial.readBytes(&crc, 1) != 1 || crc != crc8(length, frame, length)) {
+    sendError(ERR_CHECKSUM);
+    return -1;
+  }
+  return length;
+}
+
+void handleFrame(int length) {
+  // Function to execute a command frame and acknowledge it
 
-      int commaIndexX = x_str.indexOf(',');
-      revX = x_str.substring(0, commaIndexX).toInt();
-      modX = x_str.substring(commaIndexX + 1).toInt();
+  switch (frame[0]) {
+    case CMD_MOVE:
+      if (length != 10) {
+        sendError(ERR_ARGS);
+        return;
+      }
+      interpolate = frame[1] & FLAG_INTERPOLATE;
+      trigger = frame[1] & FLAG_TRIGGER;
+      stepsX = readLong(2);
+      stepsY = readLong(6);
+      moveSteps();
+      finishMove();
+      return;
 
-      int commaIndexY = y_str.indexOf(',');
-      revY = y_str.substring(0, commaIndexY).toInt();
-      modY = y_str.substring(commaIndexY + 1).toInt();
+    case CMD_BATCH: {
+      // Run every move back to back, acknowledging each one
+      int count = frame[2];
+      if (count > BATCH_MAX || length != 3 + 8 * count) {
+        sendError(ERR_ARGS);
+        return;
+      }
+      interpolate = frame[1] & FLAG_INTERPOLATE;
+      trigger = frame[1] & FLAG_TRIGGER;
+      for (int m = 0; m < count; m++) {
+        stepsX = readLong(3 + 8 * m);
+        stepsY = readLong(7 + 8 * m);
+        moveSteps();
+        finishMove();
+      }
+      return;
+    }
+
+    case CMD_HOME: {
+      unsigned long fastPps = readLong(1);
+      unsigned long slowPps = readLong(5);
+      long backoffSteps = readLong(9);
+      if (length != 13 || fastPps == 0 || slowPps == 0 || backoffSteps < 0) {
+        sendError(ERR_ARGS);
+        return;
+      }
+      checkLimit(fastPps, slowPps, backoffSteps);  // If command is HOME, execute homing procedure
+      posX = 0;
+      posY = 0;
+      sendDone();
+      return;
+    }
 
-      Serial.println(revX);
-      Serial.println(modX);
-      Serial.println(revY);
-      Serial.println(modY);
+    case CMD_PROFILE: {
+      long newStart = readLong(1);
+      long newMax = readLong(5);
+      long newAccel = readLong(9);
+      if (length != 13 || newStart <= 0 || newMax < newStart || newAccel < 0) {
+        sendError(ERR_ARGS);
+        return;
+      }
+      startPps = newStart;
+      maxPps = newMax;
+      accelPps2 = newAccel;
+      buildRamp();
+      sendDone();
+      return;
     }
+
+    case CMD_STATUS:
+      sendDone();
+      return;
+
+    case CMD_SETPOS:
+      if (length != 9) {
+        sendError(ERR_ARGS);
+        return;
+      }
+      posX = readLong(1);
+      posY = readLong(5);
+      sendDone();
+      return;
+
+    case CMD_TRIGGER:
+      if (length != 13) {
+        sendError(ERR_ARGS);
+        return;
+      }
+      settleUs = readLong(1);
+      pulseUs = readLong(5);
+      dwellUs = readLong(9);
+      sendDone();
+      return;
+
+    case CMD_PROGRESS:
+      if (length != 5) {
+        sendError(ERR_ARGS);
+        return;
+      }
+      progressUs = readLong(1);
+      sendDone();
+      return;
+
+    default:
+      sendError(ERR_COMMAND);
   }
 }
 
 void loop() {
-  moveTo();  // Continuously execute movement based on serial commands
+  // Continuously execute commands from serial and acknowledge each one once
+  // the motors have stopped. The host may stream several frames ahead; they
+  // wait in the serial receive buffer while the motors step and run back to
+  // back, one DONE per move.
+  int length = readFrame();
+  if (length > 0) {
+    handleFrame(length);
+  }
 }
@@ -1,42 +1,281 @@
 import serial
-import serial.tools.list_ports
-from time import sleep
+from time import monotonic, perf_counter, sleep, time
+from collections import deque
+import json
 import logging
 import os
-import yaml
+import math
+import struct
+import numpy as np
+
+from instruments.xystage.config import XY_DIR, configure_logging, load_constants
+from instruments.xystage.move_metrics import MoveMetrics
+
+# Binary serial protocol shared with stepper_control.ino:
+#   frame = SYNC, length, type, payload, crc8(length, type, payload)
+# length counts the type byte and payload. Multi-byte values are little-endian;
+# step counts are signed 32-bit pulses, positive towards home.
+SYNC = 0xA5
+CMD_MOVE = 0x01  # flags, stepsX, stepsY
+CMD_HOME = 0x02  # fastPps, slowPps, backoffSteps
+CMD_PROFILE = 0x03  # startPps, maxPps, accelPps2
+CMD_STATUS = 0x04
+CMD_BATCH = 0x05  # flags, count, count * (stepsX, stepsY)
+CMD_SETPOS = 0x06  # posX, posY in steps from home
+CMD_TRIGGER = 0x07  # settleUs, pulseUs, dwellUs
+CMD_PROGRESS = 0x08  # intervalUs, 0 to stop progress reports
+REPLY_DONE = 0x80  # posX, posY in steps from home
+REPLY_ERR = 0x81  # error code
+REPLY_TRIGGERED = 0x82  # posX, posY, firmware micros() when OPTO fired
+REPLY_PROGRESS = 0x83  # posX, posY reached so far, sent during long moves
+FLAG_INTERPOLATE = 0x01
+FLAG_TRIGGER = 0x02  # pulse OPTO after each move and reply TRIGGERED instead of DONE
+MAX_FRAME = 59  # largest length byte the firmware accepts, that of a full batch
+BATCH_MAX = 7  # moves per CMD_BATCH frame
+ERRORS = {1: 'bad checksum', 2: 'bad length', 3: 'unknown command', 4: 'bad arguments'}
+POSITION_RECORD = 128  # bytes of the saved position, rewritten in place before and after every move
+
+
+class StallError(TimeoutError):
+    """ A moving stage stopped sending progress reports """
+
+
+def crc8(data):
+    """ CRC-8 with polynomial 0x07, as computed by the firmware """
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def encode_frame(frame_type, payload=b''):
+    """ Wrap a command type and payload in a frame """
+    body = bytes([len(payload) + 1, frame_type]) + payload
+    return bytes([SYNC]) + body + bytes([crc8(body)])
+
+
+def move_flags(interpolate=False, trigger=False):
+    """ Flags byte of a move or batch frame """
+    return (FLAG_INTERPOLATE if interpolate else 0) | (FLAG_TRIGGER if trigger else 0)
+
+
+def encode_move(nPulsesX, nPulsesY, interpolate=False, trigger=False):
+    """ Frame for a single relative move """
+    return encode_frame(CMD_MOVE, struct.pack('<Bii', move_flags(interpolate, trigger), nPulsesX, nPulsesY))
+
+
+def encode_batch(moves, interpolate=False, trigger=False):
+    """ Frame for up to BATCH_MAX relative moves (nPulsesX, nPulsesY), run back to back """
+    if len(moves) > BATCH_MAX:
+        raise ValueError(f'At most {BATCH_MAX} moves fit in one batch')
+    flags = move_flags(interpolate, trigger)
+    payload = struct.pack('<BB', flags, len(moves)) + b''.join(struct.pack('<ii', x, y) for x, y in moves)
+    return encode_frame(CMD_BATCH, payload)
+
+
+def decode_frame(data):
+    """
+    Decode the first frame in data, skipping anything before SYNC.
+    Returns (frame_type, payload, bytes consumed), or None if the frame is not complete yet.
+    Raises ValueError for a bad length or checksum.
+    """
+    start = data.find(bytes([SYNC]))
+    if start == -1 or len(data) < start + 2:
+        return None
+    length = data[start + 1]
+    if length == 0 or length > MAX_FRAME:
+        raise ValueError('bad length')
+    end = start + 2 + length + 1
+    if len(data) < end:
+        return None
+    body = data[start + 1:end - 1]
+    if crc8(body) != data[end - 1]:
+        raise ValueError('bad checksum')
+    return body[1], bytes(body[2:]), end
+
+
+class MotionProfile:
+    """
+    Python twin of the firmware's trapezoidal speed profile.
+    Builds the same half-period table as buildRamp() in stepper_control.ino, with the same
+    integer arithmetic, so the commanded pulse timing of a move is reproduced exactly.
+    The times it gives are a lower bound on the real motion: the firmware's own work per step
+    (digitalWrite, micros() polling, progress reports) is not included. Stepper allows for
+    it in its timeouts with step_overhead_us.
+    """
+    SEGMENT = 16  # RAMP_SEGMENT in the firmware
+    MAX_SEGMENTS = 256  # RAMP_MAX in the firmware
+
+    def __init__(self, start_pps, max_pps, accel_pps2):
+        self.start_pps = int(start_pps)
+        self.max_pps = int(max(max_pps, start_pps))
+        self.accel_pps2 = int(accel_pps2)
+
+        # The firmware works in 32-bit unsigned longs
+        if self.start_pps ** 2 + 2 * self.accel_pps2 * self.MAX_SEGMENTS * self.SEGMENT >= 2 ** 32:
+            raise ValueError('Speed profile overflows the firmware ramp arithmetic; lower max_speed or acceleration.')
+
+        min_half = 500000 // self.max_pps
+        table = []
+        for j in range(self.MAX_SEGMENTS):
+            half = 500000 // math.isqrt(self.start_pps ** 2 + 2 * self.accel_pps2 * j * self.SEGMENT)
+            if half <= min_half:
+                table.append(min_half)
+                break
+            table.append(half)
+
+        self.ramp_half = np.array(table, dtype=np.int64)  # half-period (microseconds) per segment, last is cruise
+        self._ramp_sum = np.concatenate([[0], np.cumsum(self.ramp_half)])  # sum of the first j segments' half-periods
+
+    def command(self):
+        """ Frame that loads this profile into the firmware """
+        return encode_frame(CMD_PROFILE, struct.pack('<III', self.start_pps, self.max_pps, self.accel_pps2))
+
+    def _half_sum(self, m):
+        """ Sum of half-periods over steps 0..m-1 of an endless ramp """
+        S = self.SEGMENT
+        last = len(self.ramp_half) - 1
+        cruise_from = last * S
+
+        j = np.minimum(m // S, last)
+        ramp = S * self._ramp_sum[j] + (m % S) * self.ramp_half[j]
+        cruise = S * self._ramp_sum[last] + (m - cruise_from) * self.ramp_half[last]
+        return np.where(m <= cruise_from, ramp, cruise)
+
+    def approach_time(self, nPulses, pps):
+        """
+        Seconds for nPulses steps that accelerate along the ramp up to pps and never slow down,
+        as approachLimits() in the firmware runs towards the limit switches when homing.
+        """
+        half = np.maximum(self.ramp_half, 500000 // int(pps))
+        n = int(abs(nPulses))
+        j = min(n // self.SEGMENT, len(half) - 1)
+        return 2e-6 * float(self.SEGMENT * half[:j].sum() + (n - j * self.SEGMENT) * half[j])
+
+    def homing_time(self, nPulses, fast_pps, slow_pps, backoff):
+        """
+        Seconds the firmware takes to home an axis nPulses steps from its limit switch: a fast
+        approach, backoff steps away at slow_pps and a slow approach back to the switch.
+        """
+        return (self.approach_time(nPulses, fast_pps) + 2e-6 * backoff * (500000 // int(slow_pps))
+                + self.approach_time(backoff, slow_pps))
+
+    def pulses_time(self, nPulses):
+        """
+        Seconds the firmware spends on a move of nPulses steps on one axis.
+        The move ramps up and down symmetrically, so each step's speed depends on its distance to the nearer end.
+        Accepts scalars or arrays.
+        """
+        n = np.abs(np.asarray(nPulses, dtype=np.int64))
+        half = n // 2
+        middle = self.ramp_half[np.minimum(half // self.SEGMENT, len(self.ramp_half) - 1)]
+        total = 2 * self._half_sum(half) + (n % 2) * middle
+        seconds = 2e-6 * total
+        return float(seconds) if seconds.ndim == 0 else seconds
+
 
 class Stepper:
-    def __init__(self):
+    def __init__(self, simulate=None, time_scale=1.0, port=None):
         """ 
         Controls the stepper motor over serial to an Arduino.
+        With simulate=True (or stepper.simulate in hardware_constants.yaml) a SimulatedArduino
+        stands in for the hardware, running time_scale times real time.
+        With port, find_arduino connects to that serial port only, and the position is saved
+        per port, so several stages can be driven from one host.
         Examples:
         stepper = Stepper()
+        stepper = Stepper(simulate=True) # no hardware needed
+        stepper = Stepper(port='COM5') # one of several stages
         stepper.gohome()
         stepper.moveto(5) # moves x by 5
         stepper.moveto(x_pos=6) # moves x by 6
         stepper.moveto(y_pos=14.23) # moves y by 14.23
         stepper.moveto(3, 4) # moves x by 3 and y by 4
+        stepper.moveto(3, 4, interpolate=True) # moves x and y at the same time
+        for i, x, y in stepper.move_through([(1, 2), (3, 4)]): # streams moves back to back
+            print(i, x, y)
+        for i, x, y, fired in stepper.move_through([(1, 2), (3, 4)], trigger=True): # pulses OPTO at each point
+            print(i, x, y, fired)
+        stepper.on_progress = lambda x, y: print(x, y) # position during moves, called on the serial thread
+
+        The position is kept as integer steps from home (steps_x, steps_y); current_x and
+        current_y convert it to millimeters. It is saved to stage_position.json (or
+        stage_position_<port>.json) around every move so that restore_position() can resume a
+        later session without homing, when the user confirms the stage has not been moved.
+        Nothing checks that confirmation: opening the port resets the Arduino, so the firmware
+        cannot tell whether the saved position is still true.
+
+        Every move's phase timings are recorded in metrics (see MoveMetrics).
+
+        While a move steps, the firmware reports its position every progress_ms; each report
+        updates live_x, live_y and is passed to on_progress(x, y) in millimeters. If no report
+        arrives for stall_timeout while a move should still be running, the stage is taken to
+        have stalled and the move raises StallError (a TimeoutError) without waiting out its full duration.
         """
-        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        self._constants = load_constants()
 
-        self._constants_path = os.path.join(cur_dir, 'hardware_constants.yaml')
-        with open(self._constants_path, 'r') as file:
-            self._constants = yaml.safe_load(file)
-
-        logging.basicConfig(
-            filename = os.path.join(cur_dir, 'XYpy.log'),
-            level = logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        configure_logging()
         logging.info('class loaded')
 
-        self.polling_delay = self._constants['stepper']['polling_delay']  # Delay between receiving input from Arduino over Serial and when Python is ready to receive data 
-        self.current_x = None
-        self.current_y = None
+        self.ack_timeout = self._constants['stepper']['ack_timeout']  # Time allowed beyond the expected motion time for the Arduino to acknowledge a command
+        self.step_overhead = 1e-6 * self._constants['stepper']['step_overhead_us']  # Firmware time per step not in the speed profile
+        self.steps_x = None  # Position in steps from home, None until homed or restored
+        self.steps_y = None
+        self._moving = False  # A move was sent and not acknowledged, as last saved
+        self._unacked = None  # (pending, interpolate, trigger) of moves a failed command left on the Arduino
+        self.arduino = None
 
         self.PWM = self._constants['stepper']['pwm'] # duration of the pulses in the PWM signal
         self.PPR = self._constants['stepper']['ppr']  # Pulses per revolution
         self.mm_per_rev = self._constants['stepper']['mm_per_rev']  # Millimeters per revolution
+        self.seconds_per_mm = 2e-6 * self.PWM * self.PPR / self.mm_per_rev  # Travel time of one axis per millimeter
+        self.interpolate = self._constants['stepper'].get('interpolate', False)  # Step X and Y together instead of X then Y
+        self.rx_buffer = self._constants['stepper']['rx_buffer']  # Bytes of queued commands the Arduino can buffer while stepping
+        self._reply_times = (None, None)  # When the last acknowledgement started arriving and was decoded
+
+        # Acquisition trigger pulsed on OPTO after each move of a triggered scan, in microseconds
+        self.settle_us = int(self._constants['trigger']['settle_ms'] * 1000)
+        self.pulse_us = int(self._constants['trigger']['pulse_us'])
+        self.dwell_us = int(self._constants['trigger']['dwell_ms'] * 1000)
+        self._trigger_sent = False
+        self._fired_us = None  # Firmware micros() when OPTO fired for the last TRIGGERED reply
+
+        # Progress reports during moves
+        self.progress_us = int(self._constants['stepper']['progress_ms'] * 1000)
+        self.stall_timeout = self._constants['stepper']['stall_timeout']  # Longest silence from a moving stage
+        self.on_progress = None  # Called with (x, y) in millimeters for each progress report
+        self.live_steps = (None, None)  # Position in the last progress report, in steps from home
+
+        # Moves start and stop at the PWM rate and accelerate up to max_speed
+        pulses_per_mm = self.PPR / self.mm_per_rev
+        self.profile = MotionProfile(
+            500000 // self.PWM,
+            self._constants['stepper']['max_speed'] * pulses_per_mm,
+            self._constants['stepper']['acceleration'] * pulses_per_mm,
+        )
+        self._profile_sent = False
+
+        # Homing: a fast approach to the limit switches, a back-off and a slow approach
+        self.home_fast_pps = int(self._constants['stepper']['home_fast_speed'] * pulses_per_mm)
+        self.home_slow_pps = int(self._constants['stepper']['home_slow_speed'] * pulses_per_mm)
+        self.home_backoff = self.mm_to_steps(self._constants['stepper']['home_backoff'])
+        self.home_time = None  # Seconds the last homing took
+
+        if simulate is None:
+            simulate = self._constants['stepper'].get('simulate', False)
+        # A simulated stage must not overwrite the real stage's saved position
+        self.port = port
+        position_file = 'stage_position.json' if port is None else f'stage_position_{os.path.basename(port)}.json'
+        self._position_path = None if simulate else os.path.join(XY_DIR, position_file)
+        self._position_file = None  # Kept open while connected, so a save is one small write
+        self._port_cache_path = os.path.join(XY_DIR, 'arduino_port.txt')  # Last port the Arduino was found on
+        self.metrics = MoveMetrics(self._constants['stepper']['metrics_capacity'], time_scale if simulate else 1.0)
+        if simulate:
+            from instruments.xystage.simulated_arduino import SimulatedArduino
+            self.arduino = SimulatedArduino(self._constants, time_scale)
+            logging.info('Using simulated Arduino')
 
         # self.find_arduino()
 
@@ -44,20 +283,104 @@ class Stepper:
         #     logging.error("Aruino not found at any serial port.")
         #     raise RuntimeError("Arduino not found. Please check connection.")
         
+    @property
+    def current_x(self):
+        """ X position in millimeters, None until homed """
+        return None if self.steps_x is None else self.steps_to_mm(self.steps_x)
+
+    @property
+    def current_y(self):
+        """ Y position in millimeters, None until homed """
+        return None if self.steps_y is None else self.steps_to_mm(self.steps_y)
+
+    @property
+    def live_x(self):
+        """ X position in millimeters of the last progress report, None before the first """
+        return None if self.live_steps[0] is None else self.steps_to_mm(self.live_steps[0])
+
+    @property
+    def live_y(self):
+        """ Y position in millimeters of the last progress report, None before the first """
+        return None if self.live_steps[1] is None else self.steps_to_mm(self.live_steps[1])
+
+    def mm_to_steps(self, mm):
+        """ Convert millimeters to the nearest whole number of steps """
+        return int(round(mm / self.mm_per_rev * self.PPR))
+
+    def steps_to_mm(self, steps):
+        """ Convert steps to millimeters """
+        return steps * self.mm_per_rev / self.PPR
+
     def find_arduino(self):
-        """ Find and connect to the Arduino """
+        """
+        Find and connect to the Arduino.
+        The port it was last found on is tried first; every COM port is enumerated only if
+        that port is gone or does not answer. If the Stepper was given a port, only that port is tried.
+        """
         self.arduino = None
-        arduino_ports = serial.tools.list_ports.comports()
-        for port in arduino_ports:
-            if port.pid == self._constants['pid']['arduino'] and port.vid == self._constants['vid']['arduino']:
-                self.arduino = serial.Serial(port=port.name, baudrate=self._constants['stepper']['baudrate'], timeout=1)
-                logging.info("Arduino Connected")
-                print(f"Connected to Arduino at Port {port.name}")
-            else:
-                pass
+
+        if self.port is not None:
+            self._open_port(self.port)
+            if self.arduino is not None:
+                logging.info(f'Arduino Connected at {self.port}')
+            return
+
+        cached_port = self._cached_port()
+        if cached_port is not None:
+            self._open_port(cached_port)
+            if self.arduino is not None:
+                try:
+                    self.status()
+                except (TimeoutError, RuntimeError):
+                    logging.info(f'No Arduino answering on cached port {cached_port}')
+                    self.arduino.close()
+                    self.arduino = None
+
+        if self.arduino is None:
+            import serial.tools.list_ports
+
+            arduino_ports = serial.tools.list_ports.comports()
+            for port in arduino_ports:
+                if port.pid == self._constants['pid']['arduino'] and port.vid == self._constants['vid']['arduino']:
+                    self._open_port(port.name)
+                    break
+
+        if self.arduino is not None:
+            logging.info("Arduino Connected")
+            print(f"Connected to Arduino at Port {self.arduino.port}")
+            try:
+                with open(self._port_cache_path, 'w') as file:
+                    file.write(self.arduino.port)
+            except OSError as e:
+                logging.error(f'Failed to cache Arduino port: {e}')
+
+    def _cached_port(self):
+        """ Port the Arduino was last found on, if known """
+        try:
+            with open(self._port_cache_path, 'r') as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def _open_port(self, port):
+        """ Open port and wait for the Arduino to finish booting, leaving self.arduino None on failure """
+        try:
+            self.arduino = serial.Serial(port=port, baudrate=self._constants['stepper']['baudrate'], timeout=1)
+        except serial.SerialException as e:
+            logging.info(f'Could not open {port}: {e}')
+            self.arduino = None
+            return
+
+        # Opening the port resets the Arduino; commands sent before its bootloader exits are lost
+        sleep(self._constants['stepper']['boot_time'])
     
     def disconnect(self):
         """ Disconnect from the Arduino """
+        # A move that timed out or stalled leaves the position marked as moving
+        self._save_position(self._moving)
+        if self._position_file is not None:
+            self._position_file.close()
+            self._position_file = None
         try:
             self.arduino.close()
             logging.info("Port closed successfully")
@@ -75,118 +398,535 @@ class Stepper:
             logging.error("Failed to open port", exc_info=True)
 
     def gohome(self):
-        """ Send 'HOME' command to the Arduino """
-        self.arduino.reset_output_buffer()
+        """
+        Send 'HOME' command to the Arduino and wait for it to finish.
+        Both axes home together; the time it took is kept in home_time.
+        """
+        self._drain()
         self.arduino.reset_input_buffer()
-        sleep(self.polling_delay)
 
         try:
-            self.arduino.write("HOME".encode())
+            self._ensure_profile()
+            self._save_position(moving=True)
+            started = perf_counter()
+            self.arduino.write(encode_frame(CMD_HOME, struct.pack('<III', self.home_fast_pps, self.home_slow_pps, self.home_backoff)))
             logging.info("Going HOME")
         except Exception as e:
             logging.error("Failed to send 'HOME' command", exc_info=True)
+            return
 
-        while self.arduino.in_waiting == 0:
-            pass        
-
-        sleep(self.polling_delay)
-        num = self.arduino.in_waiting
-        string = self.arduino.read(num).strip().decode('utf-8')
-        print(f'Stage has been {string}ed')
-
-        self.current_x = 0
-        self.current_y = 0
-
-        self.arduino.reset_input_buffer()
-        self.arduino.reset_output_buffer()
-
-
-    def moveto(self, x_pos, y_pos):
+        # Homing may have to cross the whole stage on the longer axis
+        coordinates = self._constants['coordinates']
+        span = self.mm_to_steps(max(coordinates['x_max'] - coordinates['x_min'], coordinates['y_max'] - coordinates['y_min']))
+        try:
+            homing = self.profile.homing_time(span, self.home_fast_pps, self.home_slow_pps, self.home_backoff)
+            self.wait_for_done(homing + (span + 2 * self.home_backoff) * self.step_overhead + self.ack_timeout)
+        except TimeoutError:
+            logging.error('Timed out waiting for the stage to home')
+            raise
+        self.home_time = perf_counter() - started
+        logging.info(f'Homed in {self.home_time:0.3f} s')
+        print(f'Stage has been homed in {self.home_time:0.2f} s')
+
+        self.steps_x = 0
+        self.steps_y = 0
+        self._save_position()
+
+    def moveto(self, x_pos, y_pos, interpolate=None):
         """
         Move to specified x_pos and/or y_pos coordinates.
         If x_pos or y_pos is not specified, current_x or current_y is used respectively.
+        If interpolate is True both axes step simultaneously, defaulting to self.interpolate.
+        Blocks until the Arduino acknowledges the move; raises TimeoutError if it never does and
+        RuntimeError if the Arduino rejects the move or the position it reports is not the one expected.
         """
+        if interpolate is None:
+            interpolate = self.interpolate
 
         try:
-            self.arduino.reset_output_buffer()
+            self._drain()
+            started = perf_counter()
             self.arduino.reset_input_buffer()
+            reset_s = perf_counter() - started
 
             if self.current_x is None or self.current_y is None:
                 logging.error('Please home stage before taking a scan.')
                 return
 
-            command, nPulsesX, nPulsesY = self.format_xy(x_pos, y_pos)
+            self._ensure_profile()
+            command, nPulsesX, nPulsesY = self.format_xy(x_pos, y_pos, interpolate)
 
             try:
-                self.arduino.write(command.encode())
+                self._save_position(moving=True)
+                write_started = perf_counter()
+                self.arduino.write(command)
+                written = perf_counter()
             except Exception as e:
                 logging.error(f'Failed to write command to Arduino: {e}')
                 return
 
-            # Calculate sleep time based on pulses and PWM
-            sleep_time = 1e-6 * (abs(nPulsesX + nPulsesY)) * self.PWM * 2
-            sleep(sleep_time)
+            # Wait for the Arduino to report that stepping has finished
+            try:
+                reported = self.wait_for_done(self._ack_window(nPulsesX, nPulsesY, interpolate), self._stall_window())
+            except TimeoutError:
+                # Its acknowledgement may still come; the next command waits for it first
+                self._unacked = (deque([(None, 0, nPulsesX, nPulsesY)]), interpolate, False)
+                raise
+            self._track(nPulsesX, nPulsesY, reported)
+            self._save_position()
+            self._record_move(nPulsesX, nPulsesY, interpolate, started, reset_s, written - write_started, written)
+
+        except TimeoutError as e:
+            logging.error(f'Move to ({x_pos}, {y_pos}) timed out: {e}')
+            raise
+
+        except RuntimeError as e:
+            logging.error(f'Move to ({x_pos}, {y_pos}) failed: {e}')
+            raise
 
-            # Wait for Arduino response
-            while self.arduino.in_waiting == 0:
-                pass
+        except Exception as e:
+            logging.error(f'An error occurred during movement: {e}')
 
-            sleep(self.polling_delay)
-            
-            num = self.arduino.in_waiting
+    def move_through(self, points, interpolate=None, trigger=False):
+        """
+        Visit each (x, y) in points back to back, yielding (index, x, y) as each move is acknowledged.
+        Moves are streamed ahead of the stage in batch frames that wait in the Arduino's serial
+        buffer (up to rx_buffer bytes), so the next move starts as soon as the previous one
+        finishes instead of waiting for a round trip. Closing the generator early stops sending
+        new moves; moves the Arduino has already received are still waited for so the position
+        stays correct.
+        With trigger=True the firmware pulses OPTO once each move has settled and holds the stage
+        for the dwell before the next move (see set_trigger), while the host is already queueing
+        it. Each yield then adds the time OPTO fired, as a time.time() wall-clock value.
+        If the stream fails, the moves still queued on the Arduino are waited for by the next command.
+        """
+        if interpolate is None:
+            interpolate = self.interpolate
 
-            try:
-                response = self.arduino.read(num).strip().decode('utf-8')
-            except Exception as e:
-                logging.error(f'Failed to read response from Arduino: {e}')
-                return
+        self._drain()
+        if self.current_x is None or self.current_y is None:
+            logging.error('Please home stage before taking a scan.')
+            return
 
-            response_list = response.split('\r\n')
+        started = perf_counter()
+        self.arduino.reset_input_buffer()
+        reset_s = perf_counter() - started
+        write_s = 0.0
+        self._ensure_profile()
+        if trigger and not self._trigger_sent:
+            self.send_trigger()
+        self._save_position(moving=True)
+        clock = []  # wall-clock time and firmware micros() of the last trigger
+
+        pending = deque()  # (index, frame size, nPulsesX, nPulsesY) sent but not yet acknowledged
+        in_flight = 0
+        planned_x, planned_y = self.steps_x, self.steps_y
+        points = list(points)
+        next_index = 0
+
+        def batch_size(count):
+            return len(encode_batch([(0, 0)] * count, trigger=trigger))
 
-            # Update current_x and current_y based on the movement
-            self.current_x = self.current_x + (-1 * nPulsesX * (1 / self.PPR) * self.mm_per_rev)
-            self.current_y = self.current_y + (-1 * nPulsesY * (1 / self.PPR) * self.mm_per_rev)
+        try:
+            while next_index < len(points) or pending:
+                # Keep the Arduino's receive buffer topped up with batches of moves
+                while next_index < len(points):
+                    count = min(BATCH_MAX, len(points) - next_index)
+                    while count > 1 and in_flight + batch_size(count) > self.rx_buffer:
+                        count -= 1
+                    if pending and in_flight + batch_size(count) > self.rx_buffer:
+                        break
+
+                    moves = []
+                    for i in range(next_index, next_index + count):
+                        x_pos, y_pos = points[i]
+                        _, nPulsesX, nPulsesY = self.format_xy(x_pos, y_pos, interpolate, start=(planned_x, planned_y))
+                        moves.append((nPulsesX, nPulsesY))
+                        # The frame leaves the receive buffer when the firmware reads it, before its first move
+                        pending.append((i, batch_size(count) if i == next_index else 0, nPulsesX, nPulsesY))
+                        planned_x -= nPulsesX
+                        planned_y -= nPulsesY
+
+                    write_started = perf_counter()
+                    self.arduino.write(encode_batch(moves, interpolate, trigger))
+                    write_s += perf_counter() - write_started
+                    in_flight += batch_size(count)
+                    next_index += count
+
+                waited_from = perf_counter()
+                i = self._ack_move(pending, interpolate, trigger)
+                _, size, nPulsesX, nPulsesY = pending.popleft()
+                in_flight -= size
+                self._record_move(nPulsesX, nPulsesY, interpolate, started, reset_s, write_s, waited_from)
+                if trigger:
+                    yield i, self.current_x, self.current_y, self._fired_at(clock)
+                else:
+                    yield i, self.current_x, self.current_y
+
+                # Time the caller spends between moves is not counted against the next one
+                started = perf_counter()
+                reset_s = write_s = 0.0
+
+        except GeneratorExit:
+            while pending:
+                self._ack_move(pending, interpolate, trigger)
+                pending.popleft()
+            raise
+
+        except TimeoutError as e:
+            logging.error(f'Batch move timed out with {len(pending)} moves unacknowledged: {e}')
+            raise
 
-            logging.info(f'(X,Y)={self.current_x},{self.current_y}')
+        finally:
+            # Saved as clean only if every move sent was acknowledged
+            if pending:
+                self._unacked = (pending, interpolate, trigger)
+            else:
+                self._save_position()
+
+    def _ack_move(self, pending, interpolate, trigger=False):
+        """ Wait for the oldest pending move to finish and update the current position """
+        i, _, nPulsesX, nPulsesY = pending[0]
+        # A triggered move's reply also waits out the previous move's dwell and its own settle and pulse
+        extra = self.trigger_time() if trigger else 0.0
+        reported = self.wait_for_done(self._ack_window(nPulsesX, nPulsesY, interpolate, extra), self._stall_window(extra))
+        self._track(nPulsesX, nPulsesY, reported)
+        return i
+
+    def _drain(self):
+        """
+        Wait for the acknowledgements owed by moves that a failed moveto or move_through left
+        queued on the Arduino, so the next command does not take one of them for its own reply.
+        The moves are tracked as they finish; if they never do, the position is forgotten.
+        """
+        if self._unacked is None:
+            return
+        pending, interpolate, trigger = self._unacked
+        self._unacked = None
+        logging.info(f'Waiting for {len(pending)} unacknowledged moves')
+        try:
+            while pending:
+                if self.steps_x is None or self.steps_y is None:
+                    _, _, nPulsesX, nPulsesY = pending[0]
+                    extra = self.trigger_time() if trigger else 0.0
+                    self.wait_for_done(self._ack_window(nPulsesX, nPulsesY, interpolate, extra), self._stall_window(extra))
+                else:
+                    self._ack_move(pending, interpolate, trigger)
+                pending.popleft()
+        except (TimeoutError, RuntimeError) as e:
+            logging.error(f'{len(pending)} queued moves were never acknowledged: {e}')
+            self.steps_x = None
+            self.steps_y = None
+        self._save_position()
+
+    def _ack_window(self, nPulsesX, nPulsesY, interpolate, extra=0.0):
+        """
+        Seconds to wait for a move's acknowledgement: its profile time plus the firmware's
+        per-step overhead, extra seconds without stepping, and ack_timeout
+        """
+        steps = max(abs(nPulsesX), abs(nPulsesY)) if interpolate else abs(nPulsesX) + abs(nPulsesY)
+        return self.move_time(nPulsesX, nPulsesY, interpolate) + steps * self.step_overhead + extra + self.ack_timeout
 
-        except Exception as e:
-            logging.error(f'An error occurred during movement: {e}')
+    def _fired_at(self, clock):
+        """
+        Wall-clock time at which OPTO fired for the last acknowledged move.
+        The first trigger of a scan is placed by when its reply arrived, less its transfer time;
+        later ones are spaced by the firmware's microsecond clock. clock ([wall time, micros()]
+        of the previous trigger, empty at the start of a scan) is updated.
+        """
+        if not clock:
+            _, decoded = self._reply_times
+            transfer = len(encode_frame(REPLY_TRIGGERED, bytes(12))) * 10 / self._constants['stepper']['baudrate']
+            clock[:] = [time() - (perf_counter() - decoded) - transfer, self._fired_us]
+        else:
+            # micros() wraps every 71.6 minutes
+            clock[0] += ((self._fired_us - clock[1]) & 0xFFFFFFFF) * 1e-6
+            clock[1] = self._fired_us
+        return clock[0]
+
+    def _record_move(self, nPulsesX, nPulsesY, interpolate, started, reset_s, write_s, waited_from):
+        """
+        Add an acknowledged move to metrics. The move began at started and waited for its
+        acknowledgement from waited_from; it ends now.
+        """
+        replied, decoded = self._reply_times
+        self.metrics.record(
+            reset_s,
+            write_s,
+            replied - waited_from,
+            decoded - replied,
+            perf_counter() - started,
+            self.steps_to_mm(math.hypot(nPulsesX, nPulsesY)),
+            # A simulated stage moves time_scale times real time
+            self.move_time(nPulsesX, nPulsesY, interpolate) * self.metrics.time_scale,
+        )
 
-        finally:
+    def _track(self, nPulsesX, nPulsesY, reported):
+        """
+        Apply an acknowledged move to the step position and check it against the firmware's count.
+        A mismatch means steps were lost or the Arduino restarted, so the position is forgotten.
+        """
+        self.steps_x -= nPulsesX
+        self.steps_y -= nPulsesY
+        logging.info(f'(X,Y)={self.current_x},{self.current_y}')
+
+        if tuple(reported) != (self.steps_x, self.steps_y):
+            logging.error(f'Arduino reports {reported} steps but {(self.steps_x, self.steps_y)} were expected')
+            self.steps_x = None
+            self.steps_y = None
+            self._save_position()
+            raise RuntimeError('Stage position lost. Please home stage.')
+
+    def _save_position(self, moving=False):
+        """
+        Persist the step position for restore_position().
+        moving=True marks a move in progress, so a crash before the next save forces homing.
+        Every move saves twice, so the position is one fixed-size JSON record overwritten in
+        place in a file kept open, a few microseconds instead of a new file each time. A record
+        torn by a crash fails to parse, which saved_position treats as no saved position.
+        """
+        self._moving = moving
+        if self._position_path is None:
+            return
+
+        state = {
+            'steps_x': self.steps_x,
+            'steps_y': self.steps_y,
+            'moving': moving or self.steps_x is None,
+            'ppr': self.PPR,
+            'mm_per_rev': self.mm_per_rev,
+        }
+        try:
+            if self._position_file is None:
+                self._position_file = open(self._position_path, 'wb', buffering=0)
+            self._position_file.seek(0)
+            self._position_file.write(json.dumps(state).encode().ljust(POSITION_RECORD))
+        except OSError as e:
+            logging.error(f'Failed to save stage position: {e}')
+
+    def saved_position(self):
+        """
+        Position (x, y) in millimeters saved by the last session, or None if there is none it
+        could be resumed from: that session must have stopped between moves, with the same
+        steps per millimeter. Whether the stage is still there is not known.
+        """
+        if self._position_path is None:
+            return None
+
+        try:
+            with open(self._position_path, 'r') as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if not saved or saved.get('moving', True) or saved.get('ppr') != self.PPR or saved.get('mm_per_rev') != self.mm_per_rev:
+            logging.info('No usable saved stage position; homing required')
+            return None
+        return self.steps_to_mm(saved['steps_x']), self.steps_to_mm(saved['steps_y'])
+
+    def restore_position(self):
+        """
+        Resume from the position saved by the last session (see saved_position) instead of homing.
+        This trusts the saved file: the Arduino resets when the port opens, so the firmware
+        cannot confirm the stage is still there, and a stage moved by hand or a file from another
+        session goes unnoticed. Call it only when the user has said the stage was not moved.
+        The firmware is loaded with the position unless it already reports the same one.
+        Returns True if restored.
+        """
+        saved = self.saved_position()
+        if saved is None:
+            return False
+
+        steps = (self.mm_to_steps(saved[0]), self.mm_to_steps(saved[1]))
+        try:
+            reported = self.status()
+            if tuple(reported) != steps:
+                self.arduino.write(encode_frame(CMD_SETPOS, struct.pack('<ii', *steps)))
+                reported = self.wait_for_done(self.ack_timeout)
+        except (TimeoutError, RuntimeError) as e:
+            logging.error(f'Could not load saved stage position: {e}')
+            return False
+
+        if tuple(reported) != steps:
+            logging.warning(f'Arduino reports {reported} steps after loading {steps}; homing required')
+            return False
+
+        self.steps_x, self.steps_y = steps
+        logging.warning(f'Restored (X,Y)={self.current_x},{self.current_y} from the saved file without homing')
+        return True
+
+    def wait_for_done(self, timeout, stall=None):
+        """
+        Block until the Arduino acknowledges the oldest outstanding command with a DONE frame.
+        Returns the position the firmware reports, in steps from home.
+        Raises RuntimeError on an ERR frame and TimeoutError if nothing arrives within timeout seconds,
+        or, with stall, StallError if the Arduino is silent for stall seconds. PROGRESS frames received while
+        waiting update live_steps and are passed to on_progress.
+        When the reply started arriving and when it was decoded are kept in _reply_times.
+        """
+        deadline = monotonic() + timeout
+        heard = monotonic()
+        data = b''
+        replied = None
+        while True:
             try:
-                self.arduino.reset_input_buffer()
-                self.arduino.reset_output_buffer()
-            except Exception as e:
-                logging.error(f'Failed to reset Arduino buffers: {e}')
+                frame = decode_frame(data)
+            except ValueError as e:
+                # Corrupted reply; resynchronise on the next SYNC byte
+                logging.error(f'Discarding corrupted frame from Arduino: {e}')
+                data = data[data.find(bytes([SYNC])) + 1:]
+                continue
+
+            if frame is not None:
+                frame_type, payload, _ = frame
+                if frame_type in (REPLY_DONE, REPLY_TRIGGERED):
+                    self._reply_times = (replied, perf_counter())
+                    if frame_type == REPLY_TRIGGERED:
+                        self._fired_us = struct.unpack('<I', payload[8:12])[0]
+                    return struct.unpack('<ii', payload[:8])
+                if frame_type == REPLY_ERR:
+                    raise RuntimeError(f'Arduino rejected command: {ERRORS.get(payload[0], payload[0])}')
+                data = data[frame[2]:]
+                if frame_type == REPLY_PROGRESS:
+                    self._progress(payload)
+                    # The acknowledgement has not started arriving yet
+                    replied = perf_counter() if data else None
+                continue
+
+            now = monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                raise TimeoutError(f'No acknowledgement from Arduino within {timeout:0.2f} s')
+            if stall is not None:
+                if now - heard >= stall:
+                    raise StallError(f'Stage stalled: no progress from Arduino for {stall:0.2f} s')
+                remaining = min(remaining, heard + stall - now)
+
+            # Read what the frame still needs: SYNC and length first, then the rest
+            self.arduino.timeout = remaining
+            start = data.find(bytes([SYNC]))
+            if start == -1 or len(data) < start + 2:
+                received = self.arduino.read(2)
+            else:
+                received = self.arduino.read(start + 2 + data[start + 1] + 1 - len(data))
+            if received:
+                heard = monotonic()
+                data += received
+            if replied is None and data:
+                replied = perf_counter()
+
+    def _progress(self, payload):
+        """ Handle a PROGRESS frame: keep the position and pass it to on_progress """
+        self.live_steps = struct.unpack('<ii', payload[:8])
+        if self.on_progress is not None:
+            try:
+                self.on_progress(self.live_x, self.live_y)
+            except Exception:
+                logging.error('Progress callback failed', exc_info=True)
+
+    def _stall_window(self, idle=0.0):
+        """
+        Longest silence allowed while waiting for a move, or None without progress reports.
+        idle is time the firmware spends without stepping, such as a trigger's settle and dwell.
+        """
+        if not self.progress_us:
+            return None
+        return max(self.stall_timeout, 2e-6 * self.progress_us) + idle
+
+    def verify_position(self):
+        """ True if the position is known and the firmware reports the same step count """
+        if self.steps_x is None or self.steps_y is None:
+            return False
+        try:
+            reported = self.status()
+        except (TimeoutError, RuntimeError) as e:
+            logging.error(f'Could not verify stage position: {e}')
+            return False
+        if tuple(reported) != (self.steps_x, self.steps_y):
+            logging.warning(f'Arduino reports {reported} steps but {(self.steps_x, self.steps_y)} were expected')
+            return False
+        return True
+
+    def status(self):
+        """ Position the firmware reports, in steps from home """
+        self._drain()
+        self.arduino.reset_input_buffer()
+        self.arduino.write(encode_frame(CMD_STATUS))
+        return self.wait_for_done(self.ack_timeout)
 
+    def send_profile(self):
+        """ Load the acceleration profile into the firmware """
+        self.arduino.write(self.profile.command())
+        self.wait_for_done(self.ack_timeout)
+        self._profile_sent = True
+        logging.info(f'Speed profile set: {self.profile.start_pps} to {self.profile.max_pps} pulses/s at {self.profile.accel_pps2} pulses/s^2')
 
-    def format_xy(self, posX, posY):
+    def set_trigger(self, settle_ms=None, pulse_us=None, dwell_ms=None):
         """
-        Format the x and y positions into a command string and calculate number of pulses.
+        Change the acquisition trigger of triggered scans: the stage settles for settle_ms after
+        each move, OPTO is pulsed for pulse_us, and the stage dwells for dwell_ms while the
+        instrument acquires. Settings left as None are kept. Sent to the firmware with the next
+        triggered scan.
         """
-        # Convert the distance to number of turns
-        nTurnsX = (self.current_x - posX) / self.mm_per_rev
-        nTurnsY = (self.current_y - posY) / self.mm_per_rev
-        
-        # Convert number of turns to number of pulses, an integer
-        nPulsesX = abs(int(nTurnsX * self.PPR))
-        nPulsesY = abs(int(nTurnsY * self.PPR))
-        
-        # Calculate revolutions and remainder pulses
-        x_revs = nPulsesX // self.PPR
-        x_mod = nPulsesX % self.PPR
-
-        y_revs = nPulsesY // self.PPR
-        y_mod = nPulsesY % self.PPR
-
-        # Adjust for direction
-        if nTurnsX <= 0:
-            x_mod *= -1
-            x_revs *= -1
-            nPulsesX *= -1
-        if nTurnsY < 0:
-            y_mod *= -1
-            y_revs *= -1
-            nPulsesY *= -1
-
-        return f"{x_revs},{x_mod} {y_revs},{y_mod}", nPulsesX, nPulsesY
+        if settle_ms is not None:
+            self.settle_us = int(settle_ms * 1000)
+        if pulse_us is not None:
+            self.pulse_us = int(pulse_us)
+        if dwell_ms is not None:
+            self.dwell_us = int(dwell_ms * 1000)
+        self._trigger_sent = False
+
+    def send_trigger(self):
+        """ Load the acquisition trigger settings into the firmware """
+        self.arduino.write(encode_frame(CMD_TRIGGER, struct.pack('<III', self.settle_us, self.pulse_us, self.dwell_us)))
+        self.wait_for_done(self.ack_timeout)
+        self._trigger_sent = True
+        logging.info(f'Trigger set: settle {self.settle_us} us, pulse {self.pulse_us} us, dwell {self.dwell_us} us')
+
+    def trigger_time(self):
+        """ Seconds a triggered move adds to the motion: settle, pulse and dwell """
+        return 1e-6 * (self.settle_us + self.pulse_us + self.dwell_us)
+
+    def send_progress(self):
+        """ Set how often the firmware reports the position during moves """
+        self.arduino.write(encode_frame(CMD_PROGRESS, struct.pack('<I', self.progress_us)))
+        self.wait_for_done(self.ack_timeout)
+        logging.info(f'Progress reports every {self.progress_us} us')
+
+    def _ensure_profile(self):
+        """ Send the acceleration profile and progress interval before the first command of a session """
+        if not self._profile_sent:
+            self.send_profile()
+            self.send_progress()
+
+    def move_time(self, nPulsesX, nPulsesY, interpolate=False):
+        """
+        Time in seconds the firmware spends stepping a move of nPulsesX, nPulsesY.
+        Sequential moves ramp X then Y; interpolated moves ramp both axes together on the longer one.
+        """
+        if interpolate:
+            return self.profile.pulses_time(max(abs(nPulsesX), abs(nPulsesY)))
+        return self.profile.pulses_time(nPulsesX) + self.profile.pulses_time(nPulsesY)
+
+    def axis_time(self, distance):
+        """
+        Time in seconds to move one axis by distance millimeters (scalar or array).
+        """
+        nPulses = np.rint(np.abs(np.asarray(distance, dtype=float)) / self.mm_per_rev * self.PPR).astype(np.int64)
+        return self.profile.pulses_time(nPulses)
+
+    def format_xy(self, posX, posY, interpolate=False, start=None):
+        """
+        Format the x and y positions into a move frame and calculate number of pulses.
+        The move starts from start=(steps_x, steps_y) if given, otherwise from the current position.
+        Targets are rounded to the nearest absolute step, so rounding never accumulates across moves.
+        """
+        fromX, fromY = start if start is not None else (self.steps_x, self.steps_y)
+
+        # Pulses are positive towards home
+        nPulsesX = fromX - self.mm_to_steps(posX)
+        nPulsesY = fromY - self.mm_to_steps(posY)
+
+        command = encode_move(nPulsesX, nPulsesY, interpolate)
+
+        return command, nPulsesX, nPulsesY
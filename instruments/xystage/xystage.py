@@ -1,54 +1,199 @@
+from time import perf_counter
+_import_started = perf_counter()
+
 import os
 import sys
-from PyQt5.QtWidgets import *
-from PyQt5.QtGui import *
-from PyQt5.QtCore import *
-from PyQt5 import uic
-from instruments.xystage.stepper_util import Stepper
-import yaml
+from PyQt5.QtWidgets import (
+    QAbstractItemView, QApplication, QCheckBox, QDialog, QDialogButtonBox, QDoubleSpinBox, QFileDialog,
+    QFormLayout, QGraphicsPolygonItem, QGraphicsScene, QGraphicsView, QHeaderView, QLabel, QMainWindow,
+    QMessageBox, QPushButton, QShortcut, QTableView,
+)
+from PyQt5.QtGui import QColor, QIcon, QImage, QKeySequence, QPainter, QPen, QPolygonF
+from PyQt5.QtCore import QEvent, QItemSelectionModel, QPointF, QRectF, QThread, QTimer, Qt, pyqtSignal
+from instruments.xystage.config import XY_DIR, configure_logging, load_constants
+from instruments.xystage.image_tiles import TiledImageItem
+from instruments.xystage.point_model import ScanPointModel
+from instruments.xystage.point_overlay import ScanPointOverlay
+from instruments.xystage import scan_points
+# Regenerate after editing xystage.ui with: pyuic5 xystage.ui -o xystage_ui.py
+from instruments.xystage.xystage_ui import Ui_MainWindow
 import logging
-
-# Directory of the current file
-XY_DIR = os.path.dirname(__file__)
-
-def XY_UI():
+import numpy as np
+
+# Stepper (pyserial), StageWorker (asyncio) and scan_path are imported when first needed so the window opens sooner
+
+
+class ConnectWorker(QThread):
+    """
+    Creates the Stepper and finds the Arduino on a worker thread, so the window is usable
+    while the serial port opens and the Arduino boots.
+    Emits connected(stepper) when done.
+    """
+    connected = pyqtSignal(object)
+
+    def run(self):
+        from instruments.xystage.stepper_util import Stepper
+
+        stepper = Stepper()
+        if stepper.arduino is None:
+            stepper.find_arduino()
+        self.connected.emit(stepper)
+
+
+class GridDialog(QDialog):
+    """
+    Asks for the extent, pitch and row order of a grid of scan points, in mm.
+    With polygon=True only the pitch and row order are asked for, since the polygon sets the extent.
+    """
+    def __init__(self, limits, polygon=False, parent=None):
+        super(GridDialog, self).__init__(parent)
+        self.setWindowTitle('Fill Polygon' if polygon else 'Add Grid')
+        layout = QFormLayout(self)
+
+        def spin_box(value, low, high):
+            box = QDoubleSpinBox(self)
+            box.setDecimals(3)
+            box.setRange(low, high)
+            box.setValue(value)
+            return box
+
+        self.x_start = spin_box(limits['x_min'], limits['x_min'], limits['x_max'])
+        self.x_stop = spin_box(limits['x_max'], limits['x_min'], limits['x_max'])
+        self.y_start = spin_box(limits['y_min'], limits['y_min'], limits['y_max'])
+        self.y_stop = spin_box(limits['y_max'], limits['y_min'], limits['y_max'])
+        self.pitch_x = spin_box(10.0, 0.001, limits['x_max'] - limits['x_min'])
+        self.pitch_y = spin_box(10.0, 0.001, limits['y_max'] - limits['y_min'])
+        self.serpentine = QCheckBox('Serpentine (reverse every other row)', self)
+        self.serpentine.setChecked(True)
+
+        if not polygon:
+            layout.addRow('X from (mm)', self.x_start)
+            layout.addRow('X to (mm)', self.x_stop)
+            layout.addRow('Y from (mm)', self.y_start)
+            layout.addRow('Y to (mm)', self.y_stop)
+        layout.addRow('X pitch (mm)', self.pitch_x)
+        layout.addRow('Y pitch (mm)', self.pitch_y)
+        layout.addRow(self.serpentine)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+
+def XY_UI(exit_after_startup=False):
+    """
+    Run the XY stage window.
+    With exit_after_startup=True the application quits as soon as the Arduino connection
+    attempt finishes, after logging how long startup took (see benchmark.bench_startup).
+    """
     class XY(QMainWindow):
         """
         Main application window for XY coordinate tracking.
         """
         def __init__(self) -> None:
             super(XY, self).__init__()
-            ui_path = os.path.join(XY_DIR, "xystage.ui")
-            uic.loadUi(ui_path, self)
+            Ui_MainWindow().setupUi(self)
+            # The generated UI looks for the icon in the working directory
+            self.setWindowIcon(QIcon(os.path.join(XY_DIR, 'Icon.ico')))
+
+            # Hardware constants (offset, limits, etc.), shared with Stepper
+            self._constants = load_constants()
+            configure_logging()
+
             self.setup_ui()
             self.show()
 
-            self.scan_coordinates = {}  # Dictionary to store scan coordinates
-            self.green_circles = []       # List to store references to green circle items
+            self.image_item = None
+            self.polygon_vertices = []    # Corners (mm) of the polygon for Fill Polygon
+            self.polygon_item = None
+            self.startup_times = {'imports': _window_started - _import_started,
+                                  'window': perf_counter() - _import_started}
+            logging.info(f"Window ready {self.startup_times['window']:0.3f} s after launch")
 
-            # Load the hardware constants (offset, limits, etc.)
-            self._constants_path = os.path.join(XY_DIR, 'hardware_constants.yaml')
-            with open(self._constants_path, 'r') as file:
-                self._constants = yaml.safe_load(file)
+            # Motion stays disabled until the Arduino connection attempt finishes
+            self.stepper = None
+            self.stage = None
+            self.worker = None
+            self.take_scans_button.setEnabled(False)
+            self.home_stage_button.setEnabled(False)
 
-            logging.basicConfig(
-                filename= os.path.join(XY_DIR, 'XYpy.log'),
-                level = logging.INFO,
-                format='%(asctime)s - %(levelname)s - %(message)s'
-            )
-            
             self.update_current_status('Connecting to Arduino.')
-            self.stepper = Stepper()
-            self.update_current_status('Connected to Arduino. Ensure items are clear of the stage and Home Stage.')
+            self.connector = ConnectWorker(self)
+            self.connector.connected.connect(self._arduino_connected)
+            self.connector.start()
+
+        def _arduino_connected(self, stepper):
+            """
+            Take over the Stepper created by the ConnectWorker and enable motion.
+            """
+            from instruments.xystage.async_stepper import AsyncStepper
+
+            self.stepper = stepper
+            self.stage = AsyncStepper(self.stepper)
+            self.startup_times['connected'] = perf_counter() - _import_started
+            logging.info(f"Arduino connection attempt finished {self.startup_times['connected']:0.3f} s after launch")
+
+            if self.stepper.arduino is None:
+                self.update_current_status('Arduino not found. Please check connection and restart.')
+                return
+
+            self._stage_idle()
+            if not exit_after_startup and self._offer_saved_position():
+                self.update_current_status('Connected to Arduino. Resumed from the saved stage position.')
+                self.update_UI_coords()
+            else:
+                self.update_current_status('Connected to Arduino. Ensure items are clear of the stage and Home Stage.')
+
+            if not exit_after_startup:
+                self._offer_resume()
+
+        def _offer_saved_position(self):
+            """
+            Offer to skip homing by resuming from the position saved by the last session.
+            The Arduino cannot confirm it, so it is only used if the user says the stage has not moved.
+            Returns True if the position was restored.
+            """
+            saved = self.stepper.saved_position()
+            if saved is None:
+                return False
+            reply = QMessageBox.question(
+                self,
+                'Saved Stage Position',
+                f'The last session left the stage at X: {saved[0]:0.3f}, Y: {saved[1]:0.3f}. '
+                'Use this position without homing? Only do so if the stage has not been moved since.',
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No,
+            )
+            return reply == QMessageBox.Yes and self.stepper.restore_position()
 
         def setup_ui(self) -> None:
             """
             Setup the user interface elements.
             """
-            self.xy_table = self.findChild(QTableWidget, 'xy_table')
-            self.xy_table.setColumnCount(2)
-            self.xy_table.setHorizontalHeaderLabels(['X', 'Y'])
+            # Scan coordinates (mm) in table order, shown by the table view
+            self.scan_coordinates = ScanPointModel(self._constants['coordinates'], self)
+            self.xy_table = self.findChild(QTableView, 'xy_table')
+            self.xy_table.setModel(self.scan_coordinates)
+            self.xy_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+            self.xy_table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
             self.xy_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            self.xy_table.verticalHeader().setDefaultSectionSize(self.xy_table.fontMetrics().height() + 4)
+
+            self.add_grid_button = self.findChild(QPushButton, 'add_grid_button')
+            self.add_grid_button.clicked.connect(self.add_grid)
+
+            self.fill_polygon_button = self.findChild(QPushButton, 'fill_polygon_button')
+            self.fill_polygon_button.clicked.connect(self.fill_polygon)
+
+            self.import_csv_button = self.findChild(QPushButton, 'import_csv_button')
+            self.import_csv_button.clicked.connect(self.import_csv)
+
+            self.export_csv_button = self.findChild(QPushButton, 'export_csv_button')
+            self.export_csv_button.clicked.connect(self.export_csv)
+
+            self.detect_spots_button = self.findChild(QPushButton, 'detect_spots_button')
+            self.detect_spots_button.clicked.connect(self.detect_spots)
 
             self.file_dialog = self.findChild(QPushButton, 'file_dialog')
             self.file_dialog.clicked.connect(self.open_file_dialog)
@@ -60,6 +205,14 @@ def XY_UI():
             self.graphicsView.viewport().installEventFilter(self)
             self.scene = QGraphicsScene(self.graphicsView)
 
+            # Markers and numbers for every scan point, drawn by one item that follows the table
+            self.overlay = ScanPointOverlay(self.scan_coordinates, self._mm_to_pixel_BrightSpot(1.0), self.xy_table.selectionModel())
+            self.scene.addItem(self.overlay)
+
+            # Delete removes the points selected in the table or on the image
+            self.delete_shortcut = QShortcut(QKeySequence.Delete, self)
+            self.delete_shortcut.activated.connect(self.remove_selected_points)
+
             self.take_scans_button = self.findChild(QPushButton, 'take_scans_button')
             self.take_scans_button.clicked.connect(self.take_scans)
 
@@ -76,8 +229,6 @@ def XY_UI():
             self.current_coords_label = self.findChild(QLabel, 'current_coords_label')
             self.current_status_label = self.findChild(QLabel, 'current_status')
 
-            self.num_points = 0  # Counter for number of points added
-
         def eventFilter(self, widget, event):
             """
             Event filter to handle mouse events on the QGraphicsView.
@@ -91,6 +242,17 @@ def XY_UI():
                 self.graphicsView.scale(scale, scale)
                 return True
 
+            elif widget == self.graphicsView.viewport() and event.type() == QEvent.MouseButtonPress and event.button() == Qt.LeftButton:
+                # Click a marker to select its point, Ctrl+click to add it to or remove it from the selection
+                row = self.point_under(event.pos())
+                if row is None:
+                    return False
+                flags = QItemSelectionModel.Rows | (QItemSelectionModel.Toggle if event.modifiers() == Qt.ControlModifier else QItemSelectionModel.ClearAndSelect)
+                index = self.scan_coordinates.index(row, 0)
+                self.xy_table.selectionModel().select(index, flags)
+                self.xy_table.scrollTo(index)
+                return True
+
             elif widget == self.graphicsView.viewport() and event.type() == QEvent.MouseButtonDblClick:
                 view_pos = event.pos()
                 scene_pos = self.graphicsView.mapToScene(view_pos)
@@ -114,11 +276,14 @@ def XY_UI():
                     return False
 
                 if event.modifiers() == Qt.ControlModifier:
-                    self.remove_last_green_circle()
+                    # Only a point under the cursor is removed; a missed click removes nothing
+                    row = self.point_under(view_pos)
+                    if row is not None:
+                        self.remove_point(row)
+                elif event.modifiers() == Qt.ShiftModifier:
+                    self.add_polygon_vertex(x, y)
                 else:
-                    self.num_points += 1
-                    self.add_green_circle(scene_pos)
-                    self.add_data_to_table(scene_pos.x(), scene_pos.y())
+                    self.add_points([(x, y)])
 
                 return True
 
@@ -132,8 +297,7 @@ def XY_UI():
             dlg.setFileMode(QFileDialog.AnyFile)
 
             if dlg.exec_():
-                self.xy_table.setRowCount(0)
-                self.num_points = 0
+                self.clear_points()
 
                 filename = dlg.selectedFiles()
                 self.load_image(filename[0])
@@ -142,62 +306,186 @@ def XY_UI():
             """
             Load an image file into the QGraphicsView.
             """
-            self.image = QPixmap(filename)
-            item = QGraphicsPixmapItem(self.image)
-            self.scene.clear()
+            try:
+                item = TiledImageItem(filename, self._constants['image']['tile_size'], self._constants['image']['cache_mb'])
+            except ValueError as e:
+                self.update_current_status(str(e))
+                return
+            if self.image_item is not None:
+                self.scene.removeItem(self.image_item)
+            self.image_item = item
             self.scene.addItem(item)
             self.graphicsView.setScene(self.scene)
             self.graphicsView.fitInView(item, Qt.KeepAspectRatio)
 
             self.file_label.setText(f'File Path: {filename}')
 
-        def add_green_circle(self, scene_pos):
+        def point_under(self, view_pos):
             """
-            Add a green circle and associated text item at the given scene position.
+            Row of the scan point whose marker is under view_pos in the image view, or None.
             """
-            green_brush = QBrush(QColor(50, 205, 50))
-            green_circle = QGraphicsEllipseItem(-20, -20, 40, 40)
-            green_circle.setBrush(green_brush)
-            green_circle.setPos(scene_pos)
-
-            text_item = QGraphicsTextItem(str(self.num_points))
-            text_item.setDefaultTextColor(Qt.white)
-            text_item.setFont(QFont("Arial", 40))
-            text_item.setPos(scene_pos.x() - 40, scene_pos.y() - 90)
-
-            self.scene.addItem(green_circle)
-            self.scene.addItem(text_item)
+            # Markers never shrink below a few pixels on screen, so neither does the hit area
+            radius = max(ScanPointOverlay.RADIUS, 4 / self.graphicsView.transform().m11())
+            return self.overlay.point_at(self.graphicsView.mapToScene(view_pos), radius)
 
-            self.green_circles.append((green_circle, text_item))
+        def remove_point(self, row=None):
+            """
+            Remove the scan point at row, or the last one if row is None. Later points are renumbered.
+            """
+            if len(self.scan_coordinates):
+                self.scan_coordinates.remove_rows([len(self.scan_coordinates) - 1 if row is None else row])
 
-        def remove_last_green_circle(self):
+        def remove_selected_points(self):
             """
-            Remove the last added green circle and its associated text item.
+            Remove the scan points selected in the table or on the image.
             """
-            if self.green_circles:
-                del self.scan_coordinates[self.num_points]
-                self.num_points -= 1
-                last_green_circle, last_text_item = self.green_circles.pop()
-                self.scene.removeItem(last_green_circle)
-                self.scene.removeItem(last_text_item)
-                self.xy_table.removeRow(self.xy_table.rowCount() - 1)
+            rows = [index.row() for index in self.xy_table.selectionModel().selectedRows()]
+            if rows:
+                self.scan_coordinates.remove_rows(rows)
+                self.update_current_status(f'Removed {len(rows)} points.')
 
-        def add_data_to_table(self, x_coord, y_coord):
+        def add_points(self, points, source=None):
             """
-            Add coordinates to the table and scan coordinates dictionary.
+            Add (n, 2) scan points in mm, skipping any outside the stage limits.
+            source names where the points came from in the status message.
             """
-            row_position = self.xy_table.rowCount()
-            self.xy_table.insertRow(row_position)
+            points = np.asarray(points, dtype=float).reshape(-1, 2)
+            inside = scan_points.in_bounds(points, self._constants['coordinates'])
+            skipped = len(points) - int(inside.sum())
+            points = points[inside]
 
-            x_mm = self._pixel_to_mm_BrightSpot(x_coord)
-            y_mm = self._pixel_to_mm_BrightSpot(y_coord)
-            
-            item_x_coord = QTableWidgetItem(f'{x_mm:.3f}')
-            item_y_coord = QTableWidgetItem(f'{y_mm:.3f}')
+            self.scan_coordinates.append(points)
 
-            self.scan_coordinates[self.num_points] = (x_mm, y_mm)
-            self.xy_table.setItem(row_position, 0, item_x_coord)
-            self.xy_table.setItem(row_position, 1, item_y_coord)
+            if source is not None:
+                message = f'Added {len(points)} points from {source}.'
+                if skipped:
+                    message += f' Skipped {skipped} outside the stage limits.'
+                self.update_current_status(message)
+
+        def add_grid(self):
+            """
+            Add a rectangular grid of scan points.
+            """
+            dialog = GridDialog(self._constants['coordinates'], parent=self)
+            if not dialog.exec_():
+                return
+            try:
+                points = scan_points.grid_points(
+                    dialog.x_start.value(), dialog.x_stop.value(), dialog.y_start.value(), dialog.y_stop.value(),
+                    dialog.pitch_x.value(), dialog.pitch_y.value(), dialog.serpentine.isChecked(),
+                )
+            except ValueError as e:
+                self.update_current_status(str(e))
+                return
+            self.add_points(points, 'grid')
+
+        def add_polygon_vertex(self, x_mm, y_mm):
+            """
+            Add a corner to the polygon that Fill Polygon fills, and outline the polygon so far.
+            """
+            self.polygon_vertices.append((x_mm, y_mm))
+            outline = QPolygonF([QPointF(x, y) for x, y in self._mm_to_pixel_BrightSpot(np.array(self.polygon_vertices))])
+            if self.polygon_item is None:
+                self.polygon_item = QGraphicsPolygonItem()
+                pen = QPen(QColor(50, 205, 50))
+                pen.setCosmetic(True)
+                pen.setWidth(2)
+                self.polygon_item.setPen(pen)
+                self.scene.addItem(self.polygon_item)
+            self.polygon_item.setPolygon(outline)
+            self.update_current_status(f'Polygon corner {len(self.polygon_vertices)}: (X: {x_mm:0.3f}, Y: {y_mm:0.3f})')
+
+        def clear_polygon(self):
+            """
+            Forget the polygon corners and remove the outline.
+            """
+            if self.polygon_item is not None:
+                self.scene.removeItem(self.polygon_item)
+                self.polygon_item = None
+            self.polygon_vertices = []
+
+        def fill_polygon(self):
+            """
+            Fill the polygon placed with Shift+double-click with a grid of scan points.
+            """
+            if len(self.polygon_vertices) < 3:
+                self.update_current_status('Shift+double-click at least 3 polygon corners on the image first.')
+                return
+            dialog = GridDialog(self._constants['coordinates'], polygon=True, parent=self)
+            if not dialog.exec_():
+                return
+            try:
+                points = scan_points.polygon_points(
+                    self.polygon_vertices, dialog.pitch_x.value(), dialog.pitch_y.value(), dialog.serpentine.isChecked()
+                )
+            except ValueError as e:
+                self.update_current_status(str(e))
+                return
+            self.clear_polygon()
+            self.add_points(points, 'polygon')
+
+        def import_csv(self):
+            """
+            Add scan points from a CSV file of X, Y in mm.
+            """
+            file_path, _ = QFileDialog.getOpenFileName(self, "Import Points", "", "CSV Files (*.csv);;All Files (*)")
+            if not file_path:
+                return
+            try:
+                points = scan_points.load_csv(file_path)
+            except (OSError, ValueError) as e:
+                self.update_current_status(f'Could not read {file_path}: {e}')
+                return
+            self.add_points(points, os.path.basename(file_path))
+
+        def export_csv(self):
+            """
+            Save the scan points to a CSV file of X, Y in mm.
+            """
+            file_path, _ = QFileDialog.getSaveFileName(self, "Export Points", "", "CSV Files (*.csv);;All Files (*)")
+            if not file_path:
+                return
+            try:
+                scan_points.save_csv(file_path, self.scan_coordinates.points)
+            except OSError as e:
+                self.update_current_status(f'Could not write {file_path}: {e}')
+                return
+            self.update_current_status(f'Exported {len(self.scan_coordinates)} points to {file_path}')
+
+        def detect_spots(self):
+            """
+            Add a scan point at the centroid of every bright spot in the loaded image.
+            Spots are found on a downsampled copy of the image (see spot_detect.py and the
+            spots section of hardware_constants.yaml).
+            """
+            from instruments.xystage.spot_detect import detect_spots
+
+            if self.image_item is None:
+                self.update_current_status('Load an image first.')
+                return
+
+            settings = self._constants['spots']
+            started = perf_counter()
+            try:
+                image, (scale_x, scale_y) = self.image_item.grayscale(settings['max_side'])
+            except ValueError as e:
+                self.update_current_status(str(e))
+                return
+            centroids = detect_spots(image, settings['threshold'], settings['sigma'], settings['min_area'], settings['max_area'])
+            logging.info(f'Detected {len(centroids)} spots in {perf_counter() - started:0.3f} s on a {image.shape[1]}x{image.shape[0]} copy')
+
+            if not len(centroids):
+                self.update_current_status('No bright spots found.')
+                return
+            # Array pixel centers to full-resolution image pixels, then to mm
+            pixels = (centroids + 0.5) * (scale_x, scale_y)
+            self.add_points(self._pixel_to_mm_BrightSpot(pixels), 'bright spots')
+
+        def _mm_to_pixel_BrightSpot(self, mm):
+            """
+            Convert millimeters to pixels, the inverse of _pixel_to_mm_BrightSpot.
+            """
+            return mm * 28.2588
 
         def _pixel_to_mm_BrightSpot(self, pixel):
             """
@@ -207,32 +495,134 @@ def XY_UI():
         
         def take_scans(self):
             """
-            Print the scan coordinates dictionary.
+            Visit the scan coordinates in the order that minimises stage travel time.
             """
-            for k in self.scan_coordinates.keys():
-                scan_x = self.scan_coordinates[k][0]
-                scan_y = self.scan_coordinates[k][1]
-                
-                self.update_current_status(f'Moving to Point {k}: (X: {scan_x:0.3f}, Y: {scan_y:0.3f})')
-                self.stepper.moveto(x_pos=scan_x, y_pos=scan_y)
-                self.update_UI_coords()
-                print(f'Moved to ({self.stepper.current_x:0.3f}, {self.stepper.current_y:0.3f})')
+            coordinates = self.scan_coordinates.points
+            order, plan = self.plan_scan_order()
+            points = [(i + 1, *coordinates[i]) for i in order]
+            self._start_worker(points, note=plan)
 
-            self.update_current_status('Scanning complete.')
+        def _start_worker(self, points=None, resume=False, note=None):
+            """
+            Run stage motion on a StageWorker, homing when points is None.
+            With resume=True the unfinished scan in the journal is continued instead.
+            note is shown with the status of every point (see StageWorker).
+            """
+            from instruments.xystage.scan_session import ScanSession
+            from instruments.xystage.stage_worker import StageWorker
+
+            if self.stage is None:
+                self.update_current_status('Still connecting to Arduino.')
+                return
+            if self.worker is not None and self.worker.isRunning():
+                self.update_current_status('Stage is busy.')
+                return
+            # Checked before a new scan replaces the journal of one that could still be resumed
+            if points is not None and (self.stepper.current_x is None or self.stepper.current_y is None):
+                self.update_current_status('Please home stage before taking a scan.')
+                return
+            if points is not None and not points:
+                self.update_current_status('Add scan points before taking a scan.')
+                return
+
+            journal_path = os.path.join(XY_DIR, self._constants['scans']['journal'])
+            session = None
+            try:
+                if resume:
+                    session = ScanSession.resume(journal_path, self._new_scan_path(), self.stepper.interpolate)
+                elif points is not None:
+                    session = ScanSession.start(points, self._new_scan_path(), journal_path,
+                                                self._constants['trigger']['enabled'], self.stepper.interpolate)
+            except (OSError, ValueError) as e:
+                logging.error(f'Could not open the scan results or journal: {e}')
+                self.update_current_status(f'Could not start the scan: {e}')
+                return
+
+            self.worker = StageWorker(self.stage, session, resume, note, self)
+            self.worker.status.connect(self.update_current_status)
+            self.worker.moved.connect(self.update_UI_coords)
+            self.worker.position.connect(self.update_live_coords)
+            self.worker.finished.connect(self._stage_idle)
+
+            self.take_scans_button.setEnabled(False)
+            self.home_stage_button.setEnabled(False)
+            self.worker.start()
+
+        def _new_scan_path(self):
+            """
+            New timestamped folder under the scans directory set in hardware_constants.yaml,
+            for the results of a scan.
+            """
+            from datetime import datetime
 
-        def clear_points(self):
+            return os.path.join(XY_DIR, self._constants['scans']['directory'], datetime.now().strftime('%Y%m%d_%H%M%S'))
+
+        def _offer_resume(self):
             """
-            Clear all added points (green circles and table data).
+            Offer to continue a scan that the journal shows was cut short.
+            Declining deletes the journal.
             """
-            self.xy_table.setRowCount(0)
-            self.scan_coordinates.clear()
+            from instruments.xystage.scan_journal import load_journal
+
+            path = os.path.join(XY_DIR, self._constants['scans']['journal'])
+            state = load_journal(path)
+            if state is None or state['finished'] or not 0 < state['completed'] < len(state['points']):
+                return
 
-            for green_circle, text_item in self.green_circles:
-                self.scene.removeItem(green_circle)
-                self.scene.removeItem(text_item)
+            done, total = state['completed'], len(state['points'])
+            reply = QMessageBox.question(
+                self,
+                'Resume Scan',
+                f'A scan of {total} points stopped after {done}. Resume from point {state["points"][done][0]}?',
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.Yes,
+            )
+            if reply != QMessageBox.Yes:
+                os.remove(path)
+                return
 
-            self.green_circles.clear()
-            self.num_points = 0
+            # Show the points again, numbered as when the scan was planned
+            if not len(self.scan_coordinates):
+                self.add_points([(x, y) for _, x, y in sorted(state['points'])])
+            self._start_worker(resume=True)
+
+        def _stage_idle(self):
+            """
+            Re-enable the motion buttons once the worker has finished.
+            """
+            self.take_scans_button.setEnabled(True)
+            self.home_stage_button.setEnabled(True)
+
+        def plan_scan_order(self):
+            """
+            Reorder the scan coordinates to minimise travel time.
+            Returns the rows of scan_coordinates in the planned order and a summary of the time
+            saved, or None if there was nothing to plan.
+            """
+            points = self.scan_coordinates.points
+            if len(points) < 2 or self.stepper is None:
+                return list(range(len(points))), None
+
+            from instruments.xystage.scan_path import plan_scan_path
+
+            start = None
+            if self.stepper.current_x is not None and self.stepper.current_y is not None:
+                start = (self.stepper.current_x, self.stepper.current_y)
+
+            order, original_time, planned_time = plan_scan_path(
+                points, start, interpolate=self.stepper.interpolate, axis_time=self.stepper.axis_time
+            )
+            saved = original_time - planned_time
+            logging.info(f'Scan path planned: {original_time:0.3f} s -> {planned_time:0.3f} s')
+
+            return order.tolist(), f'planned path {planned_time:0.1f} s of travel, saved {saved:0.1f} s of {original_time:0.1f} s'
+
+        def clear_points(self):
+            """
+            Clear all added points (markers and table data).
+            """
+            self.scan_coordinates.clear()
+            self.clear_polygon()
 
         def update_UI_coords(self):
             """
@@ -240,7 +630,13 @@ def XY_UI():
             """
             self.current_coords_label.setText(f"X:{self.stepper.current_x:0.3f}, Y:{self.stepper.current_y:0.3f}")
             QApplication.processEvents()
-        
+
+        def update_live_coords(self, x, y):
+            """
+            Show the position the stage has reached partway through a move.
+            """
+            self.current_coords_label.setText(f"X:{x:0.3f}, Y:{y:0.3f}")
+
         def update_current_status(self, text):
             """
             Update the current status label with the given text.
@@ -258,28 +654,25 @@ def XY_UI():
                 # Determine the size of the scene
                 rect = self.scene.sceneRect()
 
-                # Create an image with the size of the scene
-                image = QImage(int(rect.width()), int(rect.height()), QImage.Format_RGB16)
+                # Render straight into an image of the reduced size, so the image tiles are
+                # decoded at that resolution and the full-size scene is never materialized
+                downsample = self._constants['image']['export_downsample']
+                image = QImage(int(rect.width() // downsample), int(rect.height() // downsample), QImage.Format_RGB16)
+                image.fill(Qt.white)
 
-                # Create a painter to render the scene onto the image
                 painter = QPainter(image)
-                self.scene.render(painter)
+                painter.setRenderHint(QPainter.SmoothPixmapTransform)
+                self.scene.render(painter, QRectF(image.rect()), rect, Qt.KeepAspectRatio)
                 painter.end()
 
-                # Scale the image to reduce its size
-                scaled_image = image.scaled(int(rect.width() // 6), int(rect.height() // 6), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-
-                # Save the scaled image to the specified file path
-                scaled_image.save(file_path)
+                # Save the image to the specified file path
+                image.save(file_path)
 
         def gohome(self):
             """
             Move the stage to the home position.
             """
-            self.update_current_status('Stage is going home...')
-            self.stepper.gohome()
-            self.update_current_status('Stage homed.')
-            self.update_UI_coords()
+            self._start_worker()
 
         def closeEvent(self, event):
             """
@@ -294,11 +687,20 @@ def XY_UI():
             )
             
             if reply == QMessageBox.Close:
-                self.stepper.disconnect()
+                if self.worker is not None and self.worker.isRunning():
+                    self.worker.cancel()
+                    self.worker.wait()
+                self.connector.wait()
+                if self.stepper is not None and self.stepper.arduino is not None:
+                    self.stepper.disconnect()
                 event.accept()
             else:
                 event.ignore()
 
+    _window_started = perf_counter()
     app = QApplication(sys.argv)
     window = XY()
+    if exit_after_startup:
+        window.connector.finished.connect(lambda: QTimer.singleShot(0, app.quit))
     app.exec_()
+    return window.startup_times
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'xystage.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.11
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(804, 804)
+        font = QtGui.QFont()
+        font.setFamily("Leelawadee UI")
+        font.setPointSize(12)
+        font.setKerning(True)
+        MainWindow.setFont(font)
+        icon = QtGui.QIcon()
+        icon.addPixmap(QtGui.QPixmap("Icon.ico"), QtGui.QIcon.Normal, QtGui.QIcon.Off)
+        MainWindow.setWindowIcon(icon)
+        self.centralwidget = QtWidgets.QWidget(MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.gridLayout_3 = QtWidgets.QGridLayout(self.centralwidget)
+        self.gridLayout_3.setObjectName("gridLayout_3")
+        self.XYpy = QtWidgets.QGroupBox(self.centralwidget)
+        self.XYpy.setObjectName("XYpy")
+        self.gridLayout_2 = QtWidgets.QGridLayout(self.XYpy)
+        self.gridLayout_2.setObjectName("gridLayout_2")
+        self.gridLayout = QtWidgets.QGridLayout()
+        self.gridLayout.setObjectName("gridLayout")
+        self.verticalLayout_2 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_2.setObjectName("verticalLayout_2")
+        self.label = QtWidgets.QLabel(self.XYpy)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Preferred)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.label.sizePolicy().hasHeightForWidth())
+        self.label.setSizePolicy(sizePolicy)
+        self.label.setMaximumSize(QtCore.QSize(200, 16777215))
+        self.label.setFrameShape(QtWidgets.QFrame.NoFrame)
+        self.label.setAlignment(QtCore.Qt.AlignCenter)
+        self.label.setObjectName("label")
+        self.verticalLayout_2.addWidget(self.label)
+        self.clear_points_button = QtWidgets.QPushButton(self.XYpy)
+        self.clear_points_button.setObjectName("clear_points_button")
+        self.verticalLayout_2.addWidget(self.clear_points_button)
+        self.point_source_layout = QtWidgets.QGridLayout()
+        self.point_source_layout.setObjectName("point_source_layout")
+        self.add_grid_button = QtWidgets.QPushButton(self.XYpy)
+        self.add_grid_button.setObjectName("add_grid_button")
+        self.point_source_layout.addWidget(self.add_grid_button, 0, 0, 1, 1)
+        self.fill_polygon_button = QtWidgets.QPushButton(self.XYpy)
+        self.fill_polygon_button.setObjectName("fill_polygon_button")
+        self.point_source_layout.addWidget(self.fill_polygon_button, 0, 1, 1, 1)
+        self.import_csv_button = QtWidgets.QPushButton(self.XYpy)
+        self.import_csv_button.setObjectName("import_csv_button")
+        self.point_source_layout.addWidget(self.import_csv_button, 1, 0, 1, 1)
+        self.export_csv_button = QtWidgets.QPushButton(self.XYpy)
+        self.export_csv_button.setObjectName("export_csv_button")
+        self.point_source_layout.addWidget(self.export_csv_button, 1, 1, 1, 1)
+        self.detect_spots_button = QtWidgets.QPushButton(self.XYpy)
+        self.detect_spots_button.setObjectName("detect_spots_button")
+        self.point_source_layout.addWidget(self.detect_spots_button, 2, 0, 1, 2)
+        self.verticalLayout_2.addLayout(self.point_source_layout)
+        self.xy_table = QtWidgets.QTableView(self.XYpy)
+        self.xy_table.setEnabled(True)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.xy_table.sizePolicy().hasHeightForWidth())
+        self.xy_table.setSizePolicy(sizePolicy)
+        self.xy_table.setMaximumSize(QtCore.QSize(200, 16777215))
+        font = QtGui.QFont()
+        font.setFamily("Ebrima")
+        font.setPointSize(10)
+        font.setKerning(True)
+        self.xy_table.setFont(font)
+        self.xy_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.xy_table.setObjectName("xy_table")
+        self.verticalLayout_2.addWidget(self.xy_table)
+        self.take_scans_button = QtWidgets.QPushButton(self.XYpy)
+        self.take_scans_button.setObjectName("take_scans_button")
+        self.verticalLayout_2.addWidget(self.take_scans_button)
+        self.save_image_button = QtWidgets.QPushButton(self.XYpy)
+        self.save_image_button.setObjectName("save_image_button")
+        self.verticalLayout_2.addWidget(self.save_image_button)
+        self.gridLayout.addLayout(self.verticalLayout_2, 0, 0, 1, 1)
+        self.verticalLayout = QtWidgets.QVBoxLayout()
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.label_2 = QtWidgets.QLabel(self.XYpy)
+        self.label_2.setAlignment(QtCore.Qt.AlignCenter)
+        self.label_2.setObjectName("label_2")
+        self.verticalLayout.addWidget(self.label_2)
+        self.image_area = QtWidgets.QGraphicsView(self.XYpy)
+        self.image_area.viewport().setProperty("cursor", QtGui.QCursor(QtCore.Qt.CrossCursor))
+        self.image_area.setMouseTracking(True)
+        self.image_area.setRenderHints(QtGui.QPainter.SmoothPixmapTransform|QtGui.QPainter.TextAntialiasing)
+        self.image_area.setDragMode(QtWidgets.QGraphicsView.ScrollHandDrag)
+        self.image_area.setObjectName("image_area")
+        self.verticalLayout.addWidget(self.image_area)
+        self.gridLayout.addLayout(self.verticalLayout, 0, 1, 1, 1)
+        self.gridLayout_2.addLayout(self.gridLayout, 1, 0, 1, 1)
+        self.horizontalLayout_2 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_2.setObjectName("horizontalLayout_2")
+        self.file_box = QtWidgets.QGroupBox(self.XYpy)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.file_box.sizePolicy().hasHeightForWidth())
+        self.file_box.setSizePolicy(sizePolicy)
+        self.file_box.setObjectName("file_box")
+        self.horizontalLayout = QtWidgets.QHBoxLayout(self.file_box)
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.file_dialog = QtWidgets.QPushButton(self.file_box)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.file_dialog.sizePolicy().hasHeightForWidth())
+        self.file_dialog.setSizePolicy(sizePolicy)
+        self.file_dialog.setAutoDefault(False)
+        self.file_dialog.setObjectName("file_dialog")
+        self.horizontalLayout.addWidget(self.file_dialog)
+        self.file_label = QtWidgets.QLabel(self.file_box)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Preferred)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.file_label.sizePolicy().hasHeightForWidth())
+        self.file_label.setSizePolicy(sizePolicy)
+        font = QtGui.QFont()
+        font.setFamily("Leelawadee UI")
+        font.setPointSize(8)
+        font.setKerning(True)
+        self.file_label.setFont(font)
+        self.file_label.setWordWrap(True)
+        self.file_label.setObjectName("file_label")
+        self.horizontalLayout.addWidget(self.file_label)
+        self.horizontalLayout_2.addWidget(self.file_box)
+        self.groupBox_2 = QtWidgets.QGroupBox(self.XYpy)
+        self.groupBox_2.setObjectName("groupBox_2")
+        self.gridLayout_4 = QtWidgets.QGridLayout(self.groupBox_2)
+        self.gridLayout_4.setObjectName("gridLayout_4")
+        self.current_coords_label = QtWidgets.QLabel(self.groupBox_2)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Preferred)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.current_coords_label.sizePolicy().hasHeightForWidth())
+        self.current_coords_label.setSizePolicy(sizePolicy)
+        font = QtGui.QFont()
+        font.setFamily("Leelawadee UI")
+        font.setPointSize(8)
+        font.setKerning(True)
+        self.current_coords_label.setFont(font)
+        self.current_coords_label.setTextFormat(QtCore.Qt.AutoText)
+        self.current_coords_label.setAlignment(QtCore.Qt.AlignCenter)
+        self.current_coords_label.setObjectName("current_coords_label")
+        self.gridLayout_4.addWidget(self.current_coords_label, 0, 0, 1, 1)
+        self.home_stage_button = QtWidgets.QPushButton(self.groupBox_2)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.home_stage_button.sizePolicy().hasHeightForWidth())
+        self.home_stage_button.setSizePolicy(sizePolicy)
+        self.home_stage_button.setObjectName("home_stage_button")
+        self.gridLayout_4.addWidget(self.home_stage_button, 0, 1, 1, 1)
+        self.horizontalLayout_2.addWidget(self.groupBox_2)
+        self.gridLayout_2.addLayout(self.horizontalLayout_2, 0, 0, 1, 1)
+        self.current_status = QtWidgets.QLabel(self.XYpy)
+        font = QtGui.QFont()
+        font.setFamily("Leelawadee UI")
+        font.setPointSize(8)
+        font.setUnderline(False)
+        font.setKerning(True)
+        self.current_status.setFont(font)
+        self.current_status.setAutoFillBackground(False)
+        self.current_status.setWordWrap(True)
+        self.current_status.setObjectName("current_status")
+        self.gridLayout_2.addWidget(self.current_status, 2, 0, 1, 1)
+        self.gridLayout_3.addWidget(self.XYpy, 0, 0, 1, 1)
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+
+        self.retranslateUi(MainWindow)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
+        self.XYpy.setTitle(_translate("MainWindow", "XYpy"))
+        self.label.setText(_translate("MainWindow", "XY Scan Coordinates"))
+        self.clear_points_button.setText(_translate("MainWindow", "Clear All Points"))
+        self.add_grid_button.setText(_translate("MainWindow", "Add Grid"))
+        self.fill_polygon_button.setToolTip(_translate("MainWindow", "Shift+double-click the image to place polygon corners, then fill the polygon with a grid"))
+        self.fill_polygon_button.setText(_translate("MainWindow", "Fill Polygon"))
+        self.import_csv_button.setText(_translate("MainWindow", "Import CSV"))
+        self.export_csv_button.setText(_translate("MainWindow", "Export CSV"))
+        self.detect_spots_button.setToolTip(_translate("MainWindow", "Add a scan point at every bright spot in the loaded image"))
+        self.detect_spots_button.setText(_translate("MainWindow", "Detect Bright Spots"))
+        self.take_scans_button.setText(_translate("MainWindow", "Take Scans!"))
+        self.save_image_button.setText(_translate("MainWindow", "Save Scan Image"))
+        self.label_2.setText(_translate("MainWindow", "Image"))
+        self.file_box.setTitle(_translate("MainWindow", "Choose a File"))
+        self.file_dialog.setText(_translate("MainWindow", "Browse Files"))
+        self.file_label.setText(_translate("MainWindow", "File"))
+        self.groupBox_2.setTitle(_translate("MainWindow", "XY Stage"))
+        self.current_coords_label.setText(_translate("MainWindow", "Current Coordinates"))
+        self.home_stage_button.setText(_translate("MainWindow", "Home Stage"))
+        self.current_status.setText(_translate("MainWindow", "Current Status: "))
@@ -0,0 +1,70 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from instruments.xystage.async_stepper import AsyncStepper
+from instruments.xystage.stepper_util import Stepper
+
+
+@pytest.fixture
+def stage():
+    stepper = Stepper(simulate=True, time_scale=0.01)
+    stage = AsyncStepper(stepper)
+    asyncio.run(stage.gohome())
+    yield stage
+    asyncio.run(stage.disconnect())
+
+
+def test_moveto_returns_the_position(stage):
+    assert asyncio.run(stage.moveto(12.5, 40)) == (12.5, 40)
+    assert asyncio.run(stage.verify_position())
+
+
+def test_move_through_yields_every_point(stage):
+    points = [(10 + i, 20) for i in range(10)]
+
+    async def scan():
+        return [i async for i, _, _ in stage.move_through(points)]
+
+    assert asyncio.run(scan()) == list(range(10))
+    assert (stage.current_x, stage.current_y) == points[-1]
+
+
+def test_leaving_move_through_early_waits_for_queued_moves(stage):
+    points = [(10 + 10 * i, 20) for i in range(10)]
+
+    async def scan():
+        async with aclosing(stage.move_through(points)) as moves:
+            async for i, _, _ in moves:
+                if i == 1:
+                    break
+        # Closing waited for the serial thread, so the position is settled here
+        return stage.current_x, await stage.verify_position()
+
+    x, verified = asyncio.run(scan())
+    assert verified
+    assert x in [p[0] for p in points[1:]]
+
+
+def test_cancelled_move_still_finishes_and_is_tracked(stage):
+    async def cancel_move():
+        move = asyncio.create_task(stage.moveto(250, 200))
+        await asyncio.sleep(0.01)
+        move.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await move
+        # The next command runs after the cancelled move on the serial thread
+        return await stage.verify_position()
+
+    assert asyncio.run(cancel_move())
+    assert (stage.current_x, stage.current_y) == (250, 200)
+
+
+def test_timeout_raises_without_losing_the_position(stage):
+    async def slow_move():
+        with pytest.raises(asyncio.TimeoutError):
+            await stage.moveto(250, 200, timeout=0.001)
+        return await stage.verify_position()
+
+    assert asyncio.run(slow_move())
@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pytest
+
+from instruments.xystage.move_metrics import PHASES, MoveMetrics
+from instruments.xystage.stepper_util import Stepper
+
+
+def filled(time_scale=1.0, capacity=100):
+    metrics = MoveMetrics(capacity, time_scale)
+    for k in range(10):
+        # reset, write, motion, ack, total, distance_mm, expected_s
+        metrics.record(1e-5, 1e-4, 0.05, 1e-3, 0.1, 2.0, 0.05)
+    return metrics
+
+
+def test_summary_phases_and_throughput():
+    summary = filled().summary()
+    assert summary['total']['count'] == 10
+    assert summary['motion']['p50_ms'] == pytest.approx(50)
+    assert summary['throughput'] == pytest.approx({'moves_per_s': 10, 'mm_per_s': 20, 'motion_fraction': 0.5})
+    assert MoveMetrics().summary()['throughput']['moves_per_s'] == 0
+
+
+def test_throughput_of_a_simulated_stage_is_in_stage_time():
+    throughput = filled(time_scale=0.01).summary()['throughput']
+    assert throughput['moves_per_s'] == pytest.approx(0.1)
+    assert throughput['motion_fraction'] == pytest.approx(0.5)
+
+
+def test_only_the_latest_moves_are_kept():
+    metrics = filled(capacity=4)
+    assert len(metrics) == 4
+    metrics.reset()
+    assert len(metrics) == 0 and not len(metrics.column('total'))
+
+
+def test_save_by_extension(tmp_path):
+    metrics = filled()
+    metrics.save(str(tmp_path / 'moves.csv'))
+    rows = np.loadtxt(tmp_path / 'moves.csv', delimiter=',', skiprows=1)
+    assert rows.shape == (10, len(MoveMetrics.COLUMNS))
+    metrics.save(str(tmp_path / 'moves.json'))
+    saved = json.loads((tmp_path / 'moves.json').read_text())
+    assert set(saved['histograms']) == set(PHASES)
+    # Written after a scan, so a bad path must not raise
+    metrics.save(str(tmp_path / 'missing' / 'moves.json'))
+
+
+def test_simulated_moves_are_mostly_motion():
+    stepper = Stepper(simulate=True, time_scale=0.01)
+    stepper.gohome()
+    for _ in stepper.move_through([(20 * k, 150 - 10 * k) for k in range(1, 6)]):
+        pass
+    throughput = stepper.metrics.summary()['throughput']
+    assert 0.3 < throughput['motion_fraction'] <= 1.05
+    assert throughput['mm_per_s'] < stepper._constants['stepper']['max_speed'] * 2
@@ -0,0 +1,25 @@
+import numpy as np
+
+from instruments.xystage.point_overlay import PointIndex
+
+
+def test_queries_match_brute_force():
+    rng = np.random.default_rng(3)
+    points = rng.uniform(0, 300, (500, 2))
+    index = PointIndex(points)
+    for x0, y0 in rng.uniform(-20, 300, (20, 2)):
+        x1, y1 = x0 + 40, y0 + 25
+        expected = np.nonzero((points[:, 0] >= x0) & (points[:, 0] <= x1)
+                              & (points[:, 1] >= y0) & (points[:, 1] <= y1))[0]
+        assert index.query_rect(x0, y0, x1, y1).tolist() == expected.tolist()
+
+    for x, y in rng.uniform(0, 300, (20, 2)):
+        distance = np.hypot(points[:, 0] - x, points[:, 1] - y)
+        expected = int(np.argmin(distance)) if distance.min() <= 10 else None
+        assert index.nearest(x, y, 10) == expected
+
+
+def test_empty_index():
+    index = PointIndex(np.empty((0, 2)))
+    assert len(index.query_rect(0, 0, 10, 10)) == 0
+    assert index.nearest(0, 0, 5) is None
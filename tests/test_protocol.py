@@ -0,0 +1,71 @@
+import struct
+
+import pytest
+
+from instruments.xystage.config import load_constants
+from instruments.xystage.stepper_util import (
+    BATCH_MAX, CMD_MOVE, MAX_FRAME, REPLY_DONE, SYNC, MotionProfile, crc8, decode_frame, encode_batch, encode_frame, encode_move,
+)
+
+
+def test_crc8_check_value():
+    # CRC-8 with polynomial 0x07 of the standard check string
+    assert crc8(b'123456789') == 0xF4
+
+
+def test_frame_round_trip():
+    payload = struct.pack('<ii', 1234, -56)
+    frame = encode_frame(REPLY_DONE, payload)
+    assert decode_frame(frame) == (REPLY_DONE, payload, len(frame))
+
+
+def test_decode_skips_noise_and_waits_for_whole_frame():
+    frame = encode_move(100, -200)
+    data = b'\x00\x13' + frame
+    frame_type, payload, consumed = decode_frame(data)
+    assert frame_type == CMD_MOVE
+    assert struct.unpack('<Bii', payload) == (0, 100, -200)
+    assert consumed == len(data)
+    assert decode_frame(data[:-1]) is None
+    assert decode_frame(b'') is None
+
+
+def test_decode_rejects_corruption():
+    frame = bytearray(encode_move(1, 2))
+    frame[-1] ^= 0xFF
+    with pytest.raises(ValueError, match='checksum'):
+        decode_frame(bytes(frame))
+    with pytest.raises(ValueError, match='length'):
+        decode_frame(bytes([SYNC, 0]))
+
+
+def test_batch_limit():
+    encode_batch([(1, 1)] * 7)
+    with pytest.raises(ValueError):
+        encode_batch([(1, 1)] * 8)
+
+
+def test_flat_profile_matches_fixed_pwm():
+    profile = MotionProfile(500000 // 70, 500000 // 70, 0)
+    assert profile.pulses_time(1000) == pytest.approx(1000 * 2e-6 * 70)
+    assert profile.pulses_time(-1000) == profile.pulses_time(1000)
+    assert profile.pulses_time(0) == 0
+
+
+def test_ramped_profile_is_faster_and_monotonic():
+    flat = MotionProfile(7142, 7142, 0)
+    ramped = MotionProfile(7142, 16000, 80000)
+    steps = [0, 1, 15, 16, 100, 1000, 10000, 100000]
+    times = [ramped.pulses_time(n) for n in steps]
+    assert times == sorted(times)
+    assert ramped.pulses_time(100000) < flat.pulses_time(100000)
+    # Approaching a switch never slows down, so it is no slower than a whole move
+    assert ramped.approach_time(10000, 16000) <= ramped.pulses_time(10000)
+
+
+def test_full_batch_fits_the_receive_buffer():
+    frame = encode_batch([(1, -1)] * BATCH_MAX, interpolate=True, trigger=True)
+    assert frame[1] == MAX_FRAME
+    # The AVR's 64 byte ring buffer holds at most 63 bytes
+    assert len(frame) <= load_constants()['stepper']['rx_buffer'] == 63
+    assert decode_frame(frame)[2] == len(frame)
@@ -0,0 +1,82 @@
+import json
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from instruments.xystage.runner import main, run_scan
+from instruments.xystage.scan_journal import load_journal
+from instruments.xystage.scan_store import read_scan
+from instruments.xystage.stepper_util import Stepper
+
+POINTS = [(k + 1, 10.0 + 15 * k, 20.0 + 10 * (k % 3)) for k in range(12)]
+
+
+@pytest.fixture
+def stepper():
+    stepper = Stepper(simulate=True, time_scale=0.01)
+    stepper.gohome()
+    yield stepper
+    stepper.disconnect()
+
+
+def test_run_scan_visits_every_point(stepper, tmp_path):
+    out = str(tmp_path / 'scan')
+    summary = run_scan(stepper, POINTS, out, progress=False)
+    assert summary['status'] == 'complete' and summary['completed'] == len(POINTS)
+    assert sorted(read_scan(out)['label'].tolist()) == [k for k, _, _ in POINTS]
+    assert load_journal(str(tmp_path / 'scan' / 'journal.jsonl'))['finished']
+
+
+def test_interrupted_scan_keeps_position_and_resumes(stepper, tmp_path):
+    out = str(tmp_path / 'scan')
+    interrupted = []
+
+    def interrupt_mid_move(x, y):
+        # Ctrl+C while the host is waiting for a move's acknowledgement
+        if not interrupted:
+            interrupted.append((x, y))
+            signal.raise_signal(signal.SIGINT)
+
+    stepper.on_progress = interrupt_mid_move
+    summary = run_scan(stepper, POINTS, out, plan=False, progress=False)
+    assert interrupted
+    assert summary['status'] == 'interrupted'
+    assert summary['completed'] < len(POINTS)
+    # Moves already queued on the Arduino were waited for and tracked
+    assert stepper.verify_position()
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
+
+    stepper.on_progress = None
+    summary = run_scan(stepper, None, out, resume=True, progress=False)
+    assert summary['status'] == 'complete' and summary['completed'] == len(POINTS)
+    assert read_scan(out)['label'].tolist() == [k for k, _, _ in POINTS]
+    assert (stepper.current_x, stepper.current_y) == POINTS[-1][1:]
+
+
+def test_resume_without_journal_is_an_error(stepper, tmp_path):
+    with pytest.raises(ValueError):
+        run_scan(stepper, None, str(tmp_path), resume=True)
+
+
+def test_main_runs_a_simulated_plan(tmp_path, capsys):
+    plan = tmp_path / 'plan.csv'
+    plan.write_text('X,Y\n' + ''.join(f'{x},{y}\n' for _, x, y in POINTS[:5]))
+    out = tmp_path / 'out'
+    assert main(['run', str(plan), '--simulate', '--time-scale', '0.01', '--quiet', '--out', str(out)]) == 0
+    assert '"status": "complete"' in capsys.readouterr().out
+    assert len(read_scan(str(out))['label']) == 5
+
+
+def test_command_line_run_logs_next_to_its_results(tmp_path):
+    plan = tmp_path / 'plan.csv'
+    plan.write_text(''.join(f'{x},{y}\n' for _, x, y in POINTS[:3]))
+    out = tmp_path / 'out'
+    result = subprocess.run(
+        [sys.executable, '-m', 'instruments.xystage', 'run', str(plan), '--simulate', '--time-scale', '0.01',
+         '--out', str(out)], capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout)['completed'] == 3
+    assert 'Homing stage' in (out / 'run.log').read_text()
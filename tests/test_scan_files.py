@@ -0,0 +1,72 @@
+import json
+
+import numpy as np
+import pytest
+
+from instruments.xystage.scan_journal import ScanJournal, load_journal
+from instruments.xystage.scan_store import ScanWriter, load_meta, read_scan
+
+
+def test_writer_round_trip(tmp_path):
+    path = str(tmp_path / 'scan')
+    with ScanWriter(path, {'counts': ((4,), 'u4')}, attrs={'trigger': False}, chunk_rows=3) as writer:
+        for k in range(7):
+            writer.append(k + 1, (k, 2 * k), (k, 2 * k), 100.0 + k, counts=[k] * 4)
+    scan = read_scan(path)
+    assert scan['label'].tolist() == list(range(1, 8))
+    assert scan['counts'][-1].tolist() == [6] * 4
+    assert np.isnan(scan['fired_at']).all()
+    meta = load_meta(path)
+    assert meta['closed'] and meta['rows'] == 7 and meta['attrs'] == {'trigger': False}
+
+
+def test_bad_row_is_rejected_without_misaligning_columns(tmp_path):
+    path = str(tmp_path / 'scan')
+    writer = ScanWriter(path, {'counts': ((4,), 'u4')}, chunk_rows=2)
+    writer.append(1, (0, 0), (0, 0), 0.0, counts=[1] * 4)
+    with pytest.raises(ValueError):
+        writer.append(2, (0, 0), (0, 0), 0.0, counts=[1] * 3)
+    writer.append(3, (0, 0), (0, 0), 0.0, counts=[3] * 4)
+    writer.close()
+    scan = read_scan(path)
+    assert scan['label'].tolist() == [1, 3]
+    assert scan['counts'][:, 0].tolist() == [1, 3]
+
+
+def test_resume_drops_later_rows(tmp_path):
+    path = str(tmp_path / 'scan')
+    with ScanWriter(path, chunk_rows=1) as writer:
+        for k in range(5):
+            writer.append(k, (k, k), (k, k), 0.0)
+    with ScanWriter(path, resume_rows=3) as writer:
+        writer.append(10, (10, 10), (10, 10), 0.0)
+    assert read_scan(path)['label'].tolist() == [0, 1, 2, 10]
+
+
+def test_journal_resume(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    points = [(1, 0.0, 0.0), (2, 1.0, 1.0), (3, 2.0, 2.0)]
+    journal = ScanJournal(path, fsync_every=100)
+    journal.start(points, {'store': 'somewhere'})
+    journal.complete()
+    journal.close()
+    # A crash can leave half a line
+    with open(path, 'a') as file:
+        file.write('{"do')
+
+    state = load_journal(path)
+    assert state == {'points': points, 'attrs': {'store': 'somewhere'}, 'completed': 1, 'finished': False}
+
+    journal = ScanJournal(path)
+    journal.resume(state['completed'])
+    journal.complete()
+    journal.complete()
+    journal.finish()
+    state = load_journal(path)
+    assert state['completed'] == 3 and state['finished']
+
+
+def test_missing_journal(tmp_path):
+    assert load_journal(str(tmp_path / 'none.jsonl')) is None
+    (tmp_path / 'bad.jsonl').write_text(json.dumps({'done': 1}) + '\n')
+    assert load_journal(str(tmp_path / 'bad.jsonl')) is None
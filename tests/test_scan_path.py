@@ -0,0 +1,24 @@
+import numpy as np
+
+from instruments.xystage.scan_path import path_cost, plan_scan_path, two_opt
+
+
+def test_plan_is_a_permutation_and_never_worse():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 100, (60, 2))
+    order, original_time, planned_time = plan_scan_path(points, (0, 0))
+    assert sorted(order.tolist()) == list(range(60))
+    assert planned_time <= original_time
+    assert planned_time == path_cost(points, order, (0, 0))
+
+
+def test_two_opt_untangles_a_line():
+    points = np.column_stack([np.arange(10.0), np.zeros(10)])
+    order = two_opt(points, [0, 5, 1, 6, 2, 7, 3, 8, 4, 9])
+    assert order.tolist() == list(range(10))
+
+
+def test_interpolated_cost_uses_longer_axis():
+    points = np.array([[0.0, 0.0], [3.0, 4.0]])
+    assert path_cost(points, [0, 1]) == 7.0
+    assert path_cost(points, [0, 1], interpolate=True) == 4.0
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from instruments.xystage import scan_points
+from instruments.xystage.point_model import ScanPointModel
+
+LIMITS = {'x_min': 0, 'x_max': 300, 'y_min': 0, 'y_max': 300}
+
+
+def test_grid_is_serpentine_and_includes_the_stop():
+    points = scan_points.grid_points(0, 2, 0, 1, 1)
+    assert points.tolist() == [[0, 0], [1, 0], [2, 0], [2, 1], [1, 1], [0, 1]]
+    assert scan_points.grid_points(2, 0, 0, 0, 1, serpentine=False)[:, 0].tolist() == [2, 1, 0]
+
+
+@pytest.mark.parametrize('pitch', [0, -1])
+def test_grid_rejects_a_pitch_that_is_not_positive(pitch):
+    with pytest.raises(ValueError):
+        scan_points.grid_points(0, 10, 0, 10, pitch)
+
+
+def test_tiny_pitch_over_the_stage_is_refused_before_allocating():
+    with pytest.raises(ValueError, match='larger pitch'):
+        scan_points.grid_points(0, 300, 0, 300, 0.001)
+    with pytest.raises(ValueError):
+        scan_points.polygon_points([(0, 0), (300, 0), (0, 300)], 0.001)
+
+
+def test_polygon_fill_keeps_only_inside_points():
+    points = scan_points.polygon_points([(0, 0), (4, 0), (0, 4)], 1, serpentine=False)
+    assert len(points) == 10
+    assert (points.sum(axis=1) < 4).all()
+    with pytest.raises(ValueError):
+        scan_points.polygon_points([(0, 0), (1, 1)], 1)
+
+
+def test_bounds_and_csv_round_trip(tmp_path):
+    points = np.array([[1.5, 2.25], [299, 300], [-1, 5]])
+    assert scan_points.in_bounds(points, LIMITS).tolist() == [True, True, False]
+    path = str(tmp_path / 'points.csv')
+    scan_points.save_csv(path, points)
+    assert np.allclose(scan_points.load_csv(path), points)
+
+
+def test_model_appends_edits_and_removes_rows():
+    model = ScanPointModel(LIMITS)
+    model.append([(1, 2), (3, 4), (5, 6), (7, 8)])
+    assert model.rowCount() == 4 and model.headerData(3, 2) == '4'
+    assert model.data(model.index(1, 0)) == '3.000'
+
+    assert model.setData(model.index(0, 1), '10')
+    assert not model.setData(model.index(0, 1), '301')
+    assert not model.setData(model.index(0, 1), 'abc')
+    assert model.points[0].tolist() == [1, 10]
+
+    model.remove_rows([3, 1])
+    assert model.points.tolist() == [[1, 10], [5, 6]]
+    model.clear()
+    assert len(model) == 0
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from instruments.xystage.async_stepper import AsyncStepper
+from instruments.xystage.scan_session import ScanSession
+from instruments.xystage.scan_store import read_scan
+from instruments.xystage.stage_worker import METRICS_FILE, StageWorker
+from instruments.xystage.stepper_util import Stepper
+
+POINTS = [(k + 1, 5.0 * k, 10.0) for k in range(8)]
+
+
+def record(session, count):
+    for i, (_, x, y) in enumerate(session.points[:count]):
+        session.record(i, x, y)
+
+
+def test_resume_continues_after_the_stored_points(tmp_path):
+    store, journal = str(tmp_path / 'scan'), str(tmp_path / 'journal.jsonl')
+    session = ScanSession.start(POINTS, store, journal)
+    record(session, 3)
+    session.close()
+
+    session = ScanSession.resume(journal)
+    assert (session.first, session.total, session.completed) == (3, 8, 3)
+    assert session.points == POINTS[3:]
+    record(session, 5)
+    session.finish()
+    session.close()
+    assert read_scan(store)['label'].tolist() == [k for k, _, _ in POINTS]
+
+
+def test_points_journaled_but_not_stored_are_visited_again(tmp_path):
+    store, journal = str(tmp_path / 'scan'), str(tmp_path / 'journal.jsonl')
+    session = ScanSession.start(POINTS, store, journal)
+    record(session, 3)
+    # Journaled as done, but the crash came before the results were flushed
+    session.journal.complete()
+    session.journal.close()
+    session.writer.close()
+
+    session = ScanSession.resume(journal)
+    assert session.first == 3
+    session.close()
+
+
+def test_lost_store_goes_to_a_new_one_only_if_given(tmp_path):
+    store, journal = str(tmp_path / 'scan'), str(tmp_path / 'journal.jsonl')
+    session = ScanSession.start(POINTS, store, journal)
+    record(session, 2)
+    session.close()
+    os.rename(store, str(tmp_path / 'moved'))
+
+    with pytest.raises((OSError, ValueError)):
+        ScanSession.resume(journal)
+    session = ScanSession.resume(journal, str(tmp_path / 'new'))
+    assert session.first == 2 and session.path == str(tmp_path / 'new')
+    session.close()
+
+
+def test_resume_without_journal_is_an_error(tmp_path):
+    with pytest.raises(ValueError):
+        ScanSession.resume(str(tmp_path / 'journal.jsonl'))
+
+
+def test_stage_worker_records_the_scan(tmp_path):
+    stepper = Stepper(simulate=True, time_scale=0.01)
+    stepper.gohome()
+    stage = AsyncStepper(stepper)
+    session = ScanSession.start(POINTS, str(tmp_path / 'scan'), str(tmp_path / 'journal.jsonl'))
+    worker = StageWorker(stage, session, note='planned path 1.0 s')
+    messages = []
+    worker.status.connect(messages.append)
+    # Run on this thread; the signals are delivered directly
+    worker.run()
+    assert messages[-1] == 'Scanning complete.'
+    # The planned path's savings stay in view while the points are visited
+    assert messages[0].startswith('Moving to Point 1') and messages[0].endswith('(planned path 1.0 s)')
+    assert read_scan(session.path)['label'].tolist() == [k for k, _, _ in POINTS]
+    assert os.path.exists(os.path.join(session.path, METRICS_FILE))
+    assert (stepper.current_x, stepper.current_y) == POINTS[-1][1:]
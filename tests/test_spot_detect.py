@@ -0,0 +1,59 @@
+import numpy as np
+
+from instruments.xystage.spot_detect import detect_spots, label_components
+
+
+def _flood_fill(mask):
+    """ 8-connected labels by depth-first search, numbered in raster order """
+    labels = np.zeros(mask.shape, dtype=int)
+    count = 0
+    for start in zip(*np.nonzero(mask)):
+        if labels[start]:
+            continue
+        count += 1
+        labels[start] = count
+        stack = [start]
+        while stack:
+            y, x = stack.pop()
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    yy, xx = y + dy, x + dx
+                    if 0 <= yy < mask.shape[0] and 0 <= xx < mask.shape[1] and mask[yy, xx] and not labels[yy, xx]:
+                        labels[yy, xx] = count
+                        stack.append((yy, xx))
+    return labels, count
+
+
+def test_labels_match_flood_fill():
+    rng = np.random.default_rng(1)
+    for density in (0.1, 0.4, 0.6):
+        mask = rng.random((40, 50)) < density
+        labels, count = label_components(mask)
+        expected, expected_count = _flood_fill(mask)
+        assert count == expected_count
+        assert (labels == expected).all()
+
+
+def test_spiral_is_one_component():
+    mask = np.zeros((41, 41), dtype=bool)
+    mask[::4] = True
+    mask[0:4, -1] = mask[4:8, 0] = True
+    for row in range(8, 40, 8):
+        mask[row:row + 4, -1] = mask[row + 4:row + 8, 0] = True
+    assert label_components(mask)[1] == 1
+
+
+def test_centroids_of_gaussian_spots():
+    rng = np.random.default_rng(2)
+    image = rng.normal(20, 2, (200, 300))
+    centers = np.array([[40.3, 50.7], [150.5, 100.2], [250.8, 160.4]])
+    rows, columns = np.mgrid[:200, :300]
+    for x, y in centers:
+        image += 150 * np.exp(-((columns - x) ** 2 + (rows - y) ** 2) / (2 * 2.0 ** 2))
+    found = detect_spots(np.clip(image, 0, 255).astype(np.uint8))
+    assert len(found) == 3
+    assert np.abs(found - centers).max() < 0.2
+
+
+def test_blank_image_has_no_spots():
+    assert detect_spots(np.full((50, 50), 10, dtype=np.uint8)).shape == (0, 2)
@@ -0,0 +1,117 @@
+import logging
+
+import pytest
+
+from instruments.xystage.stepper_util import CMD_STATUS, StallError, Stepper, encode_batch, encode_frame
+
+
+@pytest.fixture
+def stepper():
+    stepper = Stepper(simulate=True, time_scale=0.01)
+    stepper.gohome()
+    yield stepper
+    stepper.disconnect()
+
+
+def test_home_and_move(stepper):
+    assert (stepper.current_x, stepper.current_y) == (0, 0)
+    assert stepper.home_time is not None
+    stepper.moveto(12.5, 40)
+    assert (stepper.current_x, stepper.current_y) == (12.5, 40)
+    assert stepper.verify_position()
+    assert len(stepper.metrics) == 1
+
+
+def test_move_through_visits_every_point(stepper):
+    points = [(10 + i, 20 + 2 * i) for i in range(20)]
+    visited = list(stepper.move_through(points))
+    assert [i for i, _, _ in visited] == list(range(20))
+    assert visited[-1][1:] == points[-1]
+    assert stepper.verify_position()
+
+
+def test_triggered_moves_report_increasing_fire_times(stepper):
+    fired = [f for _, _, _, f in stepper.move_through([(5, 5), (6, 5), (7, 5)], trigger=True)]
+    assert fired == sorted(fired)
+    assert fired[1] - fired[0] >= stepper.trigger_time() * stepper.arduino.time_scale * 0.5
+
+
+def test_progress_reports_during_long_move(stepper):
+    reports = []
+    stepper.on_progress = lambda x, y: reports.append((x, y))
+    stepper.moveto(250, 200)
+    assert reports
+    assert all(0 <= x <= 250 and 0 <= y <= 200 for x, y in reports)
+
+
+def test_position_mismatch_raises_and_forgets_position(stepper):
+    stepper.arduino.pos_x += 3
+    with pytest.raises(RuntimeError):
+        stepper.moveto(10, 10)
+    assert stepper.current_x is None
+
+
+def test_silent_stage_is_reported_as_stalled(stepper):
+    stepper.arduino._reply = lambda start, steps: None
+    with pytest.raises(StallError):
+        stepper.moveto(100, 100)
+
+
+def test_failed_move_is_not_saved_as_resumable(stepper, tmp_path):
+    stepper._position_path = str(tmp_path / 'stage_position.json')
+    stepper.moveto(10, 10)
+    assert stepper.saved_position() == (10, 10)
+    stepper.arduino._reply = lambda start, steps: None
+    with pytest.raises(StallError):
+        stepper.moveto(100, 100)
+    stepper.disconnect()
+    assert stepper.saved_position() is None
+
+
+def test_moves_left_by_a_failed_stream_are_waited_for(stepper, monkeypatch):
+    points = [(10 + 5 * i, 20) for i in range(6)]
+    wait_for_done = stepper.wait_for_done
+    waits = []
+
+    def lose_second_ack(timeout, stall=None):
+        waits.append(timeout)
+        if len(waits) == 2:
+            raise TimeoutError('lost')
+        return wait_for_done(timeout, stall)
+
+    monkeypatch.setattr(stepper, 'wait_for_done', lose_second_ack)
+    with pytest.raises(TimeoutError):
+        list(stepper.move_through(points))
+    # The queued moves' DONE frames are not taken for the status reply
+    assert stepper.verify_position()
+    assert (stepper.current_x, stepper.current_y) == points[-1]
+
+
+def test_torn_position_record_is_not_resumed(stepper, tmp_path):
+    path = tmp_path / 'stage_position.json'
+    stepper._position_path = str(path)
+    stepper.moveto(10, 10)
+    stepper.disconnect()
+    record = path.read_bytes()
+    path.write_bytes(record[:len(record) // 2])
+    assert stepper.saved_position() is None
+
+
+def test_simulator_rejects_corrupted_and_unknown_frames(stepper):
+    frame = bytearray(encode_frame(CMD_STATUS))
+    frame[-1] ^= 0xFF
+    stepper.arduino.write(bytes(frame))
+    with pytest.raises(RuntimeError, match='bad checksum'):
+        stepper.wait_for_done(stepper.ack_timeout)
+    stepper.arduino.write(encode_frame(0x7F))
+    with pytest.raises(RuntimeError, match='unknown command'):
+        stepper.wait_for_done(stepper.ack_timeout)
+    # A rejected frame leaves the stage where it was
+    assert stepper.verify_position()
+
+
+def test_simulator_warns_when_the_receive_buffer_overflows(stepper, caplog):
+    batch = encode_batch([(0, 0)] * 7)
+    with caplog.at_level(logging.WARNING):
+        stepper.arduino.write(batch + batch)
+    assert 'overflowed' in caplog.text